@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+apify_requeue.py — Lectura del requeue.json antiguo (solo para migrarlo).
+
+Antes de extraction_state, las URLs que un run de Apify no cubría quedaban en
+data/apify_actor/requeue.json (APIFY_REQUEUE_PATH) con sus intentos y su
+próximo intento. Ese estado vive ahora en extraction_state (retry_after /
+parked, con el backoff de APIFY_RETRY_*) y nada vuelve a escribir el fichero:
+`extraction_state.py --migrate` lo importa una vez. Para volver a poner en
+cola aparcadas: `extraction_state.py --release-parked`.
+
+Uso:
+  python apify_requeue.py                 # lo que queda por importar del fichero
+"""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+
+from config import PROJECT_ROOT, env
+
+REQUEUE_PATH = Path(env("APIFY_REQUEUE_PATH", PROJECT_ROOT / "data" / "apify_actor" / "requeue.json"))
+
+
+class RequeueLedger:
+    """requeue.json en solo lectura: {url canónica: {"attempts", "next_at", "last_status", "last_run"}}."""
+
+    def __init__(self, path: Path = REQUEUE_PATH):
+        self.path = Path(path)
+        self._state: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as fh:
+                self._state = json.load(fh)
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def entries(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        return iter(self._state.items())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="requeue.json antiguo (se importa con extraction_state.py --migrate).")
+    ap.parse_args()
+    ledger = RequeueLedger()
+    if not ledger.path.exists():
+        print(f"🩹 Sin requeue.json antiguo en {ledger.path}: nada que migrar.")
+        return
+    print(f"🩹 {len(ledger)} URLs en {ledger.path}; se importan a extraction_state con "
+          f"`python extraction_state.py --migrate` (retry_after / parked).")
+
+
+if __name__ == "__main__":
+    main()
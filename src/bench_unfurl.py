@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+bench_unfurl.py — Benchmark de post_batch_and_get_unfurls contra fake_slack.py.
+
+Ejecuta el `post_batch_and_get_unfurls` real de los dos scripts de unfurl
+(slack_unfurl_to_raw_headline.py y slack+ollama_enrichment_profiles.py, este
+con el LLM desactivado) sobre URLs sintéticas y mide:
+- URLs/hora y % de URLs con unfurl
+- espera desperdiciada: tiempo entre que el unfurl estaba listo y lo leímos
+- lecturas tempranas (se leyó antes del unfurl → URL perdida)
+- 429 recibidos por método
+
+Uso:
+  python bench_unfurl.py --urls 60 --batch-size 5 --wait 4 --unfurl-delay 3 --jitter 1.5
+  python bench_unfurl.py --script enrichment --channels 3 --wait 2
+"""
+
+import argparse
+import importlib.util
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+from slack_sdk import WebClient
+
+import unfurl_store
+from fake_slack import FakeSlack, serve
+from unfurl_engine import UnfurlShard, run_sharded
+
+HERE = Path(__file__).resolve().parent
+SCRIPTS = {
+    "headline": HERE / "slack_unfurl_to_raw_headline.py",
+    "enrichment": HERE / "slack+ollama_enrichment_profiles.py",
+}
+
+
+def load_script(name: str):
+    """Importa el script por ruta (el nombre con '+' no es importable con import)."""
+    path = SCRIPTS[name]
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def bench(name: str, urls: List[str], args, fake_kwargs) -> dict:
+    fake = FakeSlack(**fake_kwargs)
+    server = serve(fake)
+    host, port = server.server_address[:2]
+    base_url = f"http://{host}:{port}/api/"
+
+    mod = load_script(name)
+    unfurl_store.UNFURL_STORE = False      # los unfurls sintéticos no van al almacén
+    mod.UNFURL_WAIT_SECONDS = args.wait
+    mod.DELETE_MESSAGES = True
+    if hasattr(mod, "OLLAMA_ENABLED"):
+        mod.OLLAMA_ENABLED = False
+
+    token = "xoxb-bench"
+    shards = [UnfurlShard(token, f"CBENCH{i}", args.rate_scale, client=WebClient(token=token, base_url=base_url))
+              for i in range(args.channels)]
+    batches = [urls[i:i + args.batch_size] for i in range(0, len(urls), args.batch_size)]
+    filled = 0
+
+    def on_result(batch, res):
+        nonlocal filled
+        if isinstance(res, Exception):
+            return
+        for v in res.values():
+            if isinstance(v, dict):
+                filled += bool(v.get("raw_text"))
+            else:
+                filled += bool(v)
+
+    t0 = time.perf_counter()
+    run_sharded(batches, shards, mod.post_batch_and_get_unfurls, on_result, sleep_between=args.sleep_between)
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+
+    s = fake.summary()
+    return {
+        "script": name,
+        "elapsed_s": round(elapsed, 1),
+        "urls": len(urls),
+        "filled": filled,
+        "urls_per_hour": round(len(urls) / elapsed * 3600) if elapsed else 0,
+        "wasted_wait_s": s["wasted_wait_s"],
+        "wasted_per_batch_s": round(s["wasted_wait_s"] / max(1, len(batches)), 2),
+        "early_reads": s["early_reads"],
+        "ratelimited": s["ratelimited"],
+        "calls": s["calls"],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de los pipelines de unfurl contra un Slack local.")
+    ap.add_argument("--script", choices=["headline", "enrichment", "both"], default="both")
+    ap.add_argument("--urls", type=int, default=40)
+    ap.add_argument("--batch-size", type=int, default=5)
+    ap.add_argument("--channels", type=int, default=1)
+    ap.add_argument("--wait", type=float, default=4.0, help="UNFURL_WAIT_SECONDS del script")
+    ap.add_argument("--sleep-between", type=float, default=0.0)
+    ap.add_argument("--rate-scale", type=float, default=1.0, help="Escala de los buckets del cliente")
+    ap.add_argument("--unfurl-delay", type=float, default=3.0)
+    ap.add_argument("--jitter", type=float, default=1.0)
+    ap.add_argument("--miss-rate", type=float, default=0.05)
+    ap.add_argument("--limit-scale", type=float, default=1.0, help="Escala de los límites del servidor")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    urls = [f"https://www.linkedin.com/in/bench-{i:05d}" for i in range(args.urls)]
+    fake_kwargs = dict(unfurl_delay=args.unfurl_delay, jitter=args.jitter, miss_rate=args.miss_rate,
+                       limit_scale=args.limit_scale, seed=args.seed)
+    names = ["headline", "enrichment"] if args.script == "both" else [args.script]
+    results = [bench(n, urls, args, fake_kwargs) for n in names]
+
+    print("\n📈 Benchmark de unfurls")
+    for r in results:
+        print(f"  [{r['script']}] {r['urls']} URLs en {r['elapsed_s']} s → {r['urls_per_hour']:,} URLs/hora "
+              f"(con unfurl: {r['filled']})")
+        print(f"      espera desperdiciada: {r['wasted_wait_s']} s ({r['wasted_per_batch_s']} s/lote) · "
+              f"lecturas tempranas: {r['early_reads']}")
+        print(f"      429: {r['ratelimited'] or 0} · llamadas: {r['calls']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+bootstrap_schema.py — Crea el esquema base en una BD vacía (Postgres local).
+
+Reproduce las tablas que json_2_sql.py da por existentes (las columnas de
+`profiles` son las del volcado en backups/), para poder levantar un entorno
+de pruebas sin tocar la BD compartida. Idempotente: solo CREATE ... IF NOT EXISTS.
+Es la migración 1 de migrate.py; `main` aplica además las pendientes.
+
+Uso:
+  PG_HOST=localhost PG_DB=latam_test ... python bootstrap_schema.py
+"""
+
+import psycopg2
+
+from config import db_params, db_schema
+from json_2_sql import ensure_coverage_table
+
+BASE_DDL = """
+CREATE SCHEMA IF NOT EXISTS {s};
+
+CREATE TABLE IF NOT EXISTS {s}.locations (
+    location_id   serial PRIMARY KEY,
+    location_name text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS {s}.companies (
+    company_id   serial PRIMARY KEY,
+    company_name text NOT NULL,
+    company_link text,
+    location_id  integer REFERENCES {s}.locations(location_id)
+);
+
+CREATE TABLE IF NOT EXISTS {s}.educational_institutions (
+    school_id   serial PRIMARY KEY,
+    school_name text NOT NULL,
+    school_link text,
+    location_id integer REFERENCES {s}.locations(location_id)
+);
+
+CREATE TABLE IF NOT EXISTS {s}.languages (
+    lang_id  serial PRIMARY KEY,
+    language text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS {s}.skills (
+    skill_id   serial PRIMARY KEY,
+    skill_name text NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS {s}.profiles (
+    profile_id        serial PRIMARY KEY,
+    public_identifier text,
+    linkedin_url      text UNIQUE,
+    first_name        text,
+    last_name         text,
+    headline          text,
+    about             text,
+    connections       integer,
+    followers         integer,
+    location_id       integer REFERENCES {s}.locations(location_id),
+    pais_origen       text,
+    sexo              text,
+    created_at        timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS {s}.experiences (
+    experience_id serial PRIMARY KEY,
+    profile_id    integer NOT NULL REFERENCES {s}.profiles(profile_id) ON DELETE CASCADE,
+    company_id    integer REFERENCES {s}.companies(company_id),
+    title         text,
+    description   text,
+    start_date    date,
+    end_date      date,
+    period        text,
+    location_id   integer REFERENCES {s}.locations(location_id)
+);
+
+CREATE TABLE IF NOT EXISTS {s}.educations (
+    education_id serial PRIMARY KEY,
+    profile_id   integer NOT NULL REFERENCES {s}.profiles(profile_id) ON DELETE CASCADE,
+    school_id    integer REFERENCES {s}.educational_institutions(school_id),
+    title        text,
+    description  text,
+    start_date   date,
+    end_date     date,
+    period       text,
+    location_id  integer REFERENCES {s}.locations(location_id)
+);
+
+CREATE TABLE IF NOT EXISTS {s}.profile_languages (
+    profile_id integer NOT NULL REFERENCES {s}.profiles(profile_id) ON DELETE CASCADE,
+    lang_id    integer NOT NULL REFERENCES {s}.languages(lang_id),
+    level      text,
+    PRIMARY KEY (profile_id, lang_id)
+);
+
+CREATE TABLE IF NOT EXISTS {s}.profile_skills (
+    profile_id integer NOT NULL REFERENCES {s}.profiles(profile_id) ON DELETE CASCADE,
+    skill_id   integer NOT NULL REFERENCES {s}.skills(skill_id),
+    PRIMARY KEY (profile_id, skill_id)
+);
+"""
+
+
+def bootstrap(cur, schema: str = None) -> None:
+    cur.execute(BASE_DDL.format(s=schema or db_schema()))
+    ensure_coverage_table(cur)
+
+
+def main():
+    from migrate import apply_pending
+
+    db = db_params()
+    conn = psycopg2.connect(**db)
+    try:
+        with conn.cursor() as cur:
+            bootstrap(cur)
+        conn.commit()
+        apply_pending(conn)
+    finally:
+        conn.close()
+    print(f"✅ Esquema base listo en {db['host']}/{db['dbname']} (schema={db_schema()})")
+
+
+if __name__ == "__main__":
+    main()
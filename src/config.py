@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+config.py — Configuración perezosa y validada.
+
+Nada se lee al importar: `.env` se carga la primera vez que alguien pide un
+valor (`load_env`), y `db_params()` valida las variables de Postgres con un
+error claro en lugar de un `int(None)` en mitad de un import.
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+_env_loaded = False
+
+
+class ConfigError(RuntimeError):
+    pass
+
+
+def load_env() -> None:
+    """Carga .env (raíz del proyecto y, si no existe, el del cwd) una sola vez."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    env_path = PROJECT_ROOT / ".env"
+    if env_path.exists():
+        load_dotenv(env_path)
+    else:
+        load_dotenv()
+
+
+def env(name: str, default: Any = None) -> Any:
+    load_env()
+    return os.getenv(name, default)
+
+
+@lru_cache(maxsize=None)
+def db_params() -> Dict[str, Any]:
+    """Parámetros de psycopg2.connect desde PG_*; falla con la lista de lo que falta."""
+    load_env()
+    missing = [k for k in ("PG_HOST", "PG_DB", "PG_USER") if not os.getenv(k)]
+    if missing:
+        raise ConfigError(f"Faltan variables de entorno de Postgres: {', '.join(missing)} (revisa .env)")
+    port = os.getenv("PG_PORT") or "5432"
+    try:
+        port = int(port)
+    except ValueError:
+        raise ConfigError(f"PG_PORT no es un número: {port!r}") from None
+    params = dict(
+        host=os.getenv("PG_HOST"),
+        port=port,
+        dbname=os.getenv("PG_DB"),
+        user=os.getenv("PG_USER"),
+        password=os.getenv("PG_PASSWORD"),
+        sslmode=os.getenv("PG_SSLMODE"),
+    )
+    return {k: v for k, v in params.items() if v is not None}
+
+
+@lru_cache(maxsize=None)
+def db_schema() -> str:
+    load_env()
+    return os.getenv("PG_SCHEMA") or "public"
+
+
+def describe() -> Dict[str, Any]:
+    """Resumen para `latam config` (sin contraseñas)."""
+    out: Dict[str, Any] = {"env_file": str(PROJECT_ROOT / ".env"), "env_file_exists": (PROJECT_ROOT / ".env").exists()}
+    try:
+        db = dict(db_params())
+        if db.get("password"):
+            db["password"] = "***"
+        out["db"] = db
+        out["schema"] = db_schema()
+    except ConfigError as e:
+        out["db_error"] = str(e)
+    out["apify_token"] = "definido" if env("APIFY_TOKEN") else "falta"
+    out["slack_token"] = "definido" if (env("SLACK_BOT_TOKEN") or env("SLACK_ACCESS_TOKEN") or env("SLACK_TOKEN")) else "falta"
+    return out
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+coverage_report.py
+------------------
+Informe agregado de cobertura (experiencias, estudios, idiomas, skills) sobre
+todos los perfiles, leyendo la tabla resumen `profile_coverage` que mantiene
+la ingesta (json_2_sql.update_from_items). Es un único scan de una tabla
+estrecha, sin COUNT(*) correlados por perfil.
+
+Uso:
+  python coverage_report.py                 # distribución para todos los perfiles
+  python coverage_report.py --only-scraped  # solo perfiles ya extraídos
+  python coverage_report.py --backfill      # (una vez) rellena la tabla desde los hijos existentes
+"""
+
+import argparse
+from typing import List, Tuple
+
+import psycopg2
+
+from config import db_params, db_schema
+from json_2_sql import ensure_coverage_table
+
+CATEGORIES = ("n_experiences", "n_educations", "n_languages", "n_skills")
+
+# Tramos del histograma: (etiqueta, mínimo, máximo inclusive; None = sin tope)
+BUCKETS: List[Tuple[str, int, int]] = [
+    ("0", 0, 0), ("1-2", 1, 2), ("3-5", 3, 5), ("6-10", 6, 10), ("11+", 11, None),
+]
+
+
+def backfill(cur) -> int:
+    """Recalcula los contadores de todos los perfiles con agregados set-based."""
+    cur.execute(f"""
+        INSERT INTO {db_schema()}.profile_coverage
+            (profile_id, n_experiences, n_educations, n_languages, n_skills)
+        SELECT p.profile_id,
+               COALESCE(e.n, 0), COALESCE(ed.n, 0), COALESCE(pl.n, 0), COALESCE(ps.n, 0)
+        FROM {db_schema()}.profiles p
+        LEFT JOIN (SELECT profile_id, COUNT(*) AS n FROM {db_schema()}.experiences       GROUP BY 1) e  USING (profile_id)
+        LEFT JOIN (SELECT profile_id, COUNT(*) AS n FROM {db_schema()}.educations        GROUP BY 1) ed USING (profile_id)
+        LEFT JOIN (SELECT profile_id, COUNT(*) AS n FROM {db_schema()}.profile_languages GROUP BY 1) pl USING (profile_id)
+        LEFT JOIN (SELECT profile_id, COUNT(*) AS n FROM {db_schema()}.profile_skills    GROUP BY 1) ps USING (profile_id)
+        ON CONFLICT (profile_id) DO UPDATE
+          SET n_experiences = EXCLUDED.n_experiences,
+              n_educations  = EXCLUDED.n_educations,
+              n_languages   = EXCLUDED.n_languages,
+              n_skills      = EXCLUDED.n_skills,
+              updated_at    = now()
+    """)
+    return cur.rowcount
+
+
+def distribution(cur, only_scraped: bool = False):
+    """Devuelve (total, {categoria: (avg, p50, p90, [n por tramo])})."""
+    where = "WHERE p.public_identifier IS NOT NULL AND p.public_identifier <> 'INACCESIBLE'" if only_scraped else ""
+    cols = []
+    for c in CATEGORIES:
+        v = f"COALESCE(pc.{c}, 0)"
+        cols.append(f"AVG({v})::float")
+        cols.append(f"percentile_disc(0.5) WITHIN GROUP (ORDER BY {v})")
+        cols.append(f"percentile_disc(0.9) WITHIN GROUP (ORDER BY {v})")
+        for _, lo, hi in BUCKETS:
+            cond = f"{v} >= {lo}" if hi is None else f"{v} BETWEEN {lo} AND {hi}"
+            cols.append(f"COUNT(*) FILTER (WHERE {cond})")
+    cur.execute(f"""
+        SELECT COUNT(*), {", ".join(cols)}
+        FROM {db_schema()}.profiles p
+        LEFT JOIN {db_schema()}.profile_coverage pc USING (profile_id)
+        {where}
+    """)
+    row = cur.fetchone()
+    total, rest = row[0], list(row[1:])
+    step = 3 + len(BUCKETS)
+    out = {}
+    for i, c in enumerate(CATEGORIES):
+        chunk = rest[i * step:(i + 1) * step]
+        out[c] = (chunk[0] or 0.0, chunk[1] or 0, chunk[2] or 0, chunk[3:])
+    return total, out
+
+
+def print_report(total: int, dist) -> None:
+    print(f"\n📊 COBERTURA — {total} perfiles")
+    header = f"{'categoría':<15}{'media':>8}{'p50':>6}{'p90':>6}  " + "".join(f"{b[0]:>9}" for b in BUCKETS)
+    print(header)
+    print("-" * len(header))
+    for c, (avg, p50, p90, counts) in dist.items():
+        pct = "".join(f"{(n / total if total else 0):>9.1%}" for n in counts)
+        print(f"{c:<15}{avg:>8.2f}{p50:>6}{p90:>6}  {pct}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Distribución de cobertura de perfiles.")
+    ap.add_argument("--backfill", action="store_true", help="Rellena profile_coverage desde las tablas hijas")
+    ap.add_argument("--only-scraped", action="store_true", help="Solo perfiles con public_identifier")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor() as cur:
+            ensure_coverage_table(cur)
+            if args.backfill:
+                n = backfill(cur)
+                conn.commit()
+                print(f"🧮 Backfill completado: {n} perfiles.")
+            total, dist = distribution(cur, only_scraped=args.only_scraped)
+        conn.commit()
+    finally:
+        conn.close()
+    print_report(total, dist)
+
+
+if __name__ == "__main__":
+    main()
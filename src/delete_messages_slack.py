@@ -1,67 +1,158 @@
 import os
-import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional
 
 from dotenv import load_dotenv
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
+from slack_rate import bucket_for, call_slack
+
 # carga el .env desde la raíz del proyecto
 load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / ".env")
 
 SLACK_BOT_TOKEN = os.getenv("SLACK_ACCESS_TOKEN") or os.getenv("SLACK_TOKEN")
 SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
 
-if not SLACK_BOT_TOKEN or not SLACK_CHANNEL_ID:
-    raise RuntimeError("Falta SLACK_BOT_TOKEN o SLACK_CHANNEL_ID en el .env")
-
-client = WebClient(token=SLACK_BOT_TOKEN)
-
+# hilos de borrado; el ritmo real lo marca el bucket de chat.delete (tier 3)
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", "4"))
+# fracción del límite del tier que nos permitimos usar
+CLEAN_RATE_SCALE = float(os.getenv("CLEAN_RATE_SCALE", "0.9"))
+STATE_DIR = Path(__file__).resolve().parents[1] / "logs_unfurl"
+
+
+def parse_ts(value: Optional[str]) -> Optional[str]:
+    """Acepta epoch ('1730000000') o fecha ISO ('2025-11-06' / '2025-11-06T18:00')."""
+    if not value:
+        return None
+    try:
+        return str(float(value))
+    except ValueError:
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return str(dt.timestamp())
+
+
+def load_cursor(path: Path) -> Optional[str]:
+    if path.exists():
+        cur = path.read_text(encoding="utf-8").strip()
+        return cur or None
+    return None
+
+
+def save_cursor(path: Path, cursor: Optional[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if cursor:
+        path.write_text(cursor, encoding="utf-8")
+    elif path.exists():
+        path.unlink()
+
+
+def delete_messages_from_channel(channel_id: str, client: WebClient, bot_id: Optional[str] = None,
+                                 oldest: Optional[str] = None, latest: Optional[str] = None,
+                                 workers: int = CLEAN_WORKERS, state_path: Optional[Path] = None,
+                                 dry_run: bool = False) -> int:
+    """
+    Borra los mensajes del canal (solo los de `bot_id` si se indica) dentro de
+    la ventana [oldest, latest]. El cursor de conversations.history se guarda
+    en `state_path` al terminar cada página, así que se puede reanudar.
+    """
+    history_bucket = bucket_for("conversations.history", CLEAN_RATE_SCALE)
+    delete_bucket = bucket_for("chat.delete", CLEAN_RATE_SCALE)
+
+    cursor = load_cursor(state_path) if state_path else None
+    if cursor:
+        print(f"📂 Reanudando desde cursor guardado ({state_path.name})")
 
-def delete_messages_from_channel(channel_id: str):
-    cursor = None
     total_deleted = 0
+    total_skipped = 0
 
-    while True:
+    def _delete(ts: str) -> bool:
         try:
-            resp = client.conversations_history(
-                channel=channel_id,
-                limit=200,
-                cursor=cursor
-            )
+            call_slack(delete_bucket, client.chat_delete, channel=channel_id, ts=ts)
+            print(f"🗑️  Borrado mensaje ts={ts}")
+            return True
         except SlackApiError as e:
-            print(f"❌ Error al leer el canal: {e.response.get('error')}")
-            break
-
-        messages = resp.get("messages", [])
-        if not messages:
-            break
-
-        for msg in messages:
-            ts = msg.get("ts")
-            # opcional: borrar solo los del bot
-            # if msg.get("bot_id") is None:
-            #     continue
-
+            # puede ser not_in_channel, cant_delete_message, etc.
+            print(f"⚠️ No se pudo borrar ts={ts}: {e.response.get('error')}")
+        except Exception as e:
+            print(f"⚠️ Error de red borrando ts={ts}: {e}")
+        return False
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while True:
+            params = dict(channel=channel_id, limit=200, cursor=cursor)
+            if oldest:
+                params["oldest"] = oldest
+            if latest:
+                params["latest"] = latest
             try:
-                client.chat_delete(channel=channel_id, ts=ts)
-                total_deleted += 1
-                print(f"🗑️  Borrado mensaje ts={ts}")
+                resp = call_slack(history_bucket, client.conversations_history, **params)
             except SlackApiError as e:
-                # puede ser not_in_channel, cant_delete_message, etc.
-                print(f"⚠️ No se pudo borrar ts={ts}: {e.response.get('error')}")
-            except Exception as e:
-                print(f"⚠️ Error de red borrando ts={ts}: {e}")
-
-            # pequeña pausa para no cabrear a slack
-            time.sleep(0.4)
-
-        cursor = resp.get("response_metadata", {}).get("next_cursor")
-        if not cursor:
-            break
-
-    print(f"✅ Terminado. Mensajes borrados: {total_deleted}")
+                print(f"❌ Error al leer el canal: {e.response.get('error')}")
+                break
+
+            messages = resp.get("messages", [])
+            targets = []
+            for msg in messages:
+                if bot_id and msg.get("bot_id") != bot_id:
+                    total_skipped += 1
+                    continue
+                targets.append(msg.get("ts"))
+
+            if dry_run:
+                total_deleted += len(targets)
+            else:
+                total_deleted += sum(pool.map(_delete, targets))
+
+            cursor = resp.get("response_metadata", {}).get("next_cursor")
+            # solo avanzamos el cursor persistido cuando la página está terminada
+            if state_path and not dry_run:
+                save_cursor(state_path, cursor)
+            if not cursor or not messages:
+                break
+
+    verb = "a borrar (dry-run)" if dry_run else "borrados"
+    print(f"✅ Terminado. Mensajes {verb}: {total_deleted} | Ignorados (otros autores): {total_skipped}")
+    return total_deleted
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Limpia los mensajes de sondeo del bot en un canal de Slack.")
+    ap.add_argument("--channel", default=SLACK_CHANNEL_ID, help="Canal (por defecto SLACK_CHANNEL_ID)")
+    ap.add_argument("--bot-id", help="Solo mensajes de este bot_id (por defecto, el del token)")
+    ap.add_argument("--all-authors", action="store_true", help="Borra todos los mensajes, no solo los del bot")
+    ap.add_argument("--oldest", help="Inicio de la ventana (epoch o fecha ISO)")
+    ap.add_argument("--latest", help="Fin de la ventana (epoch o fecha ISO)")
+    ap.add_argument("--workers", type=int, default=CLEAN_WORKERS)
+    ap.add_argument("--restart", action="store_true", help="Ignora el cursor guardado")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    if not SLACK_BOT_TOKEN or not args.channel:
+        raise RuntimeError("Falta SLACK_BOT_TOKEN o SLACK_CHANNEL_ID en el .env")
+
+    client = WebClient(token=SLACK_BOT_TOKEN, base_url=os.getenv("SLACK_API_BASE") or WebClient.BASE_URL)
+
+    bot_id = None
+    if not args.all_authors:
+        bot_id = args.bot_id or client.auth_test().get("bot_id")
+        if not bot_id:
+            raise RuntimeError("No se pudo determinar el bot_id; usa --bot-id o --all-authors")
+        print(f"🤖 Borrando solo mensajes de bot_id={bot_id}")
+
+    oldest, latest = parse_ts(args.oldest), parse_ts(args.latest)
+    state_path = STATE_DIR / f"clean_{args.channel}_{bot_id or 'all'}_{oldest or ''}_{latest or ''}.cursor"
+    if args.restart:
+        save_cursor(state_path, None)
+
+    delete_messages_from_channel(args.channel, client, bot_id=bot_id, oldest=oldest, latest=latest,
+                                 workers=args.workers, state_path=state_path, dry_run=args.dry_run)
 
 
 if __name__ == "__main__":
-    delete_messages_from_channel(SLACK_CHANNEL_ID)
+    main()
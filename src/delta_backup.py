@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+delta_backup.py — Backups incrementales de ficheros de trabajo (CSV/Parquet).
+
+En lugar de copiar el fichero entero en cada backup:
+- una instantánea base completa
+- después, solo deltas: filas nuevas/cambiadas (detectadas por hash de fila)
+  y claves borradas
+- `restore(at=...)` reconstruye el estado en cualquier backup (base + deltas)
+- compactación: cuando los deltas acumulados pesan más que BACKUP_COMPACT_RATIO
+  de la base, el siguiente backup es una base nueva
+- `prune` aplica la retención (días + número de bases a conservar)
+
+Estructura:  <dir del fichero>/backups/<nombre>/
+  manifest.json            lista ordenada de bases y deltas
+  last_hashes.npz          claves + hash de fila del último backup
+  base_<ts>.<ext> / delta_<ts>.<ext>
+
+Uso:
+  python delta_backup.py snapshot data/prueba/linkedin_unificado_with_slack_counts_llm.csv
+  python delta_backup.py snapshot backups/profiles_dump.csv --key profile_id
+  python delta_backup.py list data/prueba/linkedin_unificado_with_slack_counts_llm.csv
+  python delta_backup.py restore data/prueba/linkedin_unificado_with_slack_counts_llm.csv --at 20251107-002739 --out restaurado.csv
+  python delta_backup.py prune data/prueba/linkedin_unificado_with_slack_counts_llm.csv --days 14
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from working_store import apply_dtypes, load_frame, save_frame
+
+BACKUP_COMPACT_RATIO = float(os.getenv("BACKUP_COMPACT_RATIO", "0.5"))
+BACKUP_RETENTION_DAYS = int(os.getenv("BACKUP_RETENTION_DAYS", "30"))
+BACKUP_KEEP_BASES = int(os.getenv("BACKUP_KEEP_BASES", "2"))
+
+KEY_COL = "__key"
+TS_FMT = "%Y%m%d-%H%M%S"
+HASH_VERSION = 2     # cambia si cambia _row_hashes: el siguiente backup es base
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class DeltaBackup:
+    def __init__(self, src: Path, root: Optional[Path] = None, key: Optional[str] = None):
+        self.src = Path(src)
+        self.root = Path(root) if root else self.src.parent / "backups" / self.src.stem
+        self.key = key
+        self.ext = ".parquet" if _has_pyarrow() else ".csv.gz"
+        self.manifest_path = self.root / "manifest.json"
+        self.hashes_path = self.root / "last_hashes.npz"
+        self.manifest = self._load_manifest()
+
+    # ------------------ manifest ------------------
+    def _load_manifest(self) -> Dict[str, Any]:
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding="utf-8") as fh:
+                return json.load(fh)
+        return {"source": str(self.src), "key": self.key, "entries": []}
+
+    def _save_manifest(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.manifest, fh, ensure_ascii=False, indent=2)
+        tmp.replace(self.manifest_path)
+
+    @property
+    def entries(self) -> List[Dict[str, Any]]:
+        return self.manifest["entries"]
+
+    # ------------------ ficheros ------------------
+    def _write(self, df: pd.DataFrame, name: str) -> str:
+        fname = name + self.ext
+        path = self.root / fname
+        if self.ext == ".parquet":
+            save_frame(df, path)
+        else:
+            df.to_csv(path, index=False, compression="gzip", encoding="utf-8")
+        return fname
+
+    def _read(self, fname: str) -> pd.DataFrame:
+        path = self.root / fname
+        if fname.endswith(".parquet"):
+            return load_frame(path)
+        return apply_dtypes(pd.read_csv(path, compression="gzip", encoding="utf-8", dtype={KEY_COL: str}))
+
+    # ------------------ claves y hashes ------------------
+    def _keyed(self, df: pd.DataFrame) -> pd.DataFrame:
+        key = self.manifest.get("key") or self.key
+        out = df.copy()
+        if key and key in df.columns and df[key].is_unique:
+            out.insert(0, KEY_COL, df[key].astype(str).to_numpy())
+        else:
+            # los pipelines no reordenan filas: la posición es una clave estable
+            out.insert(0, KEY_COL, np.arange(len(df)).astype(str))
+        return out
+
+    @staticmethod
+    def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+        # tipos normalizados antes del hash: 5 (Int64) y 5.0 (float64) no deben contar como cambio
+        df = apply_dtypes(df.copy())
+        for col in df.columns:
+            s = df[col]
+            if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+                s = pd.to_numeric(s, errors="coerce").astype("Float64")
+                df[col] = s.astype("Int64") if ((s % 1 == 0) | s.isna()).all() else s
+        return pd.util.hash_pandas_object(df.astype("string"), index=False).to_numpy(dtype=np.uint64)
+
+    def _load_hashes(self):
+        if not self.hashes_path.exists():
+            return None
+        z = np.load(self.hashes_path, allow_pickle=False)
+        return pd.Series(z["hashes"], index=z["keys"])
+
+    def _save_hashes(self, keys: np.ndarray, hashes: np.ndarray) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / "last_hashes.tmp.npz"
+        np.savez(tmp, keys=keys.astype(str), hashes=hashes)
+        tmp.replace(self.hashes_path)
+
+    # ------------------ API ------------------
+    def backup(self, df: Optional[pd.DataFrame] = None, force_base: bool = False) -> Optional[str]:
+        """Guarda base o delta. Devuelve el ts del backup, o None si no hay cambios."""
+        if df is None:
+            if not self.src.exists():
+                return None
+            df = load_frame(self.src)
+        keyed = self._keyed(df)
+        keys = keyed[KEY_COL].to_numpy().astype(str)
+        hashes = self._row_hashes(keyed)
+        ts = time.strftime(TS_FMT)
+        while any(e["ts"] == ts for e in self.entries):
+            time.sleep(1)
+            ts = time.strftime(TS_FMT)
+
+        prev = self._load_hashes()
+        bases = [e for e in self.entries if e["kind"] == "base"]
+        since_base = sum(e["rows"] for e in self.entries[self.entries.index(bases[-1]) + 1:]) if bases else 0
+        need_base = (force_base or prev is None or not bases
+                     or since_base > BACKUP_COMPACT_RATIO * max(1, bases[-1]["rows"])
+                     or list(keyed.columns) != self.manifest.get("columns")
+                     or self.manifest.get("hash_version") != HASH_VERSION)
+
+        if need_base:
+            fname = self._write(keyed, f"base_{ts}")
+            entry = {"kind": "base", "ts": ts, "file": fname, "rows": len(keyed)}
+            self.manifest["columns"] = list(keyed.columns)
+            self.manifest["hash_version"] = HASH_VERSION
+        else:
+            old = prev.reindex(keys)
+            changed_mask = (old.isna() | (old.to_numpy() != hashes)).to_numpy()
+            deleted = sorted(set(prev.index) - set(keys))
+            if not changed_mask.any() and not deleted:
+                print("🧰 Backup: sin cambios desde el último.")
+                return None
+            changed = keyed.loc[changed_mask]
+            fname = self._write(changed, f"delta_{ts}")
+            entry = {"kind": "delta", "ts": ts, "file": fname, "rows": int(changed_mask.sum()), "deleted": deleted}
+
+        self.entries.append(entry)
+        self._save_manifest()
+        self._save_hashes(keys, hashes)
+        size_kb = (self.root / entry["file"]).stat().st_size / 1024
+        extra = f", borradas={len(entry.get('deleted', []))}" if entry["kind"] == "delta" else ""
+        print(f"🧰 Backup {entry['kind']}: {entry['file']} (filas={entry['rows']}{extra}, {size_kb:.0f} KB)")
+        return ts
+
+    def restore(self, at: Optional[str] = None) -> pd.DataFrame:
+        """Estado del fichero en el backup `at` (ts, o el más reciente <= at)."""
+        chain = [e for e in self.entries if at is None or e["ts"] <= at]
+        base_idx = max((i for i, e in enumerate(chain) if e["kind"] == "base"), default=None)
+        if base_idx is None:
+            raise ValueError(f"No hay ninguna base anterior a {at}")
+        df = self._read(chain[base_idx]["file"]).set_index(KEY_COL)
+        for e in chain[base_idx + 1:]:
+            delta = self._read(e["file"]).set_index(KEY_COL)
+            df = df.drop(index=[k for k in e.get("deleted", []) if k in df.index])
+            # la fila del delta sustituye entera a la anterior (df.update se salta los NA:
+            # una celda vaciada volvería con el valor de la base)
+            order = df.index.append(delta.index.difference(df.index))
+            df = pd.concat([df.drop(index=delta.index.intersection(df.index)), delta]).reindex(order)
+        df = df.reset_index()
+        if df[KEY_COL].str.fullmatch(r"\d+").all():
+            df = df.sort_values(KEY_COL, key=lambda s: s.astype(int))
+        return apply_dtypes(df.drop(columns=[KEY_COL]).reset_index(drop=True))
+
+    def prune(self, retention_days: int = BACKUP_RETENTION_DAYS, keep_bases: int = BACKUP_KEEP_BASES) -> int:
+        """
+        Borra las cadenas (base + sus deltas) anteriores a la ventana de retención,
+        conservando siempre al menos `keep_bases` bases. Devuelve nº de ficheros borrados.
+        """
+        cutoff = (datetime.now() - timedelta(days=retention_days)).strftime(TS_FMT)
+        base_idxs = [i for i, e in enumerate(self.entries) if e["kind"] == "base"]
+        if len(base_idxs) <= keep_bases:
+            return 0
+        # primera base que hay que conservar: la más antigua que sigue siendo necesaria
+        keep_from = base_idxs[-keep_bases]
+        for i in base_idxs[:-keep_bases]:
+            nxt = next((j for j in base_idxs if j > i), len(self.entries))
+            if self.entries[nxt - 1]["ts"] >= cutoff:
+                keep_from = i
+                break
+        doomed, self.manifest["entries"] = self.entries[:keep_from], self.entries[keep_from:]
+        for e in doomed:
+            (self.root / e["file"]).unlink(missing_ok=True)
+        self._save_manifest()
+        if doomed:
+            print(f"🧹 Retención: {len(doomed)} backups eliminados (anteriores a {self.entries[0]['ts']})")
+        return len(doomed)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Backups incrementales de ficheros de trabajo.")
+    ap.add_argument("action", choices=["snapshot", "list", "restore", "prune"])
+    ap.add_argument("src", help="Fichero de trabajo (CSV o Parquet)")
+    ap.add_argument("--key", help="Columna clave única (por defecto, posición de fila)")
+    ap.add_argument("--base", action="store_true", help="Fuerza una base completa")
+    ap.add_argument("--at", help="ts del backup a restaurar (YYYYmmdd-HHMMSS)")
+    ap.add_argument("--out", help="Ruta de salida del restore")
+    ap.add_argument("--days", type=int, default=BACKUP_RETENTION_DAYS)
+    ap.add_argument("--keep-bases", type=int, default=BACKUP_KEEP_BASES)
+    args = ap.parse_args()
+
+    b = DeltaBackup(Path(args.src), key=args.key)
+    if args.action == "snapshot":
+        b.backup(force_base=args.base)
+    elif args.action == "list":
+        for e in b.entries:
+            size_kb = (b.root / e["file"]).stat().st_size / 1024 if (b.root / e["file"]).exists() else 0
+            print(f"{e['ts']}  {e['kind']:<5}  filas={e['rows']:<7} {size_kb:>8.0f} KB  {e['file']}")
+    elif args.action == "restore":
+        df = b.restore(args.at)
+        out = Path(args.out) if args.out else b.src.with_name(f"{b.src.stem}.restored_{args.at or 'latest'}{b.src.suffix}")
+        save_frame(df, out)
+        print(f"✅ Restaurado ({len(df)} filas) → {out}")
+    else:
+        b.prune(args.days, args.keep_bases)
+
+
+if __name__ == "__main__":
+    main()
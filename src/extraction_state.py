@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+"""
+extraction_state.py — Máquina de estados de extracción por perfil.
+
+Sustituye al centinela `public_identifier = 'INACCESIBLE'` y a
+`public_identifier IS NULL` como "pendiente" por una tabla propia:
+
+  pending ──claim──▶ claimed ──item──▶ done
+     ▲                  │ ├──403──▶ inaccessible ──(EXTRACTION_403_RETRY_DAYS)──┐
+     │                  │ └──sin item──▶ retry_after ──(backoff)──┐             │
+     │                  └──lease vencido / liberado───────────────┤             │
+     └────────────────────────────────────────────────────────────┴─────────────┘
+  retry_after tras APIFY_RETRY_MAX_ATTEMPTS fallos ──▶ parked (solo a mano)
+  claimed con item que no se pudo ingerir ──▶ parked (INGEST_ERROR, se reingesta del dead-letter)
+  claimed con URL ya extraída por otra vía (profiles / archivo raw) ──▶ done (KNOWN)
+  claimed en data/exclude_profiles.txt o con la URL de otro perfil ──▶ excluded (solo a mano)
+  done con done_at más antiguo que REFRESH_MIN_AGE_DAYS ──claim_stale──▶ claimed (refresh)
+
+Índices parciales: la siguiente tanda sale de `(priority DESC, profile_id)
+WHERE state='pending'`; los vencimientos de `next_attempt_at` y de
+`lease_until` tienen cada uno el suyo, así que `promote_due` no recorre la tabla.
+El refresh lee `(done_at, priority DESC) WHERE state='done'` y descuenta de un
+presupuesto diario por tipo (extraction_budget), compartido entre workers.
+
+Uso:
+  python extraction_state.py                     # recuento por estado
+  python extraction_state.py --migrate           # crea la tabla y migra el centinela,
+                                                 # extraction_claims y requeue.json
+  python extraction_state.py --release-parked    # aparcados → pending
+  python extraction_state.py --release-excluded  # excluidos → pending (tras editar la lista)
+  python extraction_state.py --retry-inaccessible
+  python extraction_state.py --requeue https://www.linkedin.com/in/xxx
+"""
+
+import argparse
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import psycopg2
+
+from config import db_params, db_schema, env
+
+STATES = ("pending", "claimed", "done", "inaccessible", "retry_after", "parked", "excluded")
+# un 403 ya no es para siempre: se reintenta pasado este plazo
+EXTRACTION_403_RETRY_DAYS = float(env("EXTRACTION_403_RETRY_DAYS", "90"))
+# un done más antiguo que esto es candidato a re-extracción
+REFRESH_MIN_AGE_DAYS = float(env("REFRESH_MIN_AGE_DAYS", "90"))
+# fallos transitorios (sin item): backoff exponencial con tope y parked tras RETRY_MAX_ATTEMPTS
+RETRY_MAX_ATTEMPTS = int(env("APIFY_RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BACKOFF_BASE = float(env("APIFY_RETRY_BACKOFF_BASE", "300"))     # s
+RETRY_BACKOFF_MAX = float(env("APIFY_RETRY_BACKOFF_MAX", "21600"))     # s (6 h)
+
+
+def ensure_state_schema(cur) -> None:
+    from json_2_sql import ensure_scrape_columns   # profiles.last_scraped_at (sync_state lo lee)
+
+    s = db_schema()
+    ensure_scrape_columns(cur)
+    states = ", ".join(f"'{x}'" for x in STATES)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {s}.extraction_state (
+            profile_id      integer PRIMARY KEY REFERENCES {s}.profiles(profile_id) ON DELETE CASCADE,
+            state           text NOT NULL DEFAULT 'pending' CHECK (state IN ({states})),
+            priority        double precision,
+            attempts        integer NOT NULL DEFAULT 0,
+            last_status     text,
+            last_error      text,
+            worker_id       text,
+            lease_until     timestamptz,
+            next_attempt_at timestamptz,
+            last_attempt_at timestamptz,
+            done_at         timestamptz,
+            created_at      timestamptz NOT NULL DEFAULT now(),
+            updated_at      timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    # Tablas creadas con menos estados: se rehace la CHECK (nombre por defecto de la restricción inline)
+    cur.execute("""
+        SELECT pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND conname = 'extraction_state_state_check'
+    """, (f"{s}.extraction_state",))
+    row = cur.fetchone()
+    if row is None or any(f"'{x}'" not in row[0] for x in STATES):
+        cur.execute(f"""
+            ALTER TABLE {s}.extraction_state
+            DROP CONSTRAINT IF EXISTS extraction_state_state_check,
+            ADD CONSTRAINT extraction_state_state_check CHECK (state IN ({states}))
+        """)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS extraction_state_pending_idx
+        ON {s}.extraction_state (priority DESC NULLS LAST, profile_id) WHERE state = 'pending'
+    """)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS extraction_state_due_idx
+        ON {s}.extraction_state (next_attempt_at) WHERE state IN ('retry_after', 'inaccessible')
+    """)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS extraction_state_lease_idx
+        ON {s}.extraction_state (lease_until) WHERE state = 'claimed'
+    """)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS extraction_state_stale_idx
+        ON {s}.extraction_state (done_at, priority DESC NULLS LAST) WHERE state = 'done'
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {s}.extraction_budget (
+            day  date    NOT NULL DEFAULT current_date,
+            kind text    NOT NULL,
+            used integer NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, kind)
+        )
+    """)
+
+
+# ------------------ Migración y sincronización ------------------
+def migrate_sentinel(cur, retry_days: float = EXTRACTION_403_RETRY_DAYS) -> int:
+    """'INACCESIBLE' → state='inaccessible' (reintentos repartidos en el plazo) y public_identifier NULL."""
+    s = db_schema()
+    cur.execute(f"""
+        WITH cleared AS (
+            UPDATE {s}.profiles SET public_identifier = NULL
+            WHERE public_identifier = 'INACCESIBLE'
+            RETURNING profile_id, extraction_priority
+        )
+        INSERT INTO {s}.extraction_state AS es
+            (profile_id, state, priority, last_status, last_error, next_attempt_at, updated_at)
+        SELECT profile_id, 'inaccessible', extraction_priority, '403', 'centinela INACCESIBLE migrado',
+               now() + random() * make_interval(days => %s), now()
+        FROM cleared
+        ON CONFLICT (profile_id) DO UPDATE
+          SET state = 'inaccessible', last_status = EXCLUDED.last_status, last_error = EXCLUDED.last_error,
+              next_attempt_at = EXCLUDED.next_attempt_at, worker_id = NULL, lease_until = NULL, updated_at = now()
+    """, (int(retry_days),))
+    return cur.rowcount
+
+
+def migrate_claims(cur) -> int:
+    """Importa la tabla extraction_claims (modo claim anterior) y la borra."""
+    s = db_schema()
+    cur.execute("SELECT to_regclass(%s)", (f"{s}.extraction_claims",))
+    if cur.fetchone()[0] is None:
+        return 0
+    cur.execute(f"""
+        INSERT INTO {s}.extraction_state AS es (profile_id, state, attempts, last_status, next_attempt_at, updated_at)
+        SELECT profile_id,
+               CASE WHEN lease_until = 'infinity' THEN 'parked'
+                    WHEN worker_id IS NULL AND lease_until > now() THEN 'retry_after'
+                    ELSE 'pending' END,
+               attempts, last_status,
+               CASE WHEN lease_until = 'infinity' OR worker_id IS NOT NULL THEN NULL ELSE lease_until END,
+               now()
+        FROM {s}.extraction_claims
+        ON CONFLICT (profile_id) DO UPDATE
+          SET state = EXCLUDED.state, attempts = EXCLUDED.attempts, last_status = EXCLUDED.last_status,
+              next_attempt_at = EXCLUDED.next_attempt_at, updated_at = now()
+          WHERE es.state <> 'done'
+    """)
+    n = cur.rowcount
+    cur.execute(f"DROP TABLE {s}.extraction_claims")
+    return n
+
+
+def import_requeue(cur, ledger, max_attempts: int = RETRY_MAX_ATTEMPTS) -> int:
+    """Entradas del requeue.json antiguo (apify_requeue.RequeueLedger) → retry_after / parked."""
+    from psycopg2.extras import execute_values
+
+    rows = [(url, e["attempts"], e.get("last_status"), e.get("next_at") or 0, e["attempts"] >= max_attempts)
+            for url, e in ledger.entries()]
+    if not rows:
+        return 0
+    execute_values(cur, f"""
+        UPDATE {db_schema()}.extraction_state AS es
+        SET state = CASE WHEN v.parked THEN 'parked' ELSE 'retry_after' END,
+            attempts = GREATEST(es.attempts, v.attempts), last_status = v.status,
+            next_attempt_at = CASE WHEN v.parked THEN NULL ELSE to_timestamp(v.next_at) END,
+            updated_at = now()
+        FROM (VALUES %s) AS v(url, attempts, status, next_at, parked), {db_schema()}.profiles p
+        WHERE p.linkedin_url = v.url AND es.profile_id = p.profile_id AND es.state = 'pending'
+    """, rows, template="(%s, %s::int, %s, %s::float8, %s::bool)", page_size=len(rows))
+    return cur.rowcount
+
+
+def sync_state(cur, refresh_days: float = REFRESH_MIN_AGE_DAYS) -> Dict[str, int]:
+    """Alta de perfiles nuevos, prioridades al día y pending → done si otra vía ya los extrajo."""
+    s = db_schema()
+    out = {}
+    # Sin last_scraped_at (extraídos antes de guardarlo) el done_at se reparte en el plazo de
+    # refresh, para que no venzan todos el mismo día
+    done_at = "COALESCE(p.last_scraped_at, now() - random() * make_interval(days => %(days)s))"
+    cur.execute(f"""
+        INSERT INTO {s}.extraction_state (profile_id, state, priority, done_at)
+        SELECT p.profile_id,
+               CASE WHEN p.public_identifier IS NULL THEN 'pending' ELSE 'done' END,
+               p.extraction_priority,
+               CASE WHEN p.public_identifier IS NULL THEN NULL ELSE {done_at} END
+        FROM {s}.profiles p
+        WHERE p.linkedin_url IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM {s}.extraction_state es WHERE es.profile_id = p.profile_id)
+        ON CONFLICT (profile_id) DO NOTHING
+    """, dict(days=int(refresh_days)))
+    out["new"] = cur.rowcount
+    # done_at IS NULL: nunca extraído por el orquestador (un `--requeue` de un done no se deshace aquí)
+    external = "p.public_identifier IS NOT NULL AND es.done_at IS NULL"
+    cur.execute(f"""
+        UPDATE {s}.extraction_state es
+        SET state = CASE WHEN {external} THEN 'done' ELSE es.state END,
+            done_at = CASE WHEN {external} THEN {done_at} ELSE es.done_at END,
+            priority = p.extraction_priority, updated_at = now()
+        FROM {s}.profiles p
+        WHERE es.state = 'pending' AND p.profile_id = es.profile_id
+          AND ({external} OR es.priority IS DISTINCT FROM p.extraction_priority)
+    """, dict(days=int(refresh_days)))
+    out["updated"] = cur.rowcount
+    return out
+
+
+def promote_due(cur) -> int:
+    """retry_after/inaccessible vencidos y claims con lease vencido → pending."""
+    s = db_schema()
+    cur.execute(f"""
+        UPDATE {s}.extraction_state
+        SET state = 'pending', next_attempt_at = NULL, updated_at = now()
+        WHERE state IN ('retry_after', 'inaccessible') AND next_attempt_at <= now()
+    """)
+    n = cur.rowcount
+    cur.execute(f"""
+        UPDATE {s}.extraction_state
+        SET state = 'pending', worker_id = NULL, lease_until = NULL, updated_at = now()
+        WHERE state = 'claimed' AND lease_until <= now()
+    """)
+    return n + cur.rowcount
+
+
+# ------------------ Transiciones ------------------
+def claim(cur, worker: str, n: int, lease_seconds: float, min_connections: int = 0,
+          exclude: Sequence[int] = ()) -> List[Tuple[int, str]]:
+    """pending → claimed para hasta n perfiles por prioridad (SKIP LOCKED). Devuelve [(profile_id, url)]."""
+    s = db_schema()
+    conn_filter = ""
+    if min_connections > 0:
+        conn_filter = f"""AND EXISTS (SELECT 1 FROM {s}.profiles p WHERE p.profile_id = c.profile_id
+                                         AND p.connections >= %(min_conn)s)"""
+    cur.execute(f"""
+        UPDATE {s}.extraction_state es
+        SET state = 'claimed', worker_id = %(worker)s, lease_until = now() + make_interval(secs => %(lease)s),
+            last_attempt_at = now(), updated_at = now()
+        FROM (
+            SELECT c.profile_id FROM {s}.extraction_state c
+            WHERE c.state = 'pending' AND NOT (c.profile_id = ANY(%(exclude)s)) {conn_filter}
+            ORDER BY c.priority DESC NULLS LAST, c.profile_id
+            LIMIT %(n)s
+            FOR UPDATE OF c SKIP LOCKED
+        ) pick, {s}.profiles p
+        WHERE es.profile_id = pick.profile_id AND p.profile_id = es.profile_id AND es.state = 'pending'
+        RETURNING es.profile_id, p.linkedin_url, es.priority
+    """, dict(worker=worker, lease=lease_seconds, exclude=list(exclude), n=n, min_conn=min_connections))
+    rows = sorted(cur.fetchall(), key=lambda r: (-(r[2] if r[2] is not None else float("-inf")), r[0]))
+    return [(pid, url) for pid, url, _ in rows if url]
+
+
+def claim_stale(cur, worker: str, n: int, lease_seconds: float, min_age_days: float = REFRESH_MIN_AGE_DAYS,
+                min_priority: Optional[float] = None, exclude: Sequence[int] = ()) -> List[Tuple[int, str]]:
+    """done más antiguos que min_age_days → claimed, del más viejo al más nuevo (SKIP LOCKED)."""
+    s = db_schema()
+    prio_filter = "AND c.priority >= %(min_prio)s" if min_priority is not None else ""
+    cur.execute(f"""
+        UPDATE {s}.extraction_state es
+        SET state = 'claimed', worker_id = %(worker)s, lease_until = now() + make_interval(secs => %(lease)s),
+            last_attempt_at = now(), updated_at = now()
+        FROM (
+            SELECT c.profile_id FROM {s}.extraction_state c
+            WHERE c.state = 'done' AND c.done_at < now() - make_interval(days => %(age)s)
+              AND NOT (c.profile_id = ANY(%(exclude)s)) {prio_filter}
+            ORDER BY c.done_at, c.priority DESC NULLS LAST
+            LIMIT %(n)s
+            FOR UPDATE OF c SKIP LOCKED
+        ) pick, {s}.profiles p
+        WHERE es.profile_id = pick.profile_id AND p.profile_id = es.profile_id AND es.state = 'done'
+        RETURNING es.profile_id, p.linkedin_url, es.done_at
+    """, dict(worker=worker, lease=lease_seconds, age=int(min_age_days), min_prio=min_priority,
+              exclude=list(exclude), n=n))
+    rows = sorted(cur.fetchall(), key=lambda r: (r[2], r[0]))
+    return [(pid, url) for pid, url, _ in rows if url]
+
+
+def restore_done(cur, worker: str, pids: List[int]) -> None:
+    """claimed → done sin tocar done_at (refresh fallido: sigue siendo candidato otro día)."""
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_state
+        SET state = 'done', worker_id = NULL, lease_until = NULL, updated_at = now()
+        WHERE profile_id = ANY(%s) AND state = 'claimed' AND worker_id = %s
+    """, (pids, worker))
+
+
+def reserve_budget(cur, kind: str, n: int, limit: int) -> int:
+    """Reserva hasta n unidades del presupuesto de hoy para `kind`. Devuelve cuántas se conceden."""
+    s = db_schema()
+    cur.execute(f"INSERT INTO {s}.extraction_budget (kind) VALUES (%s) ON CONFLICT DO NOTHING", (kind,))
+    cur.execute(f"""
+        WITH prev AS (
+            SELECT used FROM {s}.extraction_budget WHERE day = current_date AND kind = %(kind)s FOR UPDATE
+        )
+        UPDATE {s}.extraction_budget b
+        SET used = LEAST(%(limit)s, prev.used + %(n)s)
+        FROM prev
+        WHERE b.day = current_date AND b.kind = %(kind)s AND prev.used < %(limit)s
+        RETURNING b.used - prev.used
+    """, dict(kind=kind, n=n, limit=limit))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def refund_budget(cur, kind: str, n: int) -> None:
+    """Devuelve al presupuesto de hoy lo reservado y no gastado."""
+    if n <= 0:
+        return
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_budget SET used = GREATEST(0, used - %s)
+        WHERE day = current_date AND kind = %s
+    """, (n, kind))
+
+
+def extend_lease(cur, worker: str, pids: List[int], lease_seconds: float) -> None:
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_state
+        SET lease_until = now() + make_interval(secs => %s)
+        WHERE profile_id = ANY(%s) AND state = 'claimed' AND worker_id = %s
+    """, (lease_seconds, pids, worker))
+
+
+def mark_done(cur, worker: str, pids: List[int]) -> None:
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_state
+        SET state = 'done', done_at = now(), attempts = 0, last_status = 'SUCCEEDED', last_error = NULL,
+            worker_id = NULL, lease_until = NULL, next_attempt_at = NULL, updated_at = now()
+        WHERE profile_id = ANY(%s) AND state = 'claimed' AND worker_id = %s
+    """, (pids, worker))
+
+
+def mark_inaccessible(cur, worker: str, pids: List[int], retry_days: float = EXTRACTION_403_RETRY_DAYS) -> None:
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_state
+        SET state = 'inaccessible', last_status = '403', last_error = 'perfil no accesible sin login',
+            next_attempt_at = now() + make_interval(days => %s),
+            worker_id = NULL, lease_until = NULL, updated_at = now()
+        WHERE profile_id = ANY(%s) AND state = 'claimed' AND worker_id = %s
+    """, (int(retry_days), pids, worker))
+
+
+def mark_retry(cur, worker: str, pids: List[int], status: Optional[str], error: Optional[str],
+               max_attempts: int, base: float, cap: float) -> int:
+    """+1 intento y backoff exponencial; al llegar a max_attempts → parked. Devuelve cuántos se aparcan."""
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_state
+        SET attempts = attempts + 1, last_status = %(status)s, last_error = %(error)s,
+            state = CASE WHEN attempts + 1 >= %(max)s THEN 'parked' ELSE 'retry_after' END,
+            next_attempt_at = CASE WHEN attempts + 1 >= %(max)s THEN NULL
+                                   ELSE now() + make_interval(secs => LEAST(%(cap)s, %(base)s * 2 ^ attempts)) END,
+            worker_id = NULL, lease_until = NULL, updated_at = now()
+        WHERE profile_id = ANY(%(pids)s) AND state = 'claimed' AND worker_id = %(worker)s
+        RETURNING state
+    """, dict(status=status, error=error, max=max_attempts, cap=cap, base=base, pids=pids, worker=worker))
+    return sum(1 for (st,) in cur.fetchall() if st == "parked")
+
+
+def mark_parked(cur, worker: str, pids: List[int], status: str, error: Optional[str]) -> None:
+    """claimed → parked sin reintento automático (p.ej. el item llegó pero no se pudo ingerir)."""
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_state
+        SET state = 'parked', last_status = %s, last_error = %s, next_attempt_at = NULL,
+            worker_id = NULL, lease_until = NULL, updated_at = now()
+        WHERE profile_id = ANY(%s) AND state = 'claimed' AND worker_id = %s
+    """, (status, error, pids, worker))
+
+
+def mark_known(cur, worker: str, pids: List[int]) -> None:
+    """claimed → done sin enviarlo: la URL ya se extrajo por otra vía (profiles o archivo raw)."""
+    s = db_schema()
+    cur.execute(f"""
+        UPDATE {s}.extraction_state es
+        SET state = 'done', done_at = COALESCE(p.last_scraped_at, now()), last_status = 'KNOWN',
+            last_error = NULL, worker_id = NULL, lease_until = NULL, next_attempt_at = NULL, updated_at = now()
+        FROM {s}.profiles p
+        WHERE p.profile_id = es.profile_id
+          AND es.profile_id = ANY(%s) AND es.state = 'claimed' AND es.worker_id = %s
+    """, (pids, worker))
+
+
+def mark_excluded(cur, worker: str, pids: List[int], status: str) -> None:
+    """claimed → excluded: no se vuelve a reclamar hasta --release-excluded."""
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_state
+        SET state = 'excluded', last_status = %s, last_error = NULL, next_attempt_at = NULL,
+            worker_id = NULL, lease_until = NULL, updated_at = now()
+        WHERE profile_id = ANY(%s) AND state = 'claimed' AND worker_id = %s
+    """, (status, pids, worker))
+
+
+def resolve_ingest_errors(cur, urls: List[str]) -> int:
+    """Aparcados por INGEST_ERROR cuyo item ya se reingirió desde el dead-letter → done."""
+    s = db_schema()
+    cur.execute(f"""
+        UPDATE {s}.extraction_state es
+        SET state = 'done', done_at = now(), last_status = 'SUCCEEDED', last_error = NULL, updated_at = now()
+        FROM {s}.profiles p
+        WHERE p.profile_id = es.profile_id AND p.linkedin_url = ANY(%s)
+          AND es.state = 'parked' AND es.last_status = 'INGEST_ERROR'
+    """, (urls,))
+    return cur.rowcount
+
+
+def release(cur, worker: str, pids: List[int]) -> None:
+    """claimed → pending sin penalizar."""
+    cur.execute(f"""
+        UPDATE {db_schema()}.extraction_state
+        SET state = 'pending', worker_id = NULL, lease_until = NULL, updated_at = now()
+        WHERE profile_id = ANY(%s) AND state = 'claimed' AND worker_id = %s
+    """, (pids, worker))
+
+
+def summary(cur) -> Dict[str, Dict[str, int]]:
+    cur.execute(f"""
+        SELECT state, COUNT(*),
+               COUNT(*) FILTER (WHERE next_attempt_at <= now() OR lease_until <= now())
+        FROM {db_schema()}.extraction_state GROUP BY state ORDER BY state
+    """)
+    return {st: {"n": n, "vencidos": due} for st, n, due in cur.fetchall()}
+
+
+def stale_count(cur, min_age_days: float = REFRESH_MIN_AGE_DAYS) -> int:
+    cur.execute(f"""
+        SELECT COUNT(*) FROM {db_schema()}.extraction_state
+        WHERE state = 'done' AND done_at < now() - make_interval(days => %s)
+    """, (int(min_age_days),))
+    return cur.fetchone()[0]
+
+
+def to_pending(cur, states: Iterable[str], urls: Optional[List[str]] = None) -> int:
+    s = db_schema()
+    sql = f"""
+        UPDATE {s}.extraction_state es
+        SET state = 'pending', attempts = 0, next_attempt_at = NULL, worker_id = NULL, lease_until = NULL,
+            updated_at = now()
+        WHERE es.state = ANY(%s)
+    """
+    params: list = [list(states)]
+    if urls is not None:
+        sql += f" AND es.profile_id IN (SELECT profile_id FROM {s}.profiles WHERE linkedin_url = ANY(%s))"
+        params.append(urls)
+    cur.execute(sql, params)
+    return cur.rowcount
+
+
+def main():
+    from linkedin_urls import canonical_key
+
+    ap = argparse.ArgumentParser(description="Estado de extracción por perfil.")
+    ap.add_argument("--migrate", action="store_true",
+                    help="Crea la tabla y migra INACCESIBLE, extraction_claims y requeue.json")
+    ap.add_argument("--release-parked", action="store_true", help="parked → pending")
+    ap.add_argument("--release-excluded", action="store_true",
+                    help="excluded → pending (los que sigan en la lista vuelven a excluded al reclamarlos)")
+    ap.add_argument("--retry-inaccessible", action="store_true", help="inaccessible → pending ya")
+    ap.add_argument("--requeue", nargs="+", metavar="URL", help="Vuelve a poner en cola estas URLs (salvo si están reclamadas)")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor() as cur:
+            ensure_state_schema(cur)
+            if args.migrate:
+                n_sent = migrate_sentinel(cur)
+                n_claims = migrate_claims(cur)
+                counts = sync_state(cur)
+                from apify_requeue import RequeueLedger
+                n_req = import_requeue(cur, RequeueLedger())
+                print(f"🧭 Migrado: INACCESIBLE={n_sent} · claims={n_claims} · requeue.json={n_req} · "
+                      f"altas={counts['new']}")
+            if args.release_parked:
+                print(f"🔁 {to_pending(cur, ['parked'])} aparcados → pending")
+            if args.release_excluded:
+                print(f"🔁 {to_pending(cur, ['excluded'])} excluidos → pending")
+            if args.retry_inaccessible:
+                print(f"🔁 {to_pending(cur, ['inaccessible'])} inaccesibles → pending")
+            if args.requeue:
+                urls = [canonical_key(u) for u in args.requeue]
+                states = [x for x in STATES if x != "claimed"]
+                print(f"🔁 {to_pending(cur, states, [u for u in urls if u])} URLs → pending")
+            st = summary(cur)
+            n_stale = stale_count(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    for state in STATES:
+        if state in st:
+            print(f"  {state:<13} {st[state]['n']:>9}  (vencidos: {st[state]['vencidos']})")
+    print(f"  done > {REFRESH_MIN_AGE_DAYS:g} días: {n_stale} (candidatos a refresh)")
+
+
+if __name__ == "__main__":
+    main()
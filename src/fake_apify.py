@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+fake_apify.py — Servidor local que imita los endpoints de Apify que usamos.
+
+Sirve para probar harvestapi_dispatch_standalone + orchestrate_from_db de
+punta a punta sin gastar dinero en api.apify.com:
+
+  POST /v2/acts/{actor}/runs            → lanza un run (body: {"urls": [...]})
+  GET  /v2/actor-runs/{run_id}          → estado (RUNNING hasta que vence la latencia)
+  POST /v2/actor-runs/{run_id}/abort    → ABORTED
+  GET  /v2/datasets/{dataset_id}/items  → items del run
+
+Los items salen de data/apify_actor/raw/: si la URL está en el archivo se
+devuelve ese item; si no, se toma uno del archivo como plantilla y se le
+cambia la identidad (así se pueden sembrar miles de URLs sintéticas).
+
+Comportamiento configurable (flags o variables FAKE_APIFY_*):
+  --latency        segundos fijos por run
+  --per-url        segundos extra por URL enviada
+  --fail-rate      prob. de que el run acabe FAILED/TIMED-OUT (con dataset parcial)
+  --forbidden-rate prob. por URL de devolver un item 403
+
+Uso:
+  python fake_apify.py --port 8765 --latency 2 --fail-rate 0.1 --forbidden-rate 0.02
+  APIFY_BASE=http://127.0.0.1:8765/v2 APIFY_TOKEN=fake python orchestrate_from_db.py
+"""
+
+import argparse
+import copy
+import glob
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from linkedin_urls import canonical_key
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+RAW_DIR = PROJECT_ROOT / "data" / "apify_actor" / "raw"
+
+FAKE_APIFY_LATENCY = float(os.getenv("FAKE_APIFY_LATENCY", "1.0"))
+FAKE_APIFY_PER_URL = float(os.getenv("FAKE_APIFY_PER_URL", "0.05"))
+FAKE_APIFY_FAIL_RATE = float(os.getenv("FAKE_APIFY_FAIL_RATE", "0.0"))
+FAKE_APIFY_FORBIDDEN_RATE = float(os.getenv("FAKE_APIFY_FORBIDDEN_RATE", "0.0"))
+
+
+def load_archive(raw_dir: Path = RAW_DIR) -> Dict[str, Dict[str, Any]]:
+    """url canónica → item (solo perfiles extraídos, no los 403)."""
+    out = {}
+    for path in sorted(glob.glob(str(raw_dir / "*.json"))):
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        for it in data if isinstance(data, list) else data.get("items", []):
+            if isinstance(it, dict) and it.get("publicIdentifier"):
+                k = canonical_key(it.get("linkedinUrl"))
+                if k:
+                    out[k] = it
+    return out
+
+
+class FakeApify:
+    def __init__(self, archive: Dict[str, Dict[str, Any]], latency: float = FAKE_APIFY_LATENCY,
+                 per_url: float = FAKE_APIFY_PER_URL, fail_rate: float = FAKE_APIFY_FAIL_RATE,
+                 forbidden_rate: float = FAKE_APIFY_FORBIDDEN_RATE, seed: Optional[int] = None):
+        if not archive:
+            raise ValueError("El archivo raw está vacío: no hay items que servir")
+        self.archive = archive
+        self.templates = list(archive.values())
+        self.latency = latency
+        self.per_url = per_url
+        self.fail_rate = fail_rate
+        self.forbidden_rate = forbidden_rate
+        self.rng = random.Random(seed)
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self.datasets: Dict[str, List[Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+        self.stats = {"runs": 0, "urls": 0, "items": 0, "failed_runs": 0, "forbidden": 0}
+
+    # ------------------ items ------------------
+    def _item_for(self, url: str) -> Dict[str, Any]:
+        key = canonical_key(url) or url
+        if self.rng.random() < self.forbidden_rate:
+            self.stats["forbidden"] += 1
+            return {"status": 403, "error": "Profile not accessible", "query": {"url": url}}
+        if key in self.archive:
+            it = copy.deepcopy(self.archive[key])
+        else:
+            it = copy.deepcopy(self.rng.choice(self.templates))
+            slug = key.rstrip("/").rsplit("/", 1)[-1]
+            it["publicIdentifier"] = slug
+            it["linkedinUrl"] = key
+            it["id"] = "FAKE" + uuid.uuid5(uuid.NAMESPACE_URL, key).hex[:20]
+        it["query"] = {"url": url}
+        return it
+
+    # ------------------ runs ------------------
+    def start_run(self, urls: List[str]) -> Dict[str, Any]:
+        with self.lock:
+            run_id = uuid.uuid4().hex[:17]
+            ds_id = uuid.uuid4().hex[:17]
+            run = {
+                "id": run_id,
+                "status": "RUNNING",
+                "defaultDatasetId": ds_id,
+                "startedAt": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+                "_urls": list(urls),
+                "_ready_at": time.time() + self.latency + self.per_url * len(urls),
+            }
+            self.runs[run_id] = run
+            self.datasets[ds_id] = []
+            self.stats["runs"] += 1
+            self.stats["urls"] += len(urls)
+            return run
+
+    def _finish(self, run: Dict[str, Any], status: Optional[str] = None) -> None:
+        urls = run["_urls"]
+        if status is None:
+            status = "SUCCEEDED"
+            if self.rng.random() < self.fail_rate:
+                status = self.rng.choice(["FAILED", "TIMED-OUT"])
+        if status != "SUCCEEDED":
+            # dataset parcial: el actor llegó a procesar solo una parte
+            urls = urls[:self.rng.randint(0, len(urls))]
+            self.stats["failed_runs"] += 1
+        items = [self._item_for(u) for u in urls]
+        self.datasets[run["defaultDatasetId"]] = items
+        self.stats["items"] += len(items)
+        run["status"] = status
+        run["finishedAt"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            run = self.runs.get(run_id)
+            if run and run["status"] == "RUNNING" and time.time() >= run["_ready_at"]:
+                self._finish(run)
+            return run
+
+    def abort_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            run = self.runs.get(run_id)
+            if run and run["status"] == "RUNNING":
+                self._finish(run, "ABORTED")
+            return run
+
+    def items(self, ds_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self.lock:
+            return self.datasets.get(ds_id)
+
+
+def _public(run: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in run.items() if not k.startswith("_")}
+
+
+def make_handler(fake: FakeApify):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):  # silencio: el harness mide, no loguea
+            pass
+
+        def _send(self, code: int, payload: Any) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _parts(self) -> List[str]:
+            parts = [p for p in urlsplit(self.path).path.split("/") if p]
+            return parts[1:] if parts and parts[0] == "v2" else parts
+
+        def do_POST(self):
+            parts = self._parts()
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if len(parts) == 3 and parts[0] == "acts" and parts[2] == "runs":
+                try:
+                    body = json.loads(raw or b"{}")
+                except ValueError:
+                    return self._send(400, {"error": {"message": "invalid JSON"}})
+                run = fake.start_run(body.get("urls") or [])
+                return self._send(201, {"data": _public(run)})
+            if len(parts) == 3 and parts[0] == "actor-runs" and parts[2] == "abort":
+                run = fake.abort_run(parts[1])
+                return self._send(200, {"data": _public(run)}) if run else self._send(404, {"error": {}})
+            self._send(404, {"error": {"message": "not found"}})
+
+        def do_GET(self):
+            parts = self._parts()
+            if len(parts) == 2 and parts[0] == "actor-runs":
+                run = fake.get_run(parts[1])
+                return self._send(200, {"data": _public(run)}) if run else self._send(404, {"error": {}})
+            if len(parts) == 3 and parts[0] == "datasets" and parts[2] == "items":
+                items = fake.items(parts[1])
+                return self._send(200, items) if items is not None else self._send(404, {"error": {}})
+            self._send(404, {"error": {"message": "not found"}})
+
+    return Handler
+
+
+def serve(fake: FakeApify, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Arranca el servidor en un hilo daemon. `server.server_address` da el puerto real."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Servidor local que imita la API de Apify.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=FAKE_APIFY_LATENCY)
+    ap.add_argument("--per-url", type=float, default=FAKE_APIFY_PER_URL)
+    ap.add_argument("--fail-rate", type=float, default=FAKE_APIFY_FAIL_RATE)
+    ap.add_argument("--forbidden-rate", type=float, default=FAKE_APIFY_FORBIDDEN_RATE)
+    ap.add_argument("--seed", type=int)
+    args = ap.parse_args()
+
+    fake = FakeApify(load_archive(), args.latency, args.per_url, args.fail_rate, args.forbidden_rate, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    print(f"🧪 Apify local en http://{args.host}:{args.port}/v2 ({len(fake.archive)} items en archivo)")
+    print(f"   export APIFY_BASE=http://{args.host}:{args.port}/v2 APIFY_TOKEN=fake")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 {fake.stats}")
+
+
+if __name__ == "__main__":
+    main()
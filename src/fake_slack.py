@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+fake_slack.py — Servidor local que imita la Web API de Slack para los unfurls.
+
+Métodos: chat.postMessage, conversations.replies, conversations.history,
+chat.delete y auth.test. Pensado para WebClient(base_url=...):
+
+- los mensajes con URLs de LinkedIn reciben attachments "realistas"
+  (título, texto con ubicación/seguidores/contactos) al cabo de un retardo
+  configurable (--unfurl-delay ± --jitter); un % puede no desplegarse nunca
+- límites tipo tier por token y método (ventana de 1 minuto) y ~1 msg/s
+  por canal en chat.postMessage; al pasarse responde 429 + Retry-After
+- `stats` cuenta llamadas, 429, lecturas antes de que el unfurl estuviera
+  listo y el tiempo de espera desperdiciado (lectura − unfurl listo)
+
+Uso:
+  python fake_slack.py --port 8766 --unfurl-delay 3 --jitter 2
+  (WebClient(token="xoxb-fake", base_url="http://127.0.0.1:8766/api/"))
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from fake_apify import load_archive
+from linkedin_urls import canonical_key
+from slack_rate import METHOD_TIERS, POST_MESSAGE_PER_SECOND, TIER_PER_MINUTE
+
+FAKE_SLACK_UNFURL_DELAY = float(os.getenv("FAKE_SLACK_UNFURL_DELAY", "3.0"))
+FAKE_SLACK_JITTER = float(os.getenv("FAKE_SLACK_JITTER", "1.0"))
+FAKE_SLACK_MISS_RATE = float(os.getenv("FAKE_SLACK_MISS_RATE", "0.05"))
+
+URL_RX = re.compile(r"https?://[^\s<>|]+")
+
+
+def _fmt_count(n: Optional[int]) -> Optional[str]:
+    if n is None:
+        return None
+    return f"{n:,}".replace(",", ".")
+
+
+class FakeSlack:
+    def __init__(self, archive: Optional[Dict[str, Dict[str, Any]]] = None,
+                 unfurl_delay: float = FAKE_SLACK_UNFURL_DELAY, jitter: float = FAKE_SLACK_JITTER,
+                 miss_rate: float = FAKE_SLACK_MISS_RATE, limit_scale: float = 1.0, seed: Optional[int] = None):
+        self.archive = archive if archive is not None else load_archive()
+        self.templates = list(self.archive.values())
+        self.unfurl_delay = unfurl_delay
+        self.jitter = jitter
+        self.miss_rate = miss_rate
+        self.limit_scale = limit_scale
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.channels: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._windows: Dict[tuple, List[float]] = defaultdict(list)
+        self._ts_seq = 0
+        self.stats = {
+            "calls": defaultdict(int),
+            "ratelimited": defaultdict(int),
+            "messages": 0,
+            "urls_posted": 0,
+            "unfurled": 0,
+            "early_reads": 0,         # replies leídos antes de que el unfurl estuviera listo
+            "wasted_wait_s": 0.0,     # suma de (primera lectura con unfurl − unfurl listo)
+        }
+
+    # ------------------ rate limits ------------------
+    def _limit(self, method: str, token: str, channel: Optional[str]):
+        """(clave, máximo, ventana_s) del límite que aplica a la llamada."""
+        if method == "chat.postMessage":
+            return ("post", token, channel), max(1, int(POST_MESSAGE_PER_SECOND * self.limit_scale)), 1.0
+        per_min = TIER_PER_MINUTE[METHOD_TIERS.get(method, 2)] * self.limit_scale
+        return ("tier", token, method), max(1, int(per_min)), 60.0
+
+    def check_rate(self, method: str, token: str, channel: Optional[str]) -> Optional[float]:
+        """None si se permite; si no, segundos de Retry-After."""
+        key, limit, window = self._limit(method, token, channel)
+        now = time.monotonic()
+        with self.lock:
+            hits = [t for t in self._windows[key] if now - t < window]
+            if len(hits) >= limit:
+                self._windows[key] = hits
+                self.stats["ratelimited"][method] += 1
+                return max(1.0, window - (now - hits[0]))
+            hits.append(now)
+            self._windows[key] = hits
+            self.stats["calls"][method] += 1
+            return None
+
+    # ------------------ unfurls ------------------
+    def _attachment(self, posted_url: str) -> Optional[Dict[str, Any]]:
+        key = canonical_key(posted_url)
+        if not key or "/in/" not in key:
+            return None
+        it = self.archive.get(key)
+        if it is None:
+            tpl = self.rng.choice(self.templates)
+            slug = key.rsplit("/", 1)[-1]
+            name = " ".join(p.capitalize() for p in slug.split("-")[:2])
+            it = dict(tpl, firstName=name, lastName="")
+        name = f"{it.get('firstName') or ''} {it.get('lastName') or ''}".strip()
+        headline = it.get("headline") or ""
+        loc = ((it.get("location") or {}).get("linkedinText")) or ""
+        exp = (it.get("experience") or [{}])[0].get("companyName") if it.get("experience") else None
+        edu = (it.get("education") or [{}])[0].get("schoolName") if it.get("education") else None
+        conns = it.get("connectionsCount")
+        foll = it.get("followerCount")
+        parts = [(it.get("about") or "")[:200]]
+        if exp:
+            parts.append(f"Experiencia: {exp}")
+        if edu:
+            parts.append(f"Educación: {edu}")
+        if loc:
+            parts.append(f"Ubicación: {loc}")
+        if foll is not None:
+            parts.append(f"{_fmt_count(foll)} seguidores")
+        if conns is not None:
+            parts.append("Más de 500 contactos" if conns >= 500 else f"{conns} contactos")
+        text = " · ".join(p for p in parts if p)
+        text += f". Mira el perfil de {name} en LinkedIn, una comunidad profesional de mil millones de miembros."
+        title = f"{name} - {headline} | LinkedIn" if headline else f"{name} | LinkedIn"
+        return {
+            "service_name": "LinkedIn",
+            "title": title,
+            "title_link": posted_url,
+            "from_url": posted_url,
+            "original_url": posted_url,
+            "text": text,
+            "fallback": f"LinkedIn: {title}",
+        }
+
+    def _maybe_unfurl(self, msg: Dict[str, Any], now: float) -> bool:
+        """Añade los attachments si ya venció el retardo. True si el mensaje está desplegado."""
+        if msg["_unfurled"]:
+            return True
+        if now < msg["_ready_at"]:
+            return False
+        atts = [a for a in (self._attachment(u) for u in msg["_urls"]) if a and self.rng.random() >= self.miss_rate]
+        if atts:
+            msg["attachments"] = atts
+            self.stats["unfurled"] += len(atts)
+        msg["_unfurled"] = True
+        return True
+
+    # ------------------ métodos ------------------
+    def post_message(self, token: str, channel: str, text: str) -> Dict[str, Any]:
+        with self.lock:
+            self._ts_seq += 1
+            ts = f"{time.time():.0f}.{self._ts_seq:06d}"
+            urls = URL_RX.findall(text or "")
+            msg = {
+                "type": "message", "ts": ts, "text": text, "bot_id": "BFAKE", "user": "UFAKEBOT",
+                "_urls": urls, "_unfurled": False, "_first_read": None,
+                "_ready_at": time.monotonic() + max(0.0, self.unfurl_delay + self.rng.uniform(-self.jitter, self.jitter)),
+            }
+            self.channels[channel].append(msg)
+            self.stats["messages"] += 1
+            self.stats["urls_posted"] += len(urls)
+            return {"ok": True, "channel": channel, "ts": ts, "message": _public(msg)}
+
+    def replies(self, channel: str, ts: str) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self.lock:
+            msg = next((m for m in self.channels.get(channel, []) if m["ts"] == ts), None)
+            if msg is None:
+                return {"ok": False, "error": "thread_not_found"}
+            if not self._maybe_unfurl(msg, now):
+                self.stats["early_reads"] += 1
+            elif msg["_first_read"] is None:
+                msg["_first_read"] = now
+                self.stats["wasted_wait_s"] += now - msg["_ready_at"]
+            return {"ok": True, "messages": [_public(msg)], "has_more": False}
+
+    def history(self, channel: str, limit: int = 100, cursor: Optional[str] = None,
+                oldest: Optional[str] = None, latest: Optional[str] = None) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self.lock:
+            msgs = [m for m in reversed(self.channels.get(channel, []))
+                    if (not oldest or float(m["ts"]) >= float(oldest)) and (not latest or float(m["ts"]) <= float(latest))]
+            start = int(cursor or 0)
+            page = msgs[start:start + limit]
+            for m in page:
+                self._maybe_unfurl(m, now)
+            nxt = str(start + limit) if start + limit < len(msgs) else ""
+            return {"ok": True, "messages": [_public(m) for m in page], "has_more": bool(nxt),
+                    "response_metadata": {"next_cursor": nxt}}
+
+    def delete(self, channel: str, ts: str) -> Dict[str, Any]:
+        with self.lock:
+            msgs = self.channels.get(channel, [])
+            for i, m in enumerate(msgs):
+                if m["ts"] == ts:
+                    del msgs[i]
+                    return {"ok": True, "channel": channel, "ts": ts}
+            return {"ok": False, "error": "message_not_found"}
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "calls": dict(self.stats["calls"]),
+                "ratelimited": dict(self.stats["ratelimited"]),
+                "messages": self.stats["messages"],
+                "urls_posted": self.stats["urls_posted"],
+                "unfurled": self.stats["unfurled"],
+                "early_reads": self.stats["early_reads"],
+                "wasted_wait_s": round(self.stats["wasted_wait_s"], 2),
+            }
+
+
+def _public(msg: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in msg.items() if not k.startswith("_")}
+
+
+def make_handler(fake: FakeSlack):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, payload: Dict[str, Any], code: int = 200, headers: Optional[Dict[str, str]] = None) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _args(self) -> Dict[str, Any]:
+            parts = urlsplit(self.path)
+            args = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if raw:
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    args.update(json.loads(raw))
+                else:
+                    args.update({k: v[-1] for k, v in parse_qs(raw.decode("utf-8")).items()})
+            return args
+
+        def _dispatch(self):
+            method = urlsplit(self.path).path.rstrip("/").rsplit("/", 1)[-1]
+            args = self._args()
+            token = (self.headers.get("Authorization") or "").replace("Bearer ", "") or args.get("token", "")
+            if not token:
+                return self._send({"ok": False, "error": "not_authed"})
+            channel = args.get("channel")
+            retry = fake.check_rate(method, token, channel)
+            if retry is not None:
+                return self._send({"ok": False, "error": "ratelimited"}, 429, {"Retry-After": str(int(retry + 0.999))})
+
+            if method == "chat.postMessage":
+                res = fake.post_message(token, channel, args.get("text", ""))
+            elif method == "conversations.replies":
+                res = fake.replies(channel, args.get("ts"))
+            elif method == "conversations.history":
+                res = fake.history(channel, int(args.get("limit") or 100), args.get("cursor"),
+                                   args.get("oldest"), args.get("latest"))
+            elif method == "chat.delete":
+                res = fake.delete(channel, args.get("ts"))
+            elif method == "auth.test":
+                res = {"ok": True, "user_id": "UFAKEBOT", "bot_id": "BFAKE", "team_id": "TFAKE"}
+            else:
+                res = {"ok": False, "error": "unknown_method"}
+            self._send(res)
+
+        do_GET = _dispatch
+        do_POST = _dispatch
+
+    return Handler
+
+
+def serve(fake: FakeSlack, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Arranca el servidor en un hilo daemon. `server.server_address` da el puerto real."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Servidor local que imita la Web API de Slack (unfurls).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--unfurl-delay", type=float, default=FAKE_SLACK_UNFURL_DELAY)
+    ap.add_argument("--jitter", type=float, default=FAKE_SLACK_JITTER)
+    ap.add_argument("--miss-rate", type=float, default=FAKE_SLACK_MISS_RATE)
+    ap.add_argument("--limit-scale", type=float, default=1.0, help="Multiplica los límites de los tiers")
+    ap.add_argument("--seed", type=int)
+    args = ap.parse_args()
+
+    fake = FakeSlack(unfurl_delay=args.unfurl_delay, jitter=args.jitter, miss_rate=args.miss_rate,
+                     limit_scale=args.limit_scale, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    print(f"🧪 Slack local en http://{args.host}:{args.port}/api/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 {fake.summary()}")
+
+
+if __name__ == "__main__":
+    main()
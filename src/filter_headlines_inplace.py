@@ -5,6 +5,9 @@ import pandas as pd
 import unicodedata, regex as re
 from pathlib import Path
 
+import profiling
+from working_store import load_frame, save_frame
+
 # =========================
 # CONFIG
 # =========================
@@ -173,6 +176,7 @@ def decide_keep(score, incl, excl, umbral=2.5):
 # =========================
 # Run
 # =========================
+@profiling.profiled("filter_headlines")
 def run():
     in_csv = CONFIG["input_csv"]
     out_csv = CONFIG["output_csv"]
@@ -180,20 +184,22 @@ def run():
     umbral = CONFIG["umbral"]
     include_bias = CONFIG["include_bias"]
 
-    df = pd.read_csv(in_csv)
+    with profiling.stage("load"):
+        df = load_frame(in_csv)  # CSV o Parquet según la extensión
     if col not in df.columns:
         raise SystemExit(f"No encuentro la columna '{col}' en {in_csv}")
 
     keep_list, scores, incl_hits, excl_hits, notes = [], [], [], [], []
 
-    for h in df[col].astype(str).fillna(""):
-        score, incl, excl, up, down, has_role = score_headline(h, include_bias=include_bias)
-        keep = decide_keep(score, incl, excl, umbral=umbral)
-        keep_list.append(keep)
-        scores.append(score)
-        incl_hits.append("; ".join([f"{t}({w})" for t, w in incl] + [f"{t}({w})" for t, w in up]))
-        excl_hits.append("; ".join([f"{t}({w})" for t, w in excl] + [f"{t}({w})" for t, w in down]))
-        notes.append("no_role" if (not has_role) else "")
+    with profiling.stage("score"):
+        for h in df[col].astype(str).fillna(""):
+            score, incl, excl, up, down, has_role = score_headline(h, include_bias=include_bias)
+            keep = decide_keep(score, incl, excl, umbral=umbral)
+            keep_list.append(keep)
+            scores.append(score)
+            incl_hits.append("; ".join([f"{t}({w})" for t, w in incl] + [f"{t}({w})" for t, w in up]))
+            excl_hits.append("; ".join([f"{t}({w})" for t, w in excl] + [f"{t}({w})" for t, w in down]))
+            notes.append("no_role" if (not has_role) else "")
 
     out = df.copy()
     out["keep"] = keep_list
@@ -202,8 +208,8 @@ def run():
     out["excl_hits"] = excl_hits
     out["notes"] = notes
 
-    Path(out_csv).parent.mkdir(parents=True, exist_ok=True)
-    out.to_csv(out_csv, index=False)
+    with profiling.stage("save"):
+        save_frame(out, Path(out_csv))
 
     kept = sum(keep_list)
     total = len(keep_list)
@@ -213,7 +219,7 @@ def run():
     if CONFIG.get("save_rejects_csv", False):
         rejects = out[~out["keep"]].copy()
         rpath = CONFIG.get("rejects_csv", "filtrado_rechazados.csv")
-        rejects.to_csv(rpath, index=False)
+        save_frame(rejects, Path(rpath))
         print(f"🗂️  Rechazados guardados en → {rpath}")
 
 if __name__ == "__main__":
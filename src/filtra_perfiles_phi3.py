@@ -4,6 +4,10 @@ import time
 import os
 import subprocess
 
+import metrics
+import profiling
+from working_store import load_frame, save_frame
+
 # ========== CONFIG ==========
 INPUT_FILE = r"data\data_for_test_llm.csv"
 OUTPUT_FILE = r"data\data_for_test_llm.csv"   # sobre el mismo
@@ -13,6 +17,8 @@ SAVE_EVERY = 5
 SLEEP_BETWEEN = 1
 # ============================
 
+LLM_SECONDS = metrics.histogram("latam_llm_request_seconds", "Latencia de las llamadas a Ollama", ["caller", "outcome"])
+
 EXCLUDE_TERMS = [
     "camarero", "camarera", "mesero", "ayudante de cocina", "cocinero", "cocinera",
     "chef", "barista", "barman", "bartender", "maître", "hostelería", "restauración",
@@ -53,6 +59,7 @@ Titular: "{headline}"
 Responde solo la palabra.
 """.strip()
 
+    t0 = time.perf_counter()
     try:
         result = subprocess.run(
             ["ollama", "run", MODEL, prompt],
@@ -64,27 +71,32 @@ Responde solo la palabra.
             timeout=90
         )
         text = (result.stdout or "").strip().lower()
+        LLM_SECONDS.observe(time.perf_counter() - t0, caller="filtra_phi3", outcome="ok")
         if "mantener" in text:
             return True
         return False
     except Exception as e:
+        LLM_SECONDS.observe(time.perf_counter() - t0, caller="filtra_phi3", outcome="error")
         print("⚠️ Error llamando a ollama por CLI:", e)
         return False
 
 
+@profiling.profiled("filtra_phi3")
 def main():
+    metrics.init_from_env("filtra_phi3")
     if not os.path.exists(INPUT_FILE):
         raise FileNotFoundError(f"No encontré el archivo {INPUT_FILE}")
 
-    df = pd.read_csv(INPUT_FILE)
+    df = load_frame(INPUT_FILE)  # CSV o Parquet según la extensión
     if "raw_headline" not in df.columns:
         raise ValueError("El CSV no tiene la columna 'raw_headline'")
 
     df = ensure_columns(df)
 
     # aplicar regex donde falte
-    mask_no_regex = df["descartado_regex"].isna()
-    df.loc[mask_no_regex, "descartado_regex"] = df.loc[mask_no_regex, "raw_headline"].apply(is_excluded)
+    with profiling.stage("regex"):
+        mask_no_regex = df["descartado_regex"].isna()
+        df.loc[mask_no_regex, "descartado_regex"] = df.loc[mask_no_regex, "raw_headline"].apply(is_excluded)
 
     # pendientes de LLM
     to_process_mask = (~df["descartado_regex"].astype(bool)) & (df["llm_relevante"].isna())
@@ -103,13 +115,15 @@ def main():
 
             for idx in batch_idx:
                 headline = df.at[idx, "raw_headline"]
-                llm_ok = query_ollama_cli(headline)
+                with profiling.stage("llm"):
+                    llm_ok = query_ollama_cli(headline)
                 df.at[idx, "llm_relevante"] = llm_ok
 
             lotes_procesados += 1
             if lotes_procesados % SAVE_EVERY == 0:
                 df["relevante_final"] = (~df["descartado_regex"].astype(bool)) & (df["llm_relevante"] == True)
-                df.to_csv(OUTPUT_FILE, index=False)
+                with profiling.stage("save"):
+                    save_frame(df, OUTPUT_FILE)
                 print(f"💾 Guardado parcial en {OUTPUT_FILE}")
 
             time.sleep(SLEEP_BETWEEN)
@@ -118,13 +132,13 @@ def main():
         # si lo paras con Ctrl+C, guardamos lo que haya
         print("\n⛔ Interrumpido por el usuario. Guardando progreso...")
         df["relevante_final"] = (~df["descartado_regex"].astype(bool)) & (df["llm_relevante"] == True)
-        df.to_csv(OUTPUT_FILE, index=False)
+        save_frame(df, OUTPUT_FILE)
         print(f"💾 Progreso guardado en {OUTPUT_FILE}")
         return
 
     # guardado final
     df["relevante_final"] = (~df["descartado_regex"].astype(bool)) & (df["llm_relevante"] == True)
-    df.to_csv(OUTPUT_FILE, index=False)
+    save_frame(df, OUTPUT_FILE)
 
     print("\n✅ Proceso terminado.")
     print(f"Relevantes finales: {df['relevante_final'].sum()} / {len(df)}")
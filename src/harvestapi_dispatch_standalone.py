@@ -2,42 +2,50 @@
 import os, time, json
 from datetime import datetime
 from typing import List, Dict, Any
-from urllib.parse import urlparse
 import requests
-from dotenv import load_dotenv
 
-load_dotenv()
+import config
+import metrics
+from linkedin_urls import canonical_key
+
+config.load_env()
 
 APIFY_TOKEN: str = os.getenv("APIFY_TOKEN")
 ACTOR_ID: str = os.getenv("APIFY_ACTOR_ID")
 PROFILE_SCRAPER_MODE: str = "Profile details no email ($4 per 1k)"
 
-APIFY_BASE = "https://api.apify.com/v2"
+APIFY_BASE = os.getenv("APIFY_BASE", "https://api.apify.com/v2").rstrip("/")   # fake_apify.py en local
+APIFY_POLL_INTERVAL = float(os.getenv("APIFY_POLL_INTERVAL", "10"))
 RUNS_ENDPOINT = f"/acts/{ACTOR_ID}/runs"
 
+APIFY_RUNS = metrics.counter("latam_apify_runs_total", "Runs del actor por estado final", ["status"])
+APIFY_RUN_SECONDS = metrics.histogram("latam_apify_run_seconds", "Duración de un run (lanzar → dataset)", ["status"])
+APIFY_URLS = metrics.counter("latam_apify_urls_total", "URLs por resultado de la reconciliación", ["outcome"])
+APIFY_ITEMS = metrics.counter("latam_apify_items_total", "Items leídos de los datasets")
+
 def normalize_linkedin_url(u: str) -> str:
-    u = (u or "").strip()
-    if not u: return u
-    u = u.split("#", 1)[0].strip()
-    p = urlparse(u)
-    scheme = (p.scheme or "https").lower()
-    netloc = (p.netloc or "").lower()
-    path = (p.path or "").rstrip("/")
-    if not netloc and path:
-        return u
-    return f"{scheme}://{netloc}{path}"
+    return canonical_key(u)
 
 def run_actor_async(token: str, body: Dict[str, Any]) -> str:
     r = requests.post(f"{APIFY_BASE}{RUNS_ENDPOINT}", params={"token": token}, json=body, timeout=(30, 60))
     r.raise_for_status()
     return (r.json().get("data") or {}).get("id")
 
-def poll_run(token: str, run_id: str, timeout_total=3600, interval=10) -> Dict[str, Any]:
+def get_run(token: str, run_id: str) -> Dict[str, Any]:
+    r = requests.get(f"{APIFY_BASE}/actor-runs/{run_id}", params={"token": token}, timeout=(30, 30))
+    r.raise_for_status()
+    return r.json().get("data") or {}
+
+def abort_run(token: str, run_id: str) -> None:
+    try:
+        requests.post(f"{APIFY_BASE}/actor-runs/{run_id}/abort", params={"token": token}, timeout=(30, 30))
+    except requests.RequestException as e:
+        print(f"⚠️ No se pudo abortar {run_id}: {e}")
+
+def poll_run(token: str, run_id: str, timeout_total=3600, interval=APIFY_POLL_INTERVAL) -> Dict[str, Any]:
     start = time.time()
     while True:
-        r = requests.get(f"{APIFY_BASE}/actor-runs/{run_id}", params={"token": token}, timeout=(30, 30))
-        r.raise_for_status()
-        data = r.json().get("data") or {}
+        data = get_run(token, run_id)
         st = data.get("status")
         print(f"🛰️ Run {run_id} => {st}")
         if st in {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}:
@@ -59,27 +67,122 @@ def fetch_dataset_items(token: str, ds_id: str) -> list:
                 except: pass
         return items
 
-# 🔸 función reutilizable: recibe URLs y devuelve items
-def harvest_for_urls(urls: List[str], token: str = None, mode: str = None) -> list:
+# ------------------ Reconciliación por URL ------------------
+def item_keys(it: Dict[str, Any]) -> set:
+    """Claves canónicas de todas las URLs con las que un item puede casar con lo enviado."""
+    q, oq = it.get("query") or {}, it.get("originalQuery") or {}
+    return {k for k in (canonical_key(u) for u in (it.get("linkedinUrl"), q.get("url"),
+                                                    q.get("profileId"), oq.get("url")) if u) if k}
+
+def is_inaccessible(it: Dict[str, Any]) -> bool:
+    """Solo un 403 es definitivo; cualquier otro error se trata como transitorio."""
+    return it.get("status") == 403
+
+def reconcile(urls: List[str], items: list) -> Dict[str, List[str]]:
+    """
+    Cruza las URLs enviadas con los items del dataset:
+    - covered: hay perfil extraído
+    - inaccessible: el actor devolvió 403
+    - missing: sin item o con error transitorio → se reencolan
+    """
+    ok, forbidden = set(), set()
+    for it in items or []:
+        if not isinstance(it, dict):
+            continue
+        if is_inaccessible(it):
+            forbidden |= item_keys(it)
+        elif it.get("publicIdentifier") and not it.get("error"):
+            ok |= item_keys(it)
+    out = {"covered": [], "inaccessible": [], "missing": []}
+    for u in urls:
+        k = canonical_key(u)
+        if k in ok:
+            out["covered"].append(u)
+        elif k in forbidden:
+            out["inaccessible"].append(u)
+        else:
+            out["missing"].append(u)
+    return out
+
+def harvest_run(urls: List[str], token: str = None, mode: str = None, known=None) -> Dict[str, Any]:
+    """
+    Lanza un run y devuelve su resultado reconciliado por URL:
+    {run_id, status, items, covered, inaccessible, missing}.
+    Si el run falla, se aborta o expira (o vence nuestro timeout de polling),
+    se recupera lo que haya en el dataset y solo lo no cubierto queda en `missing`.
+    """
     token = token or APIFY_TOKEN
     if not token or token == "PON_AQUI_TU_TOKEN":
         raise RuntimeError("Falta APIFY_TOKEN")
-    urls = [normalize_linkedin_url(u) for u in urls if u]
+    urls = [c for c in (normalize_linkedin_url(u) for u in urls if u) if c]
+    if known is not None:
+        urls, skipped = known.filter_new(urls)
+        if skipped:
+            print(f"🧹 {skipped} URLs ya conocidas/excluidas, no se envían al actor.")
+    result = {"run_id": None, "status": None, "items": [], "covered": [], "inaccessible": [], "missing": list(urls)}
+    if not urls:
+        result["status"] = "EMPTY"
+        return result
     body = {
         "profileScraperMode": mode or PROFILE_SCRAPER_MODE,
         "urls": urls
     }
-    run_id = run_actor_async(token, body)
+    t0 = time.perf_counter()
+    APIFY_URLS.inc(len(urls), outcome="submitted")
+    try:
+        run_id = run_actor_async(token, body)
+    except requests.RequestException as e:
+        print(f"❌ No se pudo lanzar el run: {e}")
+        result["status"] = "START-FAILED"
+        APIFY_RUNS.inc(status="START-FAILED")
+        APIFY_URLS.inc(len(urls), outcome="missing")
+        return result
+    result["run_id"] = run_id
     print(f"🚀 Lanzado run {run_id} (urls={len(urls)})")
-    run_data = poll_run(token, run_id)
-    print(f"📊 Run terminó: {run_data.get('status')}")
+    try:
+        run_data = poll_run(token, run_id)
+        status = run_data.get("status")
+    except (TimeoutError, requests.RequestException) as e:
+        print(f"⏱️ Polling interrumpido ({e}); se aborta el run y se recupera el dataset parcial.")
+        abort_run(token, run_id)
+        status = "POLL-TIMEOUT" if isinstance(e, TimeoutError) else "POLL-FAILED"
+        try:
+            run_data = get_run(token, run_id)
+        except requests.RequestException:
+            run_data = {}
+    print(f"📊 Run terminó: {status}")
     ds = run_data.get("defaultDatasetId")
-    return fetch_dataset_items(token, ds) if ds else []
+    try:
+        items = fetch_dataset_items(token, ds) if ds else []
+    except requests.RequestException as e:
+        print(f"⚠️ No se pudo leer el dataset {ds}: {e}")
+        items = []
+    if not isinstance(items, list):
+        items = []
+    result.update(status=status, items=items, **reconcile(urls, items))
+    APIFY_RUNS.inc(status=status)
+    APIFY_RUN_SECONDS.observe(time.perf_counter() - t0, status=status)
+    APIFY_ITEMS.inc(len(items))
+    for outcome in ("covered", "inaccessible", "missing"):
+        APIFY_URLS.inc(len(result[outcome]), outcome=outcome)
+    if status != "SUCCEEDED" or result["missing"]:
+        print(f"🩹 Run {run_id} ({status}): cubiertas={len(result['covered'])} "
+              f"403={len(result['inaccessible'])} pendientes={len(result['missing'])}")
+    return result
+
+# 🔸 función reutilizable: recibe URLs y devuelve items
+def harvest_for_urls(urls: List[str], token: str = None, mode: str = None, known=None) -> list:
+    return harvest_run(urls, token, mode, known)["items"]
 
 # CLI opcional (por compatibilidad)
-if __name__ == "__main__":
-    import sys, json
-    urls = [normalize_linkedin_url(u) for u in sys.argv[1:]]
-    items = harvest_for_urls(urls)
+def main(argv: List[str] = None) -> None:
+    import argparse
+    from known_profiles import build_known_filter
+    ap = argparse.ArgumentParser(description="Lanza el actor de Apify para las URLs dadas e imprime los items.")
+    ap.add_argument("urls", nargs="+", help="URLs de perfiles de LinkedIn")
+    urls = [normalize_linkedin_url(u) for u in ap.parse_args(argv).urls]
+    items = harvest_for_urls(urls, known=build_known_filter())
     print(json.dumps({"items": items}, ensure_ascii=False))
 
+if __name__ == "__main__":
+    main()
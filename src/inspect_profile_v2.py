@@ -28,6 +28,9 @@ import datetime as _dt
 import numpy as _np
 from decimal import Decimal
 
+import profiling
+from linkedin_urls import canonical_key
+
 load_dotenv()
 
 PG_HOST = os.getenv("PG_HOST")
@@ -43,12 +46,7 @@ def make_engine() -> Engine:
     return create_engine(uri, pool_pre_ping=True)
 
 def norm_url(u: str) -> str:
-    if not u:
-        return u
-    u = u.strip().split("#", 1)[0]
-    if u.endswith("/"):
-        u = u[:-1]
-    return u.lower()
+    return canonical_key(u) or u
 
 def get_profile_id_by_url(engine: Engine, url: str) -> Optional[int]:
     q = text("""
@@ -166,6 +164,18 @@ def fetch_skills(engine: Engine, pid: int) -> pd.DataFrame:
     return fetch_df(engine, sql, {"pid": pid})
 
 def fetch_coverage(engine: Engine, pid: int) -> pd.DataFrame:
+    # Primero la tabla resumen que mantiene la ingesta (lectura por PK), si ya existe
+    has_summary = fetch_df(engine, "SELECT to_regclass('public.profile_coverage') IS NOT NULL AS ok;", {}).iat[0, 0]
+    if has_summary:
+        sql = """
+        SELECT n_experiences, n_educations, n_languages, n_skills
+        FROM public.profile_coverage
+        WHERE profile_id = :pid;
+        """
+        df = fetch_df(engine, sql, {"pid": pid})
+        if not df.empty:
+            return df
+    # Perfil aún sin contadores (o tabla inexistente): conteo directo
     sql = """
     SELECT
       (SELECT COUNT(*) FROM public.experiences       e  WHERE e.profile_id = :pid) AS n_experiences,
@@ -228,6 +238,7 @@ def to_dossier(profile_df, exp_df, edu_df, lang_df, skill_df):
     }
     return dossier
 
+@profiling.profiled("inspect_profile")
 def main():
     ap = argparse.ArgumentParser(description="Inspecciona un perfil por profile_id o linkedin_url.")
     g = ap.add_mutually_exclusive_group(required=True)
@@ -246,12 +257,13 @@ def main():
             sys.exit(2)
 
     # Fetch
-    df_profile = fetch_profile(engine, pid)
-    df_exp = fetch_experiences(engine, pid)
-    df_edu = fetch_educations(engine, pid)
-    df_lang = fetch_languages(engine, pid)
-    df_skill = fetch_skills(engine, pid)
-    df_cov = fetch_coverage(engine, pid)
+    with profiling.stage("fetch"):
+        df_profile = fetch_profile(engine, pid)
+        df_exp = fetch_experiences(engine, pid)
+        df_edu = fetch_educations(engine, pid)
+        df_lang = fetch_languages(engine, pid)
+        df_skill = fetch_skills(engine, pid)
+        df_cov = fetch_coverage(engine, pid)
 
     # Pretty print
     pd.set_option("display.max_columns", None)
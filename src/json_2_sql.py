@@ -1,23 +1,62 @@
 # -*- coding: utf-8 -*-
-import json, psycopg2, re, unicodedata, traceback
-from datetime import date
-from typing import Iterable, Dict, Any, Optional, Tuple
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-DB = dict(
-    host=os.getenv("PG_HOST"),
-    port=int(os.getenv("PG_PORT")),
-    dbname=os.getenv("PG_DB"),
-    user=os.getenv("PG_USER"),
-    password=os.getenv("PG_PASSWORD"),
-    sslmode=os.getenv("PG_SSLMODE"),
-)
-SCHEMA = os.getenv("PG_SCHEMA")
+import hashlib, json, os, psycopg2, re, threading, time, unicodedata, traceback, zlib
+from datetime import date, datetime, timezone
+from typing import Iterable, Dict, Any, List, Optional, Tuple
+
+import metrics
+from config import PROJECT_ROOT, db_params, db_schema, env
+from linkedin_urls import canonical_key
+from migrate import CATALOG_LINK_MERGE, CATALOG_UNIQUE, PROFILE_HISTORY, SEARCH_INDEX, require as require_migration
+from profile_history import prepare_partitions, write_snapshots
+from profile_raw import ensure_raw_table, slim_payload, write_raw
+from talent_search import refresh_search
+
 COMMIT_EVERY = 50
 
+
+def ingest_workers() -> int:
+    return int(env("INGEST_WORKERS", "1"))
+
+
+def dead_letter_path() -> str:
+    return env("INGEST_DEAD_LETTER_PATH", str(PROJECT_ROOT / "data" / "apify_actor" / "dead_letter.jsonl"))
+
+
+def __getattr__(name):
+    # compatibilidad: `from json_2_sql import DB, SCHEMA` se resuelve al usarse, no al importar
+    if name == "DB":
+        return db_params()
+    if name == "SCHEMA":
+        return db_schema()
+    if name == "INGEST_WORKERS":
+        return ingest_workers()
+    if name == "DEAD_LETTER_PATH":
+        return dead_letter_path()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+DB_STATEMENTS = metrics.counter("latam_db_statements_total", "Sentencias SQL ejecutadas en la ingesta", ["op"])
+DB_STATEMENT_SECONDS = metrics.histogram("latam_db_statement_seconds", "Latencia por sentencia SQL", ["op"],
+                                         buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5))
+DB_ROWS_WRITTEN = metrics.counter("latam_db_rows_written_total", "Filas escritas por tabla", ["table"])
+PROFILES_INGESTED = metrics.counter("latam_profiles_ingested_total", "Perfiles upsertados desde items de Apify")
+POISONED = metrics.counter("latam_ingest_poisoned_total", "Items que fallaron en la ingesta y fueron al dead-letter")
+PROFILES_UNCHANGED = metrics.counter("latam_profiles_unchanged_total",
+                                     "Perfiles re-extraídos sin cambios en hijos (no se reescriben)")
+
+
+class MeteredCursor(psycopg2.extensions.cursor):
+    """Cursor que cuenta y cronometra cada sentencia (op = primera palabra del SQL)."""
+
+    def execute(self, query, vars=None):
+        op = query.lstrip().split(None, 1)[0].lower() if isinstance(query, str) and query.strip() else "other"
+        t0 = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            DB_STATEMENTS.inc(op=op)
+            DB_STATEMENT_SECONDS.observe(time.perf_counter() - t0, op=op)
+
 # -------- Normalizaciones --------
 MONTHS = {
     "january":1,"february":2,"march":3,"april":4,"may":5,"june":6,
@@ -67,12 +106,7 @@ def normalize_language_name(raw: Optional[str]) -> Optional[str]:
     return mapping.get(s_low, s_low)
 
 def normalize_linkedin_url(u: Optional[str]) -> Optional[str]:
-    if not u: return None
-    u = u.strip().split("#", 1)[0]
-    u = u.rstrip("/")
-    u = u.lower()
-    u = u.replace("www.public.com", "www.linkedin.com")
-    return u
+    return canonical_key(u)
 
 def parse_date(obj: Any) -> Optional[date]:
     """
@@ -106,6 +140,21 @@ def parse_date(obj: Any) -> Optional[date]:
     return None
 
 # -------- Helpers de catálogo con caches (evitan duplicados) --------
+# Un solo upsert por valor nuevo: los índices UNIQUE sobre lower(...) de migrate.py (migración 2)
+# resuelven las carreras entre ingestas concurrentes. El DO UPDATE es lo que hace que RETURNING
+# devuelva también la fila existente.
+_migrations_checked = False
+
+def ensure_migrated(cur):
+    """Índices únicos de catálogo (2), profile_search (3), catálogos sin link fusionados (4) e histórico (5)."""
+    global _migrations_checked
+    if not _migrations_checked:
+        require_migration(cur, CATALOG_UNIQUE)
+        require_migration(cur, SEARCH_INDEX)
+        require_migration(cur, CATALOG_LINK_MERGE)
+        require_migration(cur, PROFILE_HISTORY)
+        _migrations_checked = True
+
 def ensure_location(cur, cache, name):
     name = clean_text(name)
     if not name:
@@ -115,77 +164,65 @@ def ensure_location(cur, cache, name):
         return cache[key]
 
     cur.execute(f"""
-        SELECT location_id FROM {SCHEMA}.locations
-        WHERE LOWER(location_name)=LOWER(%s) LIMIT 1
-    """, (name,))
-    row = cur.fetchone()
-    if row:
-        cache[key] = row[0]; return row[0]
-
-    cur.execute(f"""
-        INSERT INTO {SCHEMA}.locations(location_name)
-        VALUES (%s) RETURNING location_id
+        INSERT INTO {db_schema()}.locations AS t (location_name)
+        VALUES (%s)
+        ON CONFLICT ((lower(location_name))) DO UPDATE SET location_name = t.location_name
+        RETURNING location_id
     """, (name,))
     lid = cur.fetchone()[0]
     cache[key] = lid
     return lid
 
+def _ensure_linked(cur, table, id_col, name_col, link_col, name, link, location_id):
+    """
+    Empresas y centros: la clave es el link si lo hay, si no el nombre (índice único de la
+    migración 2). Como la búsqueda por nombre original:
+    - sin link, si hay una única fila con link y el mismo nombre, es esa
+    - con link, una fila sin link con el mismo nombre lo hereda (si no hay ya otra con link)
+    """
+    s = db_schema()
+    if name != "(sin nombre)":
+        if not link:
+            cur.execute(f"""
+                SELECT {id_col} FROM {s}.{table}
+                WHERE lower({name_col}) = lower(%s) AND {link_col} IS NOT NULL LIMIT 2
+            """, (name,))
+            rows = cur.fetchall()
+            if len(rows) == 1:
+                if location_id is not None:
+                    cur.execute(f"UPDATE {s}.{table} SET location_id = COALESCE(location_id, %s) WHERE {id_col} = %s",
+                                (location_id, rows[0][0]))
+                return rows[0][0]
+        else:
+            cur.execute(f"""
+                UPDATE {s}.{table} SET {link_col} = %(link)s
+                WHERE {id_col} = (SELECT min({id_col}) FROM {s}.{table}
+                                  WHERE {link_col} IS NULL AND lower({name_col}) = lower(%(name)s))
+                  AND NOT EXISTS (SELECT 1 FROM {s}.{table}
+                                  WHERE lower(COALESCE({link_col}, {name_col})) = lower(%(link)s))
+                  AND NOT EXISTS (SELECT 1 FROM {s}.{table}
+                                  WHERE {link_col} IS NOT NULL AND lower({name_col}) = lower(%(name)s))
+            """, {"name": name, "link": link})
+
+    # Al reencontrar la clave se refresca el nombre (salvo el de relleno) y se completa la ubicación
+    cur.execute(f"""
+        INSERT INTO {s}.{table} AS t ({name_col}, {link_col}, location_id)
+        VALUES (%s,%s,%s)
+        ON CONFLICT ((lower(COALESCE({link_col}, {name_col})))) DO UPDATE
+          SET {name_col} = CASE WHEN EXCLUDED.{name_col} = '(sin nombre)' THEN t.{name_col}
+                                ELSE EXCLUDED.{name_col} END,
+              location_id = COALESCE(EXCLUDED.location_id, t.location_id)
+        RETURNING {id_col}
+    """, (name, link, location_id))
+    return cur.fetchone()[0]
+
 def ensure_company(cur, cache, name, link, location_id=None):
     name = clean_text(name) or "(sin nombre)"
     link = clean_text(link)
     key = (name.lower(), (link or "").lower() if link else "")
     if key in cache:
         return cache[key]
-
-    # 1) Si hay link, busca por link (case-insensitive)
-    if link:
-        cur.execute(f"""
-            SELECT company_id
-            FROM {SCHEMA}.companies
-            WHERE LOWER(company_link)=LOWER(%s)
-            LIMIT 1
-        """, (link,))
-        row = cur.fetchone()
-        if row:
-            cid = row[0]
-            # opcional: rellena campos vacíos si ahora tenemos más info
-            cur.execute(f"""
-                UPDATE {SCHEMA}.companies
-                SET company_name = COALESCE(NULLIF(%s,''), company_name),
-                    location_id  = COALESCE(%s, location_id)
-                WHERE company_id = %s
-            """, (name, location_id, cid))
-            cache[key] = cid
-            return cid
-
-    # 2) Sin link o no encontrado → intenta por nombre
-    cur.execute(f"""
-        SELECT company_id
-        FROM {SCHEMA}.companies
-        WHERE LOWER(company_name)=LOWER(%s)
-        LIMIT 1
-    """, (name,))
-    row = cur.fetchone()
-    if row:
-        cid = row[0]
-        # si ahora tenemos link y la fila no lo tenía, complétalo
-        if link:
-            cur.execute(f"""
-                UPDATE {SCHEMA}.companies
-                SET company_link = COALESCE(company_link, %s),
-                    location_id  = COALESCE(%s, location_id)
-                WHERE company_id = %s
-            """, (link, location_id, cid))
-        cache[key] = cid
-        return cid
-
-    # 3) No existe → inserta
-    cur.execute(f"""
-        INSERT INTO {SCHEMA}.companies (company_name, company_link, location_id)
-        VALUES (%s,%s,%s)
-        RETURNING company_id
-    """, (name, link, location_id))
-    cid = cur.fetchone()[0]
+    cid = _ensure_linked(cur, "companies", "company_id", "company_name", "company_link", name, link, location_id)
     cache[key] = cid
     return cid
 
@@ -196,54 +233,8 @@ def ensure_school(cur, cache, name, link, location_id=None):
     key = (name.lower(), (link or "").lower() if link else "")
     if key in cache:
         return cache[key]
-
-    # 1) Si hay link, busca por link
-    if link:
-        cur.execute(f"""
-            SELECT school_id
-            FROM {SCHEMA}.educational_institutions
-            WHERE LOWER(school_link)=LOWER(%s)
-            LIMIT 1
-        """, (link,))
-        row = cur.fetchone()
-        if row:
-            sid = row[0]
-            cur.execute(f"""
-                UPDATE {SCHEMA}.educational_institutions
-                SET school_name = COALESCE(NULLIF(%s,''), school_name),
-                    location_id = COALESCE(%s, location_id)
-                WHERE school_id = %s
-            """, (name, location_id, sid))
-            cache[key] = sid
-            return sid
-
-    # 2) Por nombre si no hay link o no se encontró
-    cur.execute(f"""
-        SELECT school_id
-        FROM {SCHEMA}.educational_institutions
-        WHERE LOWER(school_name)=LOWER(%s)
-        LIMIT 1
-    """, (name,))
-    row = cur.fetchone()
-    if row:
-        sid = row[0]
-        if link:
-            cur.execute(f"""
-                UPDATE {SCHEMA}.educational_institutions
-                SET school_link = COALESCE(school_link, %s),
-                    location_id = COALESCE(%s, location_id)
-                WHERE school_id = %s
-            """, (link, location_id, sid))
-        cache[key] = sid
-        return sid
-
-    # 3) Inserta
-    cur.execute(f"""
-        INSERT INTO {SCHEMA}.educational_institutions (school_name, school_link, location_id)
-        VALUES (%s,%s,%s)
-        RETURNING school_id
-    """, (name, link, location_id))
-    sid = cur.fetchone()[0]
+    sid = _ensure_linked(cur, "educational_institutions", "school_id", "school_name", "school_link",
+                         name, link, location_id)
     cache[key] = sid
     return sid
 
@@ -257,16 +248,10 @@ def ensure_language(cur, cache, lang):
         return cache[key]
 
     cur.execute(f"""
-        SELECT lang_id FROM {SCHEMA}.languages
-        WHERE LOWER(language)=LOWER(%s) LIMIT 1
-    """, (lang,))
-    row = cur.fetchone()
-    if row:
-        cache[key] = row[0]; return row[0]
-
-    cur.execute(f"""
-        INSERT INTO {SCHEMA}.languages(language)
-        VALUES (%s) RETURNING lang_id
+        INSERT INTO {db_schema()}.languages AS t (language)
+        VALUES (%s)
+        ON CONFLICT ((lower(language))) DO UPDATE SET language = t.language
+        RETURNING lang_id
     """, (lang,))
     lid = cur.fetchone()[0]
     cache[key] = lid
@@ -281,158 +266,434 @@ def ensure_skill(cur, cache, skill):
         return cache[key]
 
     cur.execute(f"""
-        SELECT skill_id FROM {SCHEMA}.skills
-        WHERE LOWER(skill_name)=LOWER(%s) LIMIT 1
-    """, (skill,))
-    row = cur.fetchone()
-    if row:
-        cache[key] = row[0]; return row[0]
-
-    cur.execute(f"""
-        INSERT INTO {SCHEMA}.skills(skill_name)
-        VALUES (%s) RETURNING skill_id
+        INSERT INTO {db_schema()}.skills AS t (skill_name)
+        VALUES (%s)
+        ON CONFLICT ((lower(skill_name))) DO UPDATE SET skill_name = t.skill_name
+        RETURNING skill_id
     """, (skill,))
     sid = cur.fetchone()[0]
     cache[key] = sid
     return sid
 
-# -------- Borrado de hijos (para refresh) --------
-def delete_children_for_profile(cur, profile_id: int):
-    cur.execute(f'DELETE FROM {SCHEMA}.profile_skills WHERE profile_id=%s', (profile_id,))
-    cur.execute(f'DELETE FROM {SCHEMA}.profile_languages WHERE profile_id=%s', (profile_id,))
-    cur.execute(f'DELETE FROM {SCHEMA}.educations WHERE profile_id=%s', (profile_id,))
-    cur.execute(f'DELETE FROM {SCHEMA}.experiences WHERE profile_id=%s', (profile_id,))
+# -------- Cobertura por perfil (contadores mantenidos en ingesta) --------
+_coverage_ready = False
 
-# -------- Upsert principal desde items --------
-def update_from_items(cur, items: Iterable[Dict[str, Any]], refresh_children: bool = True) -> int:
-    loc_cache, comp_cache, school_cache, lang_cache, skill_cache = {}, {}, {}, {}, {}
-    total = 0
-    for p in items or []:
-        linkedin_url      = normalize_linkedin_url(p.get("linkedinUrl"))
-        if not linkedin_url:
-            continue
-        public_identifier = norm_txt(p.get("publicIdentifier"))
-        first_name        = norm_txt(p.get("firstName"))
-        last_name         = norm_txt(p.get("lastName"))
-        headline          = norm_txt(p.get("headline"))
-        about             = norm_txt(p.get("about"))
-        connections       = p.get("connectionsCount")
-        followers         = p.get("followerCount")
-
-        loc_name = first_non_empty(
-            (p.get("location") or {}).get("parsed", {}).get("text"),
-            (p.get("location") or {}).get("linkedinText")
+def ensure_coverage_table(cur):
+    """Crea (una vez por proceso) la tabla resumen de cobertura por perfil."""
+    global _coverage_ready
+    if _coverage_ready:
+        return
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {db_schema()}.profile_coverage (
+            profile_id    integer PRIMARY KEY REFERENCES {db_schema()}.profiles(profile_id) ON DELETE CASCADE,
+            n_experiences integer NOT NULL DEFAULT 0,
+            n_educations  integer NOT NULL DEFAULT 0,
+            n_languages   integer NOT NULL DEFAULT 0,
+            n_skills      integer NOT NULL DEFAULT 0,
+            updated_at    timestamptz NOT NULL DEFAULT now()
         )
-        location_id = ensure_location(cur, loc_cache, loc_name) if loc_name else None
+    """)
+    _coverage_ready = True
 
-        # UPSERT de profile por linkedin_url
+def upsert_coverage(cur, profile_id: int, counts: Dict[str, int], replace: bool = True):
+    """
+    replace=True  → los hijos se acaban de reescribir: los contadores son absolutos.
+    replace=False → solo se han añadido hijos: se suman como delta.
+    """
+    vals = (profile_id, counts["n_experiences"], counts["n_educations"],
+            counts["n_languages"], counts["n_skills"])
+    if replace:
         cur.execute(f"""
-            INSERT INTO {SCHEMA}.profiles
-                (public_identifier, linkedin_url, first_name, last_name, headline, about,
-                 connections, followers, location_id)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            ON CONFLICT (linkedin_url) DO UPDATE
-              SET public_identifier = COALESCE(EXCLUDED.public_identifier, {SCHEMA}.profiles.public_identifier),
-                  first_name = COALESCE(EXCLUDED.first_name, {SCHEMA}.profiles.first_name),
-                  last_name  = COALESCE(EXCLUDED.last_name,  {SCHEMA}.profiles.last_name),
-                  headline   = COALESCE(EXCLUDED.headline,   {SCHEMA}.profiles.headline),
-                  about      = COALESCE(EXCLUDED.about,      {SCHEMA}.profiles.about),
-                  connections= COALESCE(EXCLUDED.connections,{SCHEMA}.profiles.connections),
-                  followers  = COALESCE(EXCLUDED.followers,  {SCHEMA}.profiles.followers),
-                  location_id= COALESCE(EXCLUDED.location_id, {SCHEMA}.profiles.location_id)
-            RETURNING profile_id
-        """, (public_identifier, linkedin_url, first_name, last_name, headline, about,
-              connections, followers, location_id))
-        row = cur.fetchone()
-        if not row:
-            cur.execute(f"SELECT profile_id FROM {SCHEMA}.profiles WHERE linkedin_url=%s LIMIT 1",(linkedin_url,))
-            row = cur.fetchone()
-        profile_id = row[0]
+            INSERT INTO {db_schema()}.profile_coverage
+                (profile_id, n_experiences, n_educations, n_languages, n_skills)
+            VALUES (%s,%s,%s,%s,%s)
+            ON CONFLICT (profile_id) DO UPDATE
+              SET n_experiences = EXCLUDED.n_experiences,
+                  n_educations  = EXCLUDED.n_educations,
+                  n_languages   = EXCLUDED.n_languages,
+                  n_skills      = EXCLUDED.n_skills,
+                  updated_at    = now()
+        """, vals)
+    else:
+        cur.execute(f"""
+            INSERT INTO {db_schema()}.profile_coverage AS pc
+                (profile_id, n_experiences, n_educations, n_languages, n_skills)
+            VALUES (%s,%s,%s,%s,%s)
+            ON CONFLICT (profile_id) DO UPDATE
+              SET n_experiences = pc.n_experiences + EXCLUDED.n_experiences,
+                  n_educations  = pc.n_educations  + EXCLUDED.n_educations,
+                  n_languages   = pc.n_languages   + EXCLUDED.n_languages,
+                  n_skills      = pc.n_skills      + EXCLUDED.n_skills,
+                  updated_at    = now()
+        """, vals)
+
+# -------- Frescura y hash del payload --------
+# Secciones que se vuelcan a tablas hijas: si su hash no cambia, un refresh no las reescribe
+HASHED_SECTIONS = ("experience", "education", "languages", "skills")
+_scrape_cols_ready = False
+
+def ensure_scrape_columns(cur):
+    """profiles.last_scraped_at y profiles.payload_hash (una vez por proceso, DDL solo si faltan)."""
+    global _scrape_cols_ready
+    if _scrape_cols_ready:
+        return
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema=%s AND table_name='profiles' AND column_name IN ('last_scraped_at', 'payload_hash')
+    """, (db_schema(),))
+    have = {r[0] for r in cur.fetchall()}
+    if "last_scraped_at" not in have:
+        cur.execute(f"ALTER TABLE {db_schema()}.profiles ADD COLUMN IF NOT EXISTS last_scraped_at timestamptz")
+    if "payload_hash" not in have:
+        cur.execute(f"ALTER TABLE {db_schema()}.profiles ADD COLUMN IF NOT EXISTS payload_hash text")
+    _scrape_cols_ready = True
+
+def payload_hash(p: Dict[str, Any]) -> str:
+    body = json.dumps({k: p.get(k) for k in HASHED_SECTIONS}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+# -------- Borrado de hijos (para refresh) --------
+def delete_children_for_profile(cur, profile_id: int):
+    cur.execute(f'DELETE FROM {db_schema()}.profile_skills WHERE profile_id=%s', (profile_id,))
+    cur.execute(f'DELETE FROM {db_schema()}.profile_languages WHERE profile_id=%s', (profile_id,))
+    cur.execute(f'DELETE FROM {db_schema()}.educations WHERE profile_id=%s', (profile_id,))
+    cur.execute(f'DELETE FROM {db_schema()}.experiences WHERE profile_id=%s', (profile_id,))
+
+# -------- Escrituras por lotes: payload bruto (profile_raw.py) e histórico (profile_history.py) --------
+def new_pending() -> Dict[str, list]:
+    # items: (profile_id, item) para mandar al dead-letter lo que falle al escribir
+    return {"raw": [], "snapshots": [], "search": [], "items": []}
+
+def _write_pending(cur, pending: Dict[str, list]) -> None:
+    if pending["raw"]:
+        DB_ROWS_WRITTEN.inc(write_raw(cur, pending["raw"]), table="profile_raw")
+    if pending["snapshots"]:
+        DB_ROWS_WRITTEN.inc(write_snapshots(cur, pending["snapshots"]), table="profile_snapshots")
+    if pending["search"]:
+        # al final: el documento de búsqueda se arma con los hijos ya escritos
+        DB_ROWS_WRITTEN.inc(refresh_search(cur, sorted(set(pending["search"]))), table="profile_search")
+
+def flush_pending(cur, pending: Dict[str, list], dead: Optional[List[str]] = None) -> int:
+    """
+    Escribe de una vez lo acumulado desde el último commit, dentro de un SAVEPOINT. Si el lote
+    falla (p.ej. un payload que jsonb rechaza) se repite perfil a perfil y los que sigan fallando
+    van al dead-letter sin tumbar el resto. Devuelve cuántos perfiles fallaron.
+    """
+    cur.execute("SAVEPOINT flush_pending")
+    try:
+        _write_pending(cur, pending)
+        cur.execute("RELEASE SAVEPOINT flush_pending")
+        failed = 0
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        raise
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT flush_pending")
+        failed = _flush_one_by_one(cur, pending, dead)
+    for buf in pending.values():
+        buf.clear()
+    return failed
+
+def _flush_one_by_one(cur, pending: Dict[str, list], dead: Optional[List[str]]) -> int:
+    items = dict(pending["items"])
+    failed = 0
+    for pid, p in items.items():
+        one = {"raw": [r for r in pending["raw"] if r[0] == pid],
+               "snapshots": [r for r in pending["snapshots"] if r[0] == pid],
+               "search": [x for x in pending["search"] if x == pid]}
+        cur.execute("SAVEPOINT flush_item")
+        try:
+            _write_pending(cur, one)
+            cur.execute("RELEASE SAVEPOINT flush_item")
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            raise
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT flush_item")
+            # el perfil queda en profiles pero sin payload/histórico/búsqueda: se reingesta con --replay-dead-letter
+            write_dead_letter(p, e)
+            POISONED.inc()
+            failed += 1
+            url = normalize_linkedin_url(p.get("linkedinUrl"))
+            if dead is not None and url:
+                dead.append(url)
+    return failed
 
-        if refresh_children:
-            delete_children_for_profile(cur, profile_id)
+# -------- Upsert principal desde items --------
+def company_link_of(e: Dict[str, Any]) -> Optional[str]:
+    link = norm_txt(e.get("companyLinkedinUrl"))
+    return link if link and "/company/" in link else None
 
-        # EXPERIENCES
-        for e in (p.get("experience") or []):
-            company_name = norm_txt(e.get("companyName"))
-            company_link = norm_txt(e.get("companyLinkedinUrl"))
-            if company_link and "/company/" not in company_link:
-                company_link = None
-            exp_loc_name = norm_txt(e.get("location"))
-            exp_location_id = ensure_location(cur, loc_cache, exp_loc_name) if exp_loc_name else None
-            company_id = ensure_company(cur, comp_cache, company_name, company_link, None)
-
-            title = norm_txt(e.get("position"))
-            description = norm_txt(e.get("description"))
-            start_date = parse_date(e.get("startDate"))
-            end_date   = parse_date(e.get("endDate"))
-            if start_date and end_date and end_date < start_date:
-                end_date = start_date
+def new_caches() -> Dict[str, dict]:
+    return {"loc": {}, "comp": {}, "school": {}, "lang": {}, "skill": {}}
 
-            cur.execute(f"""
-                INSERT INTO {SCHEMA}.experiences
-                    (profile_id, company_id, title, description, start_date, end_date, location_id)
-                VALUES (%s,%s,%s,%s,%s,%s,%s)
-            """, (profile_id, company_id, title, description, start_date, end_date, exp_location_id))
-
-            for sk in (e.get("skills") or []):
-                sid = ensure_skill(cur, skill_cache, norm_txt(sk))
-                if sid:
-                    cur.execute(f"""
-                        INSERT INTO {SCHEMA}.profile_skills (profile_id, skill_id)
-                        VALUES (%s,%s) ON CONFLICT DO NOTHING
-                    """, (profile_id, sid))
-
-        # EDUCATIONS
+def warm_catalogs(cur, items: Iterable[Dict[str, Any]], caches: Dict[str, dict]) -> int:
+    """
+    Resuelve de antemano todos los valores de catálogo de `items`, en orden fijo y en una sola
+    transacción: después ninguna ingesta concurrente toca filas de catálogo (todo son aciertos de
+    caché), así que no hay esperas ni deadlocks entre shards. Devuelve cuántos valores resolvió.
+    """
+    locs, comps, schools, langs, skills = set(), set(), set(), set(), set()
+    for p in items:
+        loc = p.get("location") or {}
+        locs.add(first_non_empty(loc.get("parsed", {}).get("text"), loc.get("linkedinText")))
+        for e in (p.get("experience") or []):
+            locs.add(norm_txt(e.get("location")))
+            comps.add((norm_txt(e.get("companyName")) or "", company_link_of(e) or ""))
+            skills.update(norm_txt(sk) for sk in (e.get("skills") or []))
         for ed in (p.get("education") or []):
-            school_name = norm_txt(ed.get("schoolName"))
-            school_link = norm_txt(ed.get("schoolLinkedinUrl"))
-            school_id = ensure_school(cur, school_cache, school_name, school_link, None)
-            title = " ".join([t for t in [norm_txt(ed.get("degree")), norm_txt(ed.get("fieldOfStudy"))] if t])
-            start_date = parse_date(ed.get("startDate"))
-            end_date   = parse_date(ed.get("endDate"))
-            if start_date and end_date and end_date < start_date:
-                end_date = start_date
-            cur.execute(f"""
-                INSERT INTO {SCHEMA}.educations
-                    (profile_id, school_id, title, description, start_date, end_date, location_id)
-                VALUES (%s,%s,%s,%s,%s,%s,NULL)
-            """, (profile_id, school_id, title, None, start_date, end_date))
-
-        # LANGUAGES
-        for lg in (p.get("languages") or []):
-            lname = normalize_language_name(lg.get("name"))
-            level = norm_txt(lg.get("proficiency"))
-            lid = ensure_language(cur, lang_cache, lname)
-            if lid:
-                cur.execute(f"""
-                    INSERT INTO {SCHEMA}.profile_languages (profile_id, lang_id, level)
-                    VALUES (%s,%s,%s)
-                    ON CONFLICT (profile_id, lang_id) DO UPDATE SET level = EXCLUDED.level
-                """, (profile_id, lid, level))
-
-        # SKILLS del perfil
-        for s in (p.get("skills") or []):
-            sname = norm_txt(s.get("name"))
-            sid = ensure_skill(cur, skill_cache, sname)
+            schools.add((norm_txt(ed.get("schoolName")) or "", norm_txt(ed.get("schoolLinkedinUrl")) or ""))
+        langs.update(lg.get("name") for lg in (p.get("languages") or []))
+        skills.update(norm_txt(sk.get("name")) for sk in (p.get("skills") or []))
+    n = 0
+    for name in sorted(x for x in locs if x):
+        n += ensure_location(cur, caches["loc"], name) is not None
+    for name, link in sorted(comps):
+        n += ensure_company(cur, caches["comp"], name or None, link or None, None) is not None
+    for name, link in sorted(schools):
+        n += ensure_school(cur, caches["school"], name or None, link or None, None) is not None
+    for lang in sorted(x for x in langs if x):
+        n += ensure_language(cur, caches["lang"], lang) is not None
+    for name in sorted(x for x in skills if x):
+        n += ensure_skill(cur, caches["skill"], name) is not None
+    return n
+
+# -------- Dead-letter (items que no se pudieron ingerir) --------
+_dead_lock = threading.Lock()
+
+def write_dead_letter(item: Dict[str, Any], exc: BaseException, path: Optional[str] = None) -> None:
+    """Una línea JSON por item fallido: el item completo, el error y el traceback (para reingestar)."""
+    path = path or dead_letter_path()
+    rec = {
+        "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "linkedinUrl": item.get("linkedinUrl") if isinstance(item, dict) else None,
+        "error": f"{type(exc).__name__}: {exc}",
+        "traceback": "".join(traceback.format_exception(type(exc), exc, exc.__traceback__)),
+        "item": item,
+    }
+    line = json.dumps(rec, ensure_ascii=False, default=str)
+    with _dead_lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+def read_dead_letter(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    path = path or dead_letter_path()
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(l) for l in fh if l.strip()]
+
+def forget_new_cache_entries(caches: Dict[str, dict], marks: Dict[str, int]) -> None:
+    """Tras un ROLLBACK TO SAVEPOINT, los ids de catálogo creados en él ya no existen: fuera de la caché."""
+    for k, c in caches.items():
+        extra = len(c) - marks[k]
+        if extra > 0:
+            for key in list(c)[-extra:]:
+                c.pop(key, None)
+
+def _upsert_profile(cur, p: Dict[str, Any], refresh_children: bool, caches: Dict[str, dict],
+                    pending: Dict[str, list]) -> bool:
+    """Un item → profiles + hijos + cobertura. False si el item no trae URL de LinkedIn."""
+    loc_cache, comp_cache, school_cache = caches["loc"], caches["comp"], caches["school"]
+    lang_cache, skill_cache = caches["lang"], caches["skill"]
+    linkedin_url      = normalize_linkedin_url(p.get("linkedinUrl"))
+    if not linkedin_url:
+        return False
+    public_identifier = norm_txt(p.get("publicIdentifier"))
+    first_name        = norm_txt(p.get("firstName"))
+    last_name         = norm_txt(p.get("lastName"))
+    headline          = norm_txt(p.get("headline"))
+    about             = norm_txt(p.get("about"))
+    connections       = p.get("connectionsCount")
+    followers         = p.get("followerCount")
+
+    loc_name = first_non_empty(
+        (p.get("location") or {}).get("parsed", {}).get("text"),
+        (p.get("location") or {}).get("linkedinText")
+    )
+    location_id = ensure_location(cur, loc_cache, loc_name) if loc_name else None
+
+    # UPSERT de profile por linkedin_url (el CTE lee el hash anterior antes de pisarlo)
+    phash = payload_hash(p)
+    cur.execute(f"""
+        WITH prev AS (SELECT payload_hash FROM {db_schema()}.profiles WHERE linkedin_url=%s)
+        INSERT INTO {db_schema()}.profiles
+            (public_identifier, linkedin_url, first_name, last_name, headline, about,
+             connections, followers, location_id, last_scraped_at, payload_hash)
+        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,now(),%s)
+        ON CONFLICT (linkedin_url) DO UPDATE
+          SET public_identifier = COALESCE(EXCLUDED.public_identifier, {db_schema()}.profiles.public_identifier),
+              first_name = COALESCE(EXCLUDED.first_name, {db_schema()}.profiles.first_name),
+              last_name  = COALESCE(EXCLUDED.last_name,  {db_schema()}.profiles.last_name),
+              headline   = COALESCE(EXCLUDED.headline,   {db_schema()}.profiles.headline),
+              about      = COALESCE(EXCLUDED.about,      {db_schema()}.profiles.about),
+              connections= COALESCE(EXCLUDED.connections,{db_schema()}.profiles.connections),
+              followers  = COALESCE(EXCLUDED.followers,  {db_schema()}.profiles.followers),
+              location_id= COALESCE(EXCLUDED.location_id, {db_schema()}.profiles.location_id),
+              last_scraped_at = EXCLUDED.last_scraped_at,
+              payload_hash = EXCLUDED.payload_hash
+        RETURNING profile_id, (SELECT payload_hash FROM prev)
+    """, (linkedin_url, public_identifier, linkedin_url, first_name, last_name, headline, about,
+          connections, followers, location_id, phash))
+    row = cur.fetchone()
+    if not row:
+        cur.execute(f"SELECT profile_id, NULL FROM {db_schema()}.profiles WHERE linkedin_url=%s LIMIT 1",(linkedin_url,))
+        row = cur.fetchone()
+    profile_id, prev_hash = row
+    pending["raw"].append((profile_id, slim_payload(p)))
+    pending["snapshots"].append((profile_id, datetime.now(timezone.utc), "apify", followers, connections, headline))
+    pending["search"].append(profile_id)
+    pending["items"].append((profile_id, p))
+
+    PROFILES_INGESTED.inc()
+    DB_ROWS_WRITTEN.inc(table="profiles")
+    if prev_hash == phash:
+        # Refresh sin cambios en experiencia/educación/idiomas/skills: basta con el upsert de arriba
+        PROFILES_UNCHANGED.inc()
+        return True
+
+    if refresh_children:
+        delete_children_for_profile(cur, profile_id)
+    counts = {"n_experiences": 0, "n_educations": 0, "n_languages": 0, "n_skills": 0}
+
+    # EXPERIENCES
+    for e in (p.get("experience") or []):
+        company_name = norm_txt(e.get("companyName"))
+        company_link = company_link_of(e)
+        exp_loc_name = norm_txt(e.get("location"))
+        exp_location_id = ensure_location(cur, loc_cache, exp_loc_name) if exp_loc_name else None
+        company_id = ensure_company(cur, comp_cache, company_name, company_link, None)
+
+        title = norm_txt(e.get("position"))
+        description = norm_txt(e.get("description"))
+        start_date = parse_date(e.get("startDate"))
+        end_date   = parse_date(e.get("endDate"))
+        if start_date and end_date and end_date < start_date:
+            end_date = start_date
+
+        cur.execute(f"""
+            INSERT INTO {db_schema()}.experiences
+                (profile_id, company_id, title, description, start_date, end_date, location_id)
+            VALUES (%s,%s,%s,%s,%s,%s,%s)
+        """, (profile_id, company_id, title, description, start_date, end_date, exp_location_id))
+        counts["n_experiences"] += 1
+
+        for sk in (e.get("skills") or []):
+            sid = ensure_skill(cur, skill_cache, norm_txt(sk))
             if sid:
                 cur.execute(f"""
-                    INSERT INTO {SCHEMA}.profile_skills (profile_id, skill_id)
+                    INSERT INTO {db_schema()}.profile_skills (profile_id, skill_id)
                     VALUES (%s,%s) ON CONFLICT DO NOTHING
                 """, (profile_id, sid))
+                counts["n_skills"] += cur.rowcount
+
+    # EDUCATIONS
+    for ed in (p.get("education") or []):
+        school_name = norm_txt(ed.get("schoolName"))
+        school_link = norm_txt(ed.get("schoolLinkedinUrl"))
+        school_id = ensure_school(cur, school_cache, school_name, school_link, None)
+        title = " ".join([t for t in [norm_txt(ed.get("degree")), norm_txt(ed.get("fieldOfStudy"))] if t])
+        start_date = parse_date(ed.get("startDate"))
+        end_date   = parse_date(ed.get("endDate"))
+        if start_date and end_date and end_date < start_date:
+            end_date = start_date
+        cur.execute(f"""
+            INSERT INTO {db_schema()}.educations
+                (profile_id, school_id, title, description, start_date, end_date, location_id)
+            VALUES (%s,%s,%s,%s,%s,%s,NULL)
+        """, (profile_id, school_id, title, None, start_date, end_date))
+        counts["n_educations"] += 1
+
+    # LANGUAGES
+    for lg in (p.get("languages") or []):
+        lname = normalize_language_name(lg.get("name"))
+        level = norm_txt(lg.get("proficiency"))
+        lid = ensure_language(cur, lang_cache, lname)
+        if lid:
+            cur.execute(f"""
+                INSERT INTO {db_schema()}.profile_languages (profile_id, lang_id, level)
+                VALUES (%s,%s,%s)
+                ON CONFLICT (profile_id, lang_id) DO UPDATE SET level = EXCLUDED.level
+                RETURNING (xmax = 0)
+            """, (profile_id, lid, level))
+            if cur.fetchone()[0]:  # True solo si la fila es nueva
+                counts["n_languages"] += 1
+
+    # SKILLS del perfil
+    for s in (p.get("skills") or []):
+        sname = norm_txt(s.get("name"))
+        sid = ensure_skill(cur, skill_cache, sname)
+        if sid:
+            cur.execute(f"""
+                INSERT INTO {db_schema()}.profile_skills (profile_id, skill_id)
+                VALUES (%s,%s) ON CONFLICT DO NOTHING
+            """, (profile_id, sid))
+            counts["n_skills"] += cur.rowcount
+
+    upsert_coverage(cur, profile_id, counts, replace=refresh_children)
+    for table, key in (("experiences", "n_experiences"), ("educations", "n_educations"),
+                       ("profile_languages", "n_languages"), ("profile_skills", "n_skills")):
+        DB_ROWS_WRITTEN.inc(counts[key], table=table)
+    return True
+
+
+def update_from_items(cur, items: Iterable[Dict[str, Any]], refresh_children: bool = True,
+                      caches: Optional[Dict[str, dict]] = None, commit_every: int = COMMIT_EVERY,
+                      dead: Optional[List[str]] = None) -> int:
+    """
+    Cada perfil va en su SAVEPOINT: si un item revienta se deshace solo ese perfil, el item y el
+    traceback van al dead-letter y el lote sigue. `dead` recoge las URLs canónicas envenenadas.
+    """
+    caches = caches if caches is not None else new_caches()
+    total = poisoned = 0
+    pending = new_pending()    # payloads y snapshots pendientes de escribir hasta el próximo commit
+    ensure_migrated(cur)
+    ensure_coverage_table(cur)
+    ensure_scrape_columns(cur)
+    ensure_raw_table(cur)
+    for p in items or []:
+        marks = {k: len(c) for k, c in caches.items()}
+        n_pending = {k: len(buf) for k, buf in pending.items()}
+        cur.execute("SAVEPOINT profile_item")
+        try:
+            ok = _upsert_profile(cur, p, refresh_children, caches, pending)
+            cur.execute("RELEASE SAVEPOINT profile_item")
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            raise                       # conexión caída: no es culpa del item
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT profile_item")
+            forget_new_cache_entries(caches, marks)
+            for k, buf in pending.items():
+                del buf[n_pending[k]:]
+            write_dead_letter(p, e)
+            POISONED.inc()
+            poisoned += 1
+            url = normalize_linkedin_url(p.get("linkedinUrl"))
+            if dead is not None and url:
+                dead.append(url)
+            continue
+        if not ok:
+            continue
 
         total += 1
-        if total % COMMIT_EVERY == 0:
+        if total % commit_every == 0:
+            poisoned += flush_pending(cur, pending, dead)
             cur.connection.commit()
             print(f"Committed {total} perfiles...")
+    poisoned += flush_pending(cur, pending, dead)
+    if poisoned:
+        print(f"☠️ {poisoned} items envenenados → {dead_letter_path()} (el resto del lote sigue)")
     return total
 
-def update_items_in_db(items: Iterable[Dict[str, Any]], refresh_children=True) -> int:
-    conn = psycopg2.connect(**DB)
+def update_items_in_db(items: Iterable[Dict[str, Any]], refresh_children=True,
+                       caches: Optional[Dict[str, dict]] = None, commit_every: int = COMMIT_EVERY,
+                       dead: Optional[List[str]] = None) -> int:
+    conn = psycopg2.connect(**db_params())
     conn.autocommit = False
-    cur = conn.cursor()
+    cur = conn.cursor(cursor_factory=MeteredCursor)
     try:
-        n = update_from_items(cur, items, refresh_children=refresh_children)
+        prepare_partitions(conn)    # fuera del lote: un rollback del lote no se lleva la partición
+        n = update_from_items(cur, items, refresh_children=refresh_children, caches=caches,
+                              commit_every=commit_every, dead=dead)
         conn.commit()
         return n
     except Exception:
@@ -442,3 +703,130 @@ def update_items_in_db(items: Iterable[Dict[str, Any]], refresh_children=True) -
         raise
     finally:
         cur.close(); conn.close()
+
+
+def shard_of(item: Dict[str, Any], workers: int) -> int:
+    """Shard estable por perfil: todas las versiones de un perfil van, en orden, al mismo worker."""
+    key = normalize_linkedin_url(item.get("linkedinUrl")) or ""
+    return zlib.crc32(key.encode("utf-8")) % workers
+
+
+def update_items_parallel(items: List[Dict[str, Any]], workers: Optional[int] = None, refresh_children=True,
+                          commit_every: int = COMMIT_EVERY, dead: Optional[List[str]] = None) -> int:
+    """
+    Ingesta repartida en `workers` conexiones. Primero se calientan los catálogos en serie
+    (warm_catalogs); después cada shard hace su update_from_items con su conexión y commits
+    cada `commit_every` perfiles. Los shards no comparten perfiles ni tocan filas de catálogo,
+    así que el resultado es el de la ingesta en serie.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = ingest_workers() if workers is None else workers
+    if workers <= 1 or len(items) <= commit_every:
+        return update_items_in_db(items, refresh_children, commit_every=commit_every, dead=dead)
+
+    caches = new_caches()
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor(cursor_factory=MeteredCursor) as cur:
+            ensure_migrated(cur)
+            n_cat = warm_catalogs(cur, items, caches)
+            # DDL perezoso una sola vez, antes de que los shards lo comprueben a la vez
+            ensure_coverage_table(cur); ensure_scrape_columns(cur); ensure_raw_table(cur)
+        conn.commit()
+        prepare_partitions(conn)
+    finally:
+        conn.close()
+
+    shards: List[List[Dict[str, Any]]] = [[] for _ in range(workers)]
+    for it in items:
+        shards[shard_of(it, workers)].append(it)
+    print(f"🧵 {len(items)} items en {workers} shards ({', '.join(str(len(s)) for s in shards)}); "
+          f"{n_cat} valores de catálogo precargados")
+    # psycopg2 suelta el GIL mientras espera a Postgres: con hilos basta para tener K backends trabajando
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest") as pool:
+        futures = [pool.submit(update_items_in_db, shard, refresh_children, caches, commit_every, dead)
+                   for shard in shards if shard]
+        results, errors = [], []
+        for f in futures:
+            try:
+                results.append(f.result())
+            except Exception as e:      # el shard ya hizo rollback de su último lote
+                errors.append(e)
+    if errors:
+        raise errors[0]
+    return sum(results)
+
+
+def load_items_file(path: str) -> list:
+    """Items de un JSON de dataset de Apify: lista, {"items": [...]} o un solo perfil."""
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    if isinstance(data, dict):
+        data = data.get("items", [data])
+    return [it for it in data if isinstance(it, dict)]
+
+
+def replay_dead_letter(path: Optional[str] = None, workers: int = 1, refresh_children=True) -> Tuple[int, int]:
+    """Reingesta los items del dead-letter; el fichero se queda solo con los que vuelven a fallar."""
+    path = path or dead_letter_path()
+    recs = read_dead_letter(path)
+    if not recs:
+        return 0, 0
+    os.replace(path, path + ".replaying")    # los fallos de esta pasada se escriben en un fichero nuevo
+    try:
+        dead: List[str] = []
+        items = [r["item"] for r in recs]
+        n = update_items_parallel(items, workers, refresh_children, dead=dead)
+    except Exception:
+        os.replace(path + ".replaying", path)   # pasada abortada: los originales ya incluyen lo nuevo
+        raise
+    os.remove(path + ".replaying")
+    recovered = {normalize_linkedin_url(it.get("linkedinUrl")) for it in items} - set(dead) - {None}
+    if recovered:
+        import extraction_state as es
+        conn = psycopg2.connect(**db_params())
+        try:
+            with conn.cursor() as cur:
+                es.resolve_ingest_errors(cur, sorted(recovered))
+            conn.commit()
+        finally:
+            conn.close()
+    return n, len(dead)
+
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Ingesta en Postgres de JSON de datasets de Apify.")
+    ap.add_argument("files", nargs="*", help="Ficheros .json (p.ej. data/apify_actor/raw/*.json)")
+    ap.add_argument("--replay-dead-letter", action="store_true",
+                    help=f"Reingesta los items fallidos de {dead_letter_path()}")
+    ap.add_argument("--keep-children", action="store_true",
+                    help="No reescribir experiencias/educación/idiomas/skills existentes")
+    ap.add_argument("--workers", type=int, default=ingest_workers(),
+                    help="Conexiones en paralelo (shards por perfil); 1 = en serie")
+    ap.add_argument("--commit-every", type=int, default=COMMIT_EVERY, help="Perfiles por commit en cada shard")
+    args = ap.parse_args(argv)
+    if args.replay_dead_letter:
+        n, still = replay_dead_letter(workers=args.workers, refresh_children=not args.keep_children)
+        print(f"♻️ Dead-letter: {n} perfiles reingeridos, {still} siguen fallando")
+        if not args.files:
+            return
+    elif not args.files:
+        ap.error("indica ficheros .json o --replay-dead-letter")
+    total = 0
+    if args.workers > 1:
+        # Todos los ficheros juntos, en orden: el último item de un perfil sigue ganando
+        items = [it for path in args.files for it in load_items_file(path)]
+        total = update_items_parallel(items, args.workers, not args.keep_children, args.commit_every)
+    else:
+        for path in args.files:
+            items = load_items_file(path)
+            n = update_items_in_db(items, refresh_children=not args.keep_children, commit_every=args.commit_every)
+            total += n
+            print(f"📥 {path}: {n} perfiles")
+    print(f"✅ Ingeridos {total} perfiles de {len(args.files)} ficheros")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+known_profiles.py — "¿Ya conocemos (o excluimos) esta URL?"
+
+Estructura de pertenencia que se construye una vez por ejecución y que
+consultan todos los dispatchers (Apify y los dos motores de Slack) antes de
+gastar dinero o rate limit en una URL. Fuentes:
+- tabla `profiles` (perfiles ya extraídos: public_identifier no nulo)
+- archivo raw de Apify (data/apify_actor/raw/*.json; solo items extraídos,
+  los 403 vuelven a intentarse tras EXTRACTION_403_RETRY_DAYS)
+- lista de exclusión (data/exclude_profiles.txt, una URL o slug por línea)
+
+Por defecto es un set exacto; para tablas muy grandes se puede usar un
+filtro de Bloom (KNOWN_FILTER_MODE=bloom|auto), que nunca da falsos negativos
+y solo deja escapar un % configurable de falsos positivos.
+"""
+
+import glob
+import hashlib
+import json
+import math
+from pathlib import Path
+from typing import Iterable, Optional
+
+from config import PROJECT_ROOT, env
+from linkedin_urls import canonical_key
+
+RAW_DIR = PROJECT_ROOT / "data" / "apify_actor" / "raw"
+EXCLUDE_PATH = PROJECT_ROOT / "data" / "exclude_profiles.txt"
+
+KNOWN_FILTER_MODE = env("KNOWN_FILTER_MODE", "auto")        # exact | bloom | auto
+KNOWN_BLOOM_THRESHOLD = int(env("KNOWN_BLOOM_THRESHOLD", "2000000"))
+KNOWN_BLOOM_FP_RATE = float(env("KNOWN_BLOOM_FP_RATE", "0.001"))
+KNOWN_FROM_DB = env("KNOWN_FROM_DB", "true").lower() == "true"
+
+
+def url_key(u: Optional[str]) -> Optional[str]:
+    """Clave de comparación: la URL canónica (Sales Navigator resuelto si se conoce)."""
+    return canonical_key(u)
+
+
+class BloomFilter:
+    """Filtro de Bloom con doble hashing sobre blake2b (sin dependencias)."""
+
+    def __init__(self, expected: int, fp_rate: float = 0.001):
+        expected = max(1, expected)
+        self.m = max(8, int(-expected * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.m / expected * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, key: str):
+        d = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        for i in range(self.k):
+            yield (h1 + i * h2) % self.m
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class KnownProfiles:
+    def __init__(self, bloom: Optional[BloomFilter] = None):
+        self._store = bloom if bloom is not None else set()
+        self.counts = {}
+
+    @property
+    def is_bloom(self) -> bool:
+        return isinstance(self._store, BloomFilter)
+
+    def add_many(self, urls: Iterable[str], source: str) -> int:
+        n = 0
+        for u in urls:
+            k = url_key(u)
+            if k:
+                self._store.add(k)
+                n += 1
+        self.counts[source] = self.counts.get(source, 0) + n
+        return n
+
+    def __contains__(self, url: str) -> bool:
+        k = url_key(url)
+        return bool(k) and k in self._store
+
+    def filter_new(self, urls: Iterable[str]):
+        """Devuelve (urls_nuevas, n_descartadas)."""
+        keep, skipped = [], 0
+        for u in urls:
+            if u in self:
+                skipped += 1
+            else:
+                keep.append(u)
+        return keep, skipped
+
+    def summary(self) -> str:
+        kind = "bloom" if self.is_bloom else "set"
+        parts = ", ".join(f"{k}={v}" for k, v in self.counts.items())
+        return f"{kind} ({parts})"
+
+
+# ------------------ Fuentes ------------------
+def iter_db_urls(batch_size: int = 10000):
+    """URLs de perfiles ya extraídos (o marcados) en la tabla profiles."""
+    import psycopg2
+    from config import db_params, db_schema
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor(name="known_profiles") as cur:
+            cur.itersize = batch_size
+            cur.execute(f"""
+                SELECT linkedin_url FROM {db_schema()}.profiles
+                WHERE public_identifier IS NOT NULL AND linkedin_url IS NOT NULL
+            """)
+            for (u,) in cur:
+                yield u
+    finally:
+        conn.close()
+
+
+def count_db_urls() -> int:
+    import psycopg2
+    from config import db_params, db_schema
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {db_schema()}.profiles WHERE public_identifier IS NOT NULL")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def iter_archive_urls(raw_dir: Path = RAW_DIR):
+    """URLs resueltas (con publicIdentifier) del archivo raw. Los 403 no: se reintentan (extraction_state.py)."""
+    for path in sorted(glob.glob(str(raw_dir / "*.json"))):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except Exception as e:
+            print(f"⚠️ No se pudo leer {path}: {e}")
+            continue
+        for it in data if isinstance(data, list) else data.get("items", []):
+            if not isinstance(it, dict):
+                continue
+            if not it.get("publicIdentifier"):
+                continue
+            for u in (it.get("linkedinUrl"),
+                      (it.get("query") or {}).get("url"),
+                      (it.get("originalQuery") or {}).get("url")):
+                if u:
+                    yield u
+
+
+def iter_exclusions(path: Path = EXCLUDE_PATH):
+    if not path.exists():
+        return
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def load_exclusions(path: Path = EXCLUDE_PATH) -> set:
+    """Claves de la lista de exclusión, aparte del filtro (que puede ser Bloom) para distinguirlas."""
+    return {k for k in map(url_key, iter_exclusions(path)) if k}
+
+
+def build_known_filter(use_db: bool = KNOWN_FROM_DB, raw_dir: Path = RAW_DIR,
+                       exclude_path: Path = EXCLUDE_PATH, mode: str = KNOWN_FILTER_MODE) -> KnownProfiles:
+    """Construye el filtro una vez por ejecución. Si la BD no está disponible, sigue sin ella."""
+    db_count = 0
+    if use_db:
+        try:
+            db_count = count_db_urls()
+        except Exception as e:
+            print(f"⚠️ Filtro de conocidos sin BD: {e}")
+            use_db = False
+
+    use_bloom = mode == "bloom" or (mode == "auto" and db_count > KNOWN_BLOOM_THRESHOLD)
+    known = KnownProfiles(BloomFilter(int(db_count * 1.2) + 100000, KNOWN_BLOOM_FP_RATE) if use_bloom else None)
+
+    if use_db:
+        known.add_many(iter_db_urls(), "db")
+    known.add_many(iter_archive_urls(raw_dir), "archivo")
+    known.add_many(iter_exclusions(exclude_path), "exclusion")
+    print(f"🧹 Filtro de conocidos/excluidos: {known.summary()}")
+    return known
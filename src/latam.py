@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+latam.py — Punto de entrada único para los pipelines.
+
+Cada subcomando apunta a "modulo:funcion" (o "fichero.py:funcion" para los
+scripts cuyo nombre no es importable) y solo se importa al ejecutarlo: pandas,
+psycopg2, slack_sdk o requests no se cargan para `--help` ni para los
+subcomandos que no los usan. Los argumentos restantes se pasan tal cual al
+script (cada uno tiene su propio argparse o lee el entorno).
+
+Uso:
+  python latam.py --help
+  python latam.py harvest                       # orquestador BD → Apify → BD
+  python latam.py refresh                       # re-extracción por antigüedad
+  python latam.py dispatch https://www.linkedin.com/in/xxx
+  python latam.py ingest ../data/apify_actor/raw/*.json
+  python latam.py unfurl | enrich | filter | filter-llm
+  python latam.py inspect --id 123
+  python latam.py search "data engineer" --skill spark --location valencia
+  python latam.py clean --dry-run
+  python latam.py config                        # configuración efectiva (valida PG_*)
+"""
+
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+# nombre → (destino, ayuda)
+COMMANDS = {
+    "harvest":    ("orchestrate_from_db:main", "Pendientes de la BD → Apify → ingesta (con requeue)"),
+    "refresh":    ("orchestrate_from_db:refresh_main", "Re-extrae los perfiles más antiguos (presupuesto diario)"),
+    "dispatch":   ("harvestapi_dispatch_standalone:main", "Lanza Apify para las URLs dadas e imprime los items"),
+    "ingest":     ("json_2_sql:main", "Ingesta ficheros JSON de datasets de Apify en Postgres"),
+    "unfurl":     ("slack_unfurl_to_raw_headline:main", "Unfurls de Slack → columna raw_headline"),
+    "enrich":     ("slack+ollama_enrichment_profiles.py:main", "Unfurls de Slack + Ollama → perfiles enriquecidos (--reextract)"),
+    "unfurls":    ("unfurl_store:main", "Almacén de unfurls en bruto (compactar, importar volcados DUMP_JSON)"),
+    "filter":     ("filter_headlines_inplace:run", "Filtro por reglas de headlines (in place)"),
+    "filter-llm": ("filtra_perfiles_phi3:main", "Filtro de perfiles con regex + phi3 (Ollama)"),
+    "inspect":    ("inspect_profile_v2:main", "Muestra un perfil completo de la BD"),
+    "clean":      ("delete_messages_slack:main", "Borra los mensajes de sondeo del bot en Slack"),
+    "prioritize": ("prioritize:main", "Recalcula profiles.extraction_priority"),
+    "coverage":   ("coverage_report:main", "Informe de cobertura de perfiles"),
+    "urls":       ("linkedin_urls:main", "Canonicalización de URLs y mapa Sales Navigator"),
+    "raw":        ("profile_raw:main", "Payload bruto de Apify (JSONB): importación, índices y backfill"),
+    "history":    ("profile_history:main", "Histórico de followers/connections/headline por perfil"),
+    "search":     ("talent_search:main", "Búsqueda de talento: texto + skills + ubicación"),
+    "similar":    ("similar_profiles:main", "Perfiles parecidos (índice TF-IDF local, --build/--update)"),
+    "claims":     ("work_queue:main", "Claims de extracción por worker"),
+    "state":      ("extraction_state:main", "Estado de extracción por perfil (migración, reencolar)"),
+    "migrate":    ("migrate:main", "Aplica las migraciones pendientes del esquema (--status)"),
+    "config":     (None, "Muestra la configuración efectiva (sin secretos)"),
+}
+
+
+def usage() -> str:
+    width = max(len(n) for n in COMMANDS)
+    lines = ["uso: latam <comando> [args...]", "", "comandos:"]
+    lines += [f"  {name.ljust(width)}  {help}" for name, (_, help) in COMMANDS.items()]
+    lines += ["", "`latam <comando> --help` muestra la ayuda del comando (si tiene argumentos)."]
+    return "\n".join(lines)
+
+
+def resolve(target: str):
+    """Importa el destino bajo demanda."""
+    mod_name, func = target.split(":")
+    if str(HERE) not in sys.path:
+        sys.path.insert(0, str(HERE))
+    if mod_name.endswith(".py"):
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(Path(mod_name).stem.replace("+", "_"), HERE / mod_name)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+    else:
+        import importlib
+        mod = importlib.import_module(mod_name)
+    return getattr(mod, func)
+
+
+def show_config() -> int:
+    import json
+    import config
+    info = config.describe()
+    print(json.dumps(info, ensure_ascii=False, indent=2))
+    return 1 if "db_error" in info else 0
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print(usage())
+        return 0
+    name, rest = argv[0], argv[1:]
+    if name not in COMMANDS:
+        print(f"❌ Comando desconocido: {name}\n\n{usage()}", file=sys.stderr)
+        return 2
+    target = COMMANDS[name][0]
+    if target is None:
+        return show_config()
+
+    from config import ConfigError, load_env
+    load_env()      # antes del import: varios módulos leen sus constantes del entorno al importarse
+    fn = resolve(target)
+    sys.argv = [f"latam {name}", *rest]   # los scripts leen sys.argv con su propio argparse
+    try:
+        rc = fn()
+    except ConfigError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    return rc if isinstance(rc, int) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+linkedin_urls.py — Forma canónica única de las URLs de perfil de LinkedIn.
+
+Todas las claves (BD, CSV, Slack, Apify) pasan por `canonical_url`:
+  - https://www.linkedin.com como host (también para linkedin.com, es.linkedin.com,
+    www.public.com...); cualquier otro host no es un perfil → None
+  - sin query, sin fragmento, sin '/' final ni subrutas (/details/..., /recent-activity/...)
+  - las URLs antiguas /pub/<nombre>/<a>/<b>/<c> conservan la ruta entera: con el
+    mismo nombre y otro sufijo son otra persona
+  - un slug con espacios u otros caracteres no válidos → None
+  - slug en minúsculas y sin %-encoding (maría-..., no mar%C3%ADa-...)
+  - los ids de Sales Navigator (ACwAA.../ACoAA...) conservan mayúsculas, que son
+    significativas, y /sales/lead|people/<id>,... se reduce a /in/<id>
+
+`SalesNavMap` guarda de forma persistente id de Sales Navigator → URL pública,
+para que las dos columnas de nuestros CSV (linkedinUrl / salesNavigatorId)
+colapsen en una sola clave (`canonical_key`).
+
+Uso:
+  python linkedin_urls.py --learn-csv data/prueba/linkedin_unificado.csv
+  python linkedin_urls.py --learn-archive
+  python linkedin_urls.py --rewrite-db          # reescribe profiles.linkedin_url a la forma canónica
+"""
+
+import argparse
+import csv
+import glob
+import json
+import re
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import unquote, urlsplit
+
+from config import PROJECT_ROOT, env
+
+SALESNAV_MAP_PATH = Path(env("SALESNAV_MAP_PATH", PROJECT_ROOT / "data" / "salesnav_map.csv"))
+
+CANONICAL_PREFIX = "https://www.linkedin.com/in/"
+HOST_ALIASES = {"www.public.com": "www.linkedin.com", "public.com": "www.linkedin.com"}
+SALES_NAV_PREFIXES = ("ACwAA", "ACoAA")
+
+# Segmento de ruta ya decodificado: en ASCII solo letras, dígitos, '-', '_' y '~'; fuera de ASCII cualquier
+# cosa menos espacios (LinkedIn admite acentos, emojis, ´, ®... en los slugs)
+_SLUG_RX = re.compile(r"(?:[\w\-~]|[^\x00-\x7f\s])+")
+# Ya canónica: host correcto, /in/<slug> sin query/fragment/%/'/' final (y en minúsculas, ver canonical_url)
+_FAST_RX = re.compile(r"https://www\.linkedin\.com/in/[\w\-]+")
+_SALES_RX = re.compile(r"/sales/(?:lead|people)/([^,/]+)")
+
+
+def _is_missing(u: Any) -> bool:
+    return u is None or (isinstance(u, float) and u != u)
+
+
+@lru_cache(maxsize=200_000)
+def _canonical_slow(s: str) -> Optional[str]:
+    if "/" not in s and "." not in s:
+        s = CANONICAL_PREFIX + s.lstrip("@")
+    elif s.startswith("/"):
+        s = "https://www.linkedin.com" + s
+    elif "://" not in s:
+        s = "https://" + s.lstrip("/")
+
+    p = urlsplit(s)
+    host = p.netloc.lower().split("@")[-1].split(":")[0]
+    host = HOST_ALIASES.get(host, host)
+    if host != "linkedin.com" and not host.endswith(".linkedin.com"):
+        return None
+    host = "www.linkedin.com"
+    path = unquote(p.path or "")
+
+    m = _SALES_RX.search(path)
+    if m:
+        return CANONICAL_PREFIX + m.group(1) if _SLUG_RX.fullmatch(m.group(1)) else None
+
+    parts = [x for x in path.split("/") if x]
+    kind = parts[0].lower() if parts else None
+    if kind == "in":
+        parts = parts[1:2]
+    elif kind == "pub":
+        # /pub/<nombre>/<a>/<b>/<c>: el sufijo distingue personas con el mismo nombre, no es una subruta
+        parts = parts[:5] if len(parts) >= 2 else []
+    if not parts or not all(_SLUG_RX.fullmatch(x) for x in parts):
+        return None
+    if kind == "in":
+        slug = parts[0]
+        return CANONICAL_PREFIX + (slug if slug.startswith(SALES_NAV_PREFIXES) else slug.lower())
+    return f"https://{host}/" + "/".join(parts).lower()
+
+
+def canonical_url(u: Any) -> Optional[str]:
+    """Forma canónica de una URL/slug de perfil (None si está vacía o no es de LinkedIn)."""
+    if _is_missing(u):
+        return None
+    s = str(u).strip()
+    if not s:
+        return None
+    # s == s.lower() también cubre mayúsculas no ASCII (Íñaki); los ids ACwAA... van por la vía lenta
+    if s == s.lower() and _FAST_RX.fullmatch(s):
+        return s
+    return _canonical_slow(s.split("#", 1)[0].split("?", 1)[0])
+
+
+def is_sales_nav(u: Any) -> bool:
+    c = canonical_url(u)
+    return bool(c) and c.startswith(CANONICAL_PREFIX) and c[len(CANONICAL_PREFIX):].startswith(SALES_NAV_PREFIXES)
+
+
+class SalesNavMap:
+    """Mapa persistente (CSV) id de Sales Navigator → URL pública canónica."""
+
+    def __init__(self, path: Path = SALESNAV_MAP_PATH):
+        self.path = Path(path)
+        self._map: Dict[str, str] = {}
+        self._dirty = False
+        if self.path.exists():
+            with open(self.path, encoding="utf-8", newline="") as fh:
+                for row in csv.DictReader(fh):
+                    if row.get("sales_nav_url") and row.get("public_url"):
+                        self._map[row["sales_nav_url"]] = row["public_url"]
+
+    def __len__(self) -> int:
+        return len(self._map)
+
+    def add(self, sales_nav: Any, public: Any) -> bool:
+        sn, pub = canonical_url(sales_nav), canonical_url(public)
+        if not sn or not pub or not is_sales_nav(sn) or is_sales_nav(pub):
+            return False
+        if self._map.get(sn) != pub:
+            self._map[sn] = pub
+            self._dirty = True
+        return True
+
+    def resolve(self, u: Any) -> Optional[str]:
+        c = canonical_url(u)
+        return self._map.get(c, c) if c else None
+
+    def learn_rows(self, rows: Iterable[Dict[str, Any]], url_col: str = "linkedinUrl",
+                   sn_col: str = "salesNavigatorId") -> int:
+        return sum(1 for r in rows if self.add(r.get(sn_col), r.get(url_col)))
+
+    def learn_items(self, items: Iterable[Dict[str, Any]]) -> int:
+        """Items de Apify: query.url / query.profileId / originalQuery.url → linkedinUrl."""
+        n = 0
+        for it in items or []:
+            pub = it.get("linkedinUrl")
+            q, oq = it.get("query") or {}, it.get("originalQuery") or {}
+            for sn in (q.get("url"), q.get("profileId"), oq.get("url")):
+                n += self.add(sn, pub)
+        return n
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", delete=False, dir=str(self.path.parent), suffix=".tmp",
+                                         encoding="utf-8", newline="") as tmp:
+            w = csv.writer(tmp)
+            w.writerow(["sales_nav_url", "public_url"])
+            for k in sorted(self._map):
+                w.writerow([k, self._map[k]])
+        Path(tmp.name).replace(self.path)
+        self._dirty = False
+
+
+_default_map: Optional[SalesNavMap] = None
+
+
+def get_salesnav_map() -> SalesNavMap:
+    global _default_map
+    if _default_map is None:
+        _default_map = SalesNavMap()
+    return _default_map
+
+
+def canonical_key(u: Any) -> Optional[str]:
+    """Clave única de persona: canónica y, si es Sales Navigator conocido, la pública."""
+    c = canonical_url(u)
+    if c and is_sales_nav(c):
+        return get_salesnav_map().resolve(c)
+    return c
+
+
+# ------------------ CLI ------------------
+def rewrite_db() -> None:
+    """Reescribe profiles.linkedin_url a la forma canónica (salta los que colisionan)."""
+    import psycopg2
+    from config import db_params, db_schema
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT profile_id, linkedin_url FROM {db_schema()}.profiles WHERE linkedin_url IS NOT NULL")
+            rows = cur.fetchall()
+            existing = {u for _, u in rows}
+            changed = collisions = 0
+            for pid, u in rows:
+                c = canonical_key(u)
+                if not c or c == u:
+                    continue
+                if c in existing:
+                    collisions += 1
+                    print(f"⚠️ Duplicado: profile_id={pid} {u} → {c} ya existe")
+                    continue
+                cur.execute(f"UPDATE {db_schema()}.profiles SET linkedin_url=%s WHERE profile_id=%s", (c, pid))
+                existing.discard(u)
+                existing.add(c)
+                changed += 1
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ URLs reescritas: {changed} | colisiones (revisar a mano): {collisions}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Canonicalización de URLs de LinkedIn y mapa Sales Navigator.")
+    ap.add_argument("--learn-csv", nargs="*", default=[], help="CSV con columnas linkedinUrl y salesNavigatorId")
+    ap.add_argument("--learn-archive", action="store_true", help="Aprende de data/apify_actor/raw/*.json")
+    ap.add_argument("--rewrite-db", action="store_true", help="Canonicaliza profiles.linkedin_url")
+    ap.add_argument("urls", nargs="*", help="URLs a canonicalizar (se imprimen)")
+    args = ap.parse_args()
+
+    snmap = get_salesnav_map()
+    before = len(snmap)
+    for path in args.learn_csv:
+        with open(path, encoding="utf-8-sig", newline="") as fh:
+            snmap.learn_rows(csv.DictReader(fh))
+    if args.learn_archive:
+        for path in sorted(glob.glob(str(PROJECT_ROOT / "data" / "apify_actor" / "raw" / "*.json"))):
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+            snmap.learn_items(data if isinstance(data, list) else data.get("items", []))
+    snmap.save()
+    if args.learn_csv or args.learn_archive:
+        print(f"🔗 Mapa Sales Navigator: {len(snmap)} entradas (+{len(snmap) - before}) → {snmap.path}")
+
+    if args.rewrite_db:
+        rewrite_db()
+    for u in args.urls:
+        print(f"{u} → {canonical_key(u)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+loadtest_orchestrator.py — Prueba de carga de punta a punta del orquestador.
+
+Levanta fake_apify.py en un puerto libre, siembra N perfiles pendientes
+sintéticos (https://www.linkedin.com/in/loadtest-NNNNNN) en un Postgres LOCAL,
+ejecuta orchestrate_from_db.main() contra el servidor falso y mide perfiles/hora
+de extremo a extremo (lanzar run → polling → dataset → ingesta).
+
+Solo contra una BD local: se niega si PG_HOST (del entorno o de .env) no es
+localhost o un socket Unix, salvo --allow-remote.
+
+Uso:
+  PG_HOST=localhost PG_DB=latam_test PG_SCHEMA=public ... \\
+  python loadtest_orchestrator.py --profiles 500 --chunk-size 25 --latency 0.5 --fail-rate 0.1
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import config
+from fake_apify import FakeApify, load_archive, serve
+
+LOADTEST_PREFIX = "https://www.linkedin.com/in/loadtest-"
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def seed_profiles(cur, schema: str, n: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    cur.execute(f"DELETE FROM {schema}.profiles WHERE linkedin_url LIKE %s", (LOADTEST_PREFIX + "%",))
+    rows = [(f"{LOADTEST_PREFIX}{i:06d}", rng.randint(0, 5000)) for i in range(n)]
+    execute_values(cur, f"INSERT INTO {schema}.profiles (linkedin_url, connections) VALUES %s", rows)
+
+
+def count_status(cur, schema: str):
+    cur.execute(f"""
+        SELECT COUNT(*) FILTER (WHERE es.state = 'done'),
+               COUNT(*) FILTER (WHERE es.state = 'inaccessible'),
+               COUNT(*) FILTER (WHERE es.state IS NULL OR es.state NOT IN ('done', 'inaccessible'))
+        FROM {schema}.profiles p
+        LEFT JOIN {schema}.extraction_state es USING (profile_id)
+        WHERE p.linkedin_url LIKE %s
+    """, (LOADTEST_PREFIX + "%",))
+    return cur.fetchone()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prueba de carga del orquestador contra un Apify local.")
+    ap.add_argument("--profiles", type=int, default=200, help="Perfiles pendientes sintéticos a sembrar")
+    ap.add_argument("--chunk-size", type=int, default=20)
+    ap.add_argument("--latency", type=float, default=0.5, help="Segundos fijos por run")
+    ap.add_argument("--per-url", type=float, default=0.01, help="Segundos extra por URL")
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--forbidden-rate", type=float, default=0.0)
+    ap.add_argument("--poll-interval", type=float, default=0.2)
+    ap.add_argument("--retry-backoff", type=float, default=0.0, help="Backoff base de reencolado (s)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--keep", action="store_true", help="No borra los perfiles sintéticos al terminar")
+    ap.add_argument("--allow-remote", action="store_true", help="Permite PG_HOST no local (¡cuidado!)")
+    args = ap.parse_args()
+
+    # Con .env ya cargado: es el host al que van a conectar migrate y el orquestador
+    config.load_env()
+    pg_host = config.db_params()["host"]
+    if not (pg_host in LOCAL_HOSTS or pg_host.startswith("/")) and not args.allow_remote:
+        raise SystemExit(f"❌ PG_HOST={pg_host} no es local. Usa un Postgres local o --allow-remote.")
+
+    fake = FakeApify(load_archive(), args.latency, args.per_url, args.fail_rate, args.forbidden_rate, args.seed)
+    server = serve(fake)
+    host, port = server.server_address[:2]
+    tmp = Path(tempfile.mkdtemp(prefix="loadtest_"))
+
+    # Los módulos leen la configuración al importarse: el entorno va antes del import
+    os.environ.update({
+        "APIFY_BASE": f"http://{host}:{port}/v2",
+        "APIFY_TOKEN": "fake",
+        "APIFY_POLL_INTERVAL": str(args.poll_interval),
+        "APIFY_RETRY_BACKOFF_BASE": str(args.retry_backoff),
+        "SALESNAV_MAP_PATH": str(tmp / "salesnav_map.csv"),
+        "CHUNK_SIZE": str(args.chunk_size),
+        "MAX_URLS_PER_RUN": str(args.profiles),
+        "MIN_CONNECTIONS": "0",
+    })
+    from config import db_params, db_schema
+    from migrate import apply_pending
+    import orchestrate_from_db
+
+    DB, SCHEMA = db_params(), db_schema()
+    conn = psycopg2.connect(**DB)
+    try:
+        apply_pending(conn)     # esquema base + índices únicos de catálogo
+        with conn.cursor() as cur:
+            seed_profiles(cur, SCHEMA, args.profiles, args.seed)
+        conn.commit()
+        print(f"🧪 {args.profiles} pendientes sintéticos en {DB['host']}/{DB['dbname']} · Apify local en :{port}")
+
+        t0 = time.perf_counter()
+        orchestrate_from_db.main()
+        elapsed = time.perf_counter() - t0
+
+        with conn.cursor() as cur:
+            ok, forbidden, pending = count_status(cur, SCHEMA)
+            if not args.keep:
+                cur.execute(f"DELETE FROM {SCHEMA}.profiles WHERE linkedin_url LIKE %s", (LOADTEST_PREFIX + "%",))
+        conn.commit()
+    finally:
+        conn.close()
+        server.shutdown()
+
+    rate = ok / elapsed * 3600 if elapsed else 0.0
+    print("\n📈 Resultado")
+    print(f"   tiempo total        : {elapsed:.1f} s")
+    print(f"   extraídos           : {ok}  (inaccessible={forbidden}, sin terminar={pending})")
+    print(f"   runs / URLs enviadas: {fake.stats['runs']} / {fake.stats['urls']} "
+          f"(fallidos={fake.stats['failed_runs']}, 403={fake.stats['forbidden']})")
+    print(f"   throughput          : {rate:,.0f} perfiles/hora")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py — Métricas de los pipelines (contadores, gauges e histogramas).
+
+Sin dependencias: un registro en memoria, thread-safe, que cada script
+alimenta y que se puede exponer de dos formas (ambas opcionales):
+- METRICS_PORT=9108          → endpoint Prometheus en http://127.0.0.1:9108/metrics
+- METRICS_SNAPSHOT_PATH=...  → volcado JSON periódico (METRICS_SNAPSHOT_INTERVAL s)
+                               y uno final al salir
+
+Uso en un script:
+  import metrics
+  URLS = metrics.counter("latam_urls_total", "URLs procesadas", ["stage"])   # contadores: sufijo _total
+  LAT = metrics.histogram("latam_batch_seconds", "Duración de lote", ["stage"])
+  metrics.init_from_env("orchestrator")
+  with metrics.timer(LAT, stage="apify"):
+      ...
+  URLS.inc(len(batch), stage="apify")
+"""
+
+import atexit
+import json
+import math
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import env
+
+METRICS_PORT = int(env("METRICS_PORT", "0"))              # 0 = sin endpoint
+METRICS_HOST = env("METRICS_HOST", "127.0.0.1")
+METRICS_SNAPSHOT_PATH = env("METRICS_SNAPSHOT_PATH", "")  # vacío = sin volcado
+METRICS_SNAPSHOT_INTERVAL = float(env("METRICS_SNAPSHOT_INTERVAL", "30"))
+
+# segundos: de una sentencia SQL (ms) a un run de Apify (minutos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+LabelKey = Tuple[str, ...]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, kw: Dict[str, object]) -> LabelKey:
+        if set(kw) != set(self.labels):
+            raise ValueError(f"{self.name}: etiquetas {sorted(kw)} != {sorted(self.labels)}")
+        return tuple(str(kw[l]) for l in self.labels)
+
+    def _fmt_labels(self, key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+        return "{" + body + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield self.name, self._fmt_labels(key), v
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {",".join(k) or "_": v for k, v in self._values.items()}
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._data: Dict[LabelKey, List[float]] = {}   # [n por bucket..., +Inf, suma]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            d = self._data.get(key)
+            if d is None:
+                d = self._data[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    d[i] += 1
+                    break
+            else:
+                d[len(self.buckets)] += 1
+            d[-1] += value
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Estimación por interpolación lineal dentro del bucket (como histogram_quantile)."""
+        with self._lock:
+            d = list(self._data.get(self._key(labels)) or [])
+        return _quantile(self.buckets, d, q) if d else None
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(d)) for k, d in self._data.items()]
+        for key, d in items:
+            cum = 0.0
+            for b, n in zip(self.buckets, d):
+                cum += n
+                yield self.name + "_bucket", self._fmt_labels(key, ("le", _fmt_float(b))), cum
+            cum += d[len(self.buckets)]
+            yield self.name + "_bucket", self._fmt_labels(key, ("le", "+Inf")), cum
+            yield self.name + "_count", self._fmt_labels(key), cum
+            yield self.name + "_sum", self._fmt_labels(key), d[-1]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = [(k, list(d)) for k, d in self._data.items()]
+        out = {}
+        for key, d in items:
+            n = sum(d[:-1])
+            out[",".join(key) or "_"] = {
+                "count": n,
+                "sum": round(d[-1], 6),
+                "mean": round(d[-1] / n, 6) if n else None,
+                "p50": _quantile(self.buckets, d, 0.5),
+                "p95": _quantile(self.buckets, d, 0.95),
+                "p99": _quantile(self.buckets, d, 0.99),
+            }
+        return out
+
+
+def _quantile(buckets: Tuple[float, ...], d: List[float], q: float) -> Optional[float]:
+    total = sum(d[:-1])
+    if not total:
+        return None
+    rank = q * total
+    cum, lower = 0.0, 0.0
+    for b, n in zip(buckets, d):
+        if cum + n >= rank and n:
+            return round(lower + (b - lower) * (rank - cum) / n, 6)
+        cum += n
+        lower = b
+    return buckets[-1]
+
+
+def _fmt_float(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else f"{v:.1f}"
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ------------------ Registro ------------------
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+_job = "latam"
+_started = time.time()
+
+
+def _get_or_create(cls, name: str, help: str, labels: Sequence[str], **kw):
+    with _registry_lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = cls(name, help, labels, **kw)
+        elif type(m) is not cls or m.labels != tuple(labels):
+            raise ValueError(f"Métrica {name} ya registrada con otro tipo/etiquetas")
+        return m
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return _get_or_create(Counter, name, help, labels)
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+    return _get_or_create(Gauge, name, help, labels)
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+
+@contextmanager
+def timer(hist: Histogram, **labels):
+    """Observa en `hist` la duración del bloque (también si lanza)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observe(time.perf_counter() - t0, **labels)
+
+
+def render_prometheus() -> str:
+    """Formato de exposición de texto de Prometheus (0.0.4)."""
+    lines = []
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    for m in metrics:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        for name, labels, v in m.samples():
+            lines.append(f"{name}{labels} {_fmt_float(v)}")
+    lines.append("# HELP latam_process_uptime_seconds Segundos desde que arrancó el proceso")
+    lines.append("# TYPE latam_process_uptime_seconds gauge")
+    lines.append(f'latam_process_uptime_seconds{{job="{_escape(_job)}"}} {time.time() - _started:.3f}')
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, object]:
+    """Estado actual en JSON (los histogramas con count/sum/mean/p50/p95/p99)."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {
+        "job": _job,
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "uptime_s": round(time.time() - _started, 3),
+        "metrics": {m.name: {"type": m.kind, "values": m.snapshot()} for m in metrics},
+    }
+
+
+def write_snapshot(path: Path) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", delete=False, dir=str(path.parent), suffix=".tmp", encoding="utf-8") as tmp:
+        json.dump(snapshot(), tmp, ensure_ascii=False, indent=1)
+    Path(tmp.name).replace(path)
+
+
+# ------------------ Exposición ------------------
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, ctype = render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body, ctype = json.dumps(snapshot(), ensure_ascii=False).encode("utf-8"), "application/json"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+def start_snapshots(path: Path, interval: float = METRICS_SNAPSHOT_INTERVAL) -> None:
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(path)
+            except OSError as e:
+                print(f"⚠️ No se pudo volcar métricas en {path}: {e}")
+
+    threading.Thread(target=_loop, daemon=True, name="metrics-snapshot").start()
+    atexit.register(write_snapshot, Path(path))
+
+
+_initialized = False
+
+
+def init_from_env(job: str) -> None:
+    """Arranca endpoint y/o volcados según el entorno. Sin variables, no hace nada."""
+    global _initialized, _job
+    if _initialized:
+        return
+    _initialized = True
+    _job = job
+    if METRICS_PORT:
+        try:
+            start_http_server(METRICS_PORT)
+            print(f"📈 Métricas en http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️ No se pudo abrir el puerto de métricas {METRICS_PORT}: {e}")
+    if METRICS_SNAPSHOT_PATH:
+        path = Path(METRICS_SNAPSHOT_PATH.replace("{job}", job))
+        start_snapshots(path)
+        print(f"📈 Volcado de métricas cada {METRICS_SNAPSHOT_INTERVAL:.0f}s en {path}")
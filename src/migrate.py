@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+migrate.py — Migraciones versionadas del esquema.
+
+Cada migración es una función Python numerada en MIGRATIONS; las aplicadas
+quedan en schema_migrations. Se aplican en orden, cada una en su propia
+transacción y bajo un lock consultivo, así que dos procesos no la ejecutan a
+la vez y una migración a medias no deja rastro.
+
+  1 base_schema           tablas de bootstrap_schema.py (CREATE ... IF NOT EXISTS)
+  2 catalog_unique_lower  deduplica los catálogos (locations, companies,
+                          educational_institutions, languages, skills), repunta
+                          las FKs al superviviente y crea UNIQUE sobre lower(...)
+                          para que los ensure_* de json_2_sql.py sean un solo
+                          INSERT ... ON CONFLICT ... RETURNING
+  3 talent_search         pg_trgm + unaccent, profile_search (tsvector, skill_ids)
+                          y trigramas de skills/ubicaciones (talent_search.py)
+  4 catalog_link_merge    empresas/centros sin link → la única fila con link y el
+                          mismo lower(nombre) (como hacía la ingesta por nombre), e
+                          índice sobre lower(nombre) para esa búsqueda
+  5 profile_history       profile_snapshots (particionada por mes, sin particiones:
+                          las crea la ingesta) y profile_snapshot_latest
+                          (profile_history.py)
+
+Uso:
+  python migrate.py              # aplica las pendientes
+  python migrate.py --status     # aplicadas / pendientes
+"""
+
+import argparse
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import psycopg2
+
+from config import db_params, db_schema
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+# ------------------ Catálogos ------------------
+# tabla → (id, clave única, referencias (tabla, columna, columnas a copiar si la FK es parte de la PK))
+CATALOGS: Dict[str, Tuple[str, str, List[Tuple[str, str, Optional[Sequence[str]]]]]] = {
+    "locations": ("location_id", "lower(location_name)", [
+        ("profiles", "location_id", None),
+        ("companies", "location_id", None),
+        ("educational_institutions", "location_id", None),
+        ("experiences", "location_id", None),
+        ("educations", "location_id", None),
+    ]),
+    # empresas y centros: se identifican por su página de LinkedIn si la tienen, si no por el nombre
+    "companies": ("company_id", "lower(COALESCE(company_link, company_name))", [
+        ("experiences", "company_id", None),
+    ]),
+    "educational_institutions": ("school_id", "lower(COALESCE(school_link, school_name))", [
+        ("educations", "school_id", None),
+    ]),
+    "languages": ("lang_id", "lower(language)", [
+        ("profile_languages", "lang_id", ("profile_id", "level")),
+    ]),
+    "skills": ("skill_id", "lower(skill_name)", [
+        ("profile_skills", "skill_id", ("profile_id",)),
+    ]),
+}
+
+
+# empresas y centros: (columna nombre, columna link)
+LINKED_CATALOGS = {
+    "companies": ("company_name", "company_link"),
+    "educational_institutions": ("school_name", "school_link"),
+}
+
+
+def dedupe_catalog(cur, table: str) -> int:
+    """Fusiona filas con la misma clave en la de menor id y repunta las FKs. Devuelve filas borradas."""
+    id_col, key, _ = CATALOGS[table]
+    return merge_catalog(cur, table, f"""
+        SELECT old_id, new_id FROM (
+            SELECT {id_col} AS old_id, min({id_col}) OVER (PARTITION BY {key}) AS new_id
+            FROM {db_schema()}.{table}
+        ) m WHERE old_id <> new_id
+    """)
+
+
+def merge_link_less(cur, table: str) -> int:
+    """Filas sin link → la única fila con link del mismo lower(nombre). Con 0 o varias candidatas no se toca."""
+    s = db_schema()
+    id_col = CATALOGS[table][0]
+    name, link = LINKED_CATALOGS[table]
+    return merge_catalog(cur, table, f"""
+        SELECT n.{id_col} AS old_id, l.new_id
+        FROM {s}.{table} n
+        JOIN (SELECT lower({name}) AS k, min({id_col}) AS new_id
+              FROM {s}.{table} WHERE {link} IS NOT NULL
+              GROUP BY 1 HAVING COUNT(*) = 1) l ON l.k = lower(n.{name})
+        WHERE n.{link} IS NULL AND n.{name} <> '(sin nombre)'
+    """)
+
+
+def merge_catalog(cur, table: str, map_sql: str) -> int:
+    """Fusiona cada old_id de `map_sql` (old_id, new_id) en su new_id y repunta las FKs. Devuelve filas borradas."""
+    s = db_schema()
+    id_col, _, refs = CATALOGS[table]
+    cur.execute(f"CREATE TEMP TABLE dup_map ON COMMIT DROP AS {map_sql}")
+    cur.execute("SELECT COUNT(*) FROM dup_map")
+    if not cur.fetchone()[0]:
+        cur.execute("DROP TABLE dup_map")
+        return 0
+    cur.execute("CREATE INDEX ON dup_map (old_id)")
+    cur.execute("ANALYZE dup_map")
+
+    for ref, col, pk_cols in refs:
+        if pk_cols is None:
+            cur.execute(f"UPDATE {s}.{ref} r SET {col} = m.new_id FROM dup_map m WHERE r.{col} = m.old_id")
+        else:
+            # la FK es parte de la PK: copiar al superviviente (sin chocar) y borrar las del duplicado
+            cols = ", ".join(pk_cols)
+            rcols = ", ".join(f"r.{c}" for c in pk_cols)
+            cur.execute(f"""
+                INSERT INTO {s}.{ref} ({col}, {cols})
+                SELECT m.new_id, {rcols} FROM {s}.{ref} r JOIN dup_map m ON r.{col} = m.old_id
+                ON CONFLICT DO NOTHING
+            """)
+            cur.execute(f"DELETE FROM {s}.{ref} r USING dup_map m WHERE r.{col} = m.old_id")
+
+    if table in LINKED_CATALOGS:
+        # el superviviente hereda la ubicación si no tenía
+        cur.execute(f"""
+            UPDATE {s}.{table} t SET location_id = d.location_id
+            FROM (SELECT m.new_id, max(x.location_id) AS location_id
+                  FROM dup_map m JOIN {s}.{table} x ON x.{id_col} = m.old_id
+                  GROUP BY m.new_id) d
+            WHERE t.{id_col} = d.new_id AND t.location_id IS NULL AND d.location_id IS NOT NULL
+        """)
+    cur.execute(f"DELETE FROM {s}.{table} t USING dup_map m WHERE t.{id_col} = m.old_id")
+    n = cur.rowcount
+    cur.execute("DROP TABLE dup_map")
+    return n
+
+
+def _recount_coverage(cur) -> None:
+    """Tras fusionar idiomas/skills, los contadores de profile_coverage pueden haber bajado."""
+    s = db_schema()
+    cur.execute("SELECT to_regclass(%s)", (f"{s}.profile_coverage",))
+    if cur.fetchone()[0] is None:
+        return
+    cur.execute(f"""
+        UPDATE {s}.profile_coverage pc
+        SET n_languages = (SELECT COUNT(*) FROM {s}.profile_languages x WHERE x.profile_id = pc.profile_id),
+            n_skills    = (SELECT COUNT(*) FROM {s}.profile_skills x WHERE x.profile_id = pc.profile_id),
+            updated_at  = now()
+    """)
+
+
+# ------------------ Migraciones ------------------
+def m001_base_schema(cur) -> None:
+    from bootstrap_schema import BASE_DDL
+    cur.execute(BASE_DDL.format(s=db_schema()))
+
+
+def m002_catalog_unique_lower(cur) -> None:
+    s = db_schema()
+    merged = {}
+    for table in CATALOGS:
+        merged[table] = dedupe_catalog(cur, table)
+    if merged["languages"] or merged["skills"]:
+        _recount_coverage(cur)
+    for table, (_, key, _) in CATALOGS.items():
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_lower_key ON {s}.{table} (({key}))")
+    print("   duplicados fusionados: " + ", ".join(f"{t}={n}" for t, n in merged.items()))
+
+
+def m003_talent_search(cur) -> None:
+    from talent_search import ensure_search_schema, refresh_search
+    ensure_search_schema(cur)
+    # perfiles existentes: una sola pasada set-based (la ingesta mantiene el resto)
+    cur.execute(f"SELECT profile_id FROM {db_schema()}.profiles")
+    print(f"   perfiles indexados: {refresh_search(cur, [r[0] for r in cur.fetchall()])}")
+
+
+def m004_catalog_link_merge(cur) -> None:
+    s = db_schema()
+    merged = {}
+    for table, (name, _) in LINKED_CATALOGS.items():
+        merged[table] = merge_link_less(cur, table)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_lower_name_idx ON {s}.{table} ((lower({name})))")
+    print("   sin link fusionadas: " + ", ".join(f"{t}={n}" for t, n in merged.items()))
+
+
+def m005_profile_history(cur) -> None:
+    from profile_history import ensure_history_schema
+    ensure_history_schema(cur)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "base_schema", m001_base_schema),
+    (2, "catalog_unique_lower", m002_catalog_unique_lower),
+    (3, "talent_search", m003_talent_search),
+    (4, "catalog_link_merge", m004_catalog_link_merge),
+    (5, "profile_history", m005_profile_history),
+]
+CATALOG_UNIQUE = 2
+SEARCH_INDEX = 3
+CATALOG_LINK_MERGE = 4
+PROFILE_HISTORY = 5
+
+
+# ------------------ Runner ------------------
+def ensure_migrations_table(cur) -> None:
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {db_schema()}.schema_migrations (
+            version    integer PRIMARY KEY,
+            name       text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def applied_versions(cur) -> Dict[int, str]:
+    cur.execute("SELECT to_regclass(%s)", (f"{db_schema()}.schema_migrations",))
+    if cur.fetchone()[0] is None:
+        return {}
+    cur.execute(f"SELECT version, applied_at::text FROM {db_schema()}.schema_migrations")
+    return dict(cur.fetchall())
+
+
+def require(cur, version: int) -> None:
+    """Falla con un mensaje claro si la BD no tiene aplicada `version`."""
+    if version not in applied_versions(cur):
+        name = dict((v, n) for v, n, _ in MIGRATIONS)[version]
+        raise MigrationError(f"Falta la migración {version} ({name}) en schema={db_schema()}: "
+                             f"ejecuta `python migrate.py`")
+
+
+def apply_pending(conn) -> List[int]:
+    done = []
+    for version, name, fn in MIGRATIONS:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{db_schema()}:migrate",))
+            ensure_migrations_table(cur)
+            if version in applied_versions(cur):
+                conn.commit()
+                continue
+            print(f"🛠️ Migración {version:03d} {name}...")
+            try:
+                fn(cur)
+                cur.execute(f"INSERT INTO {db_schema()}.schema_migrations (version, name) VALUES (%s, %s)",
+                            (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        done.append(version)
+    return done
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Migraciones versionadas del esquema.")
+    ap.add_argument("--status", action="store_true", help="Muestra aplicadas y pendientes sin aplicar nada")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        if not args.status:
+            done = apply_pending(conn)
+            print(f"✅ {len(done)} migraciones aplicadas." if done else "✅ Esquema al día.")
+        with conn.cursor() as cur:
+            applied = applied_versions(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    for version, name, _ in MIGRATIONS:
+        mark = f"✔ {applied[version]}" if version in applied else "… pendiente"
+        print(f"  {version:03d} {name:<22} {mark}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,230 @@
 # -*- coding: utf-8 -*-
-import psycopg2
-from typing import List, Tuple
-from dotenv import load_dotenv
+"""
+Orquestador BD → Apify → BD sobre la máquina de estados de extraction_state.
+
+Cada proceso es un worker (work_queue.py): reclama lotes `pending` por
+prioridad, lanza el actor y deja cada perfil en done / inaccessible /
+retry_after según la reconciliación del run. Se pueden lanzar N a la vez.
+
+Modo refresh (ORCHESTRATOR_MODE=refresh o `latam refresh`): en vez de
+pendientes reclama los `done` más antiguos que REFRESH_MIN_AGE_DAYS (y con
+prioridad >= REFRESH_MIN_PRIORITY si se define), hasta REFRESH_DAILY_BUDGET
+perfiles al día entre todos los workers. La ingesta compara el hash del
+payload y no reescribe los hijos de los perfiles que no cambiaron.
+
+Uso:
+  python orchestrate_from_db.py
+  WORKER_ID=a python orchestrate_from_db.py & WORKER_ID=b python orchestrate_from_db.py &
+  ORCHESTRATOR_MODE=refresh python orchestrate_from_db.py
+"""
+from typing import Dict, List, Tuple
 import os
 
-load_dotenv()
+import config
 
-from harvestapi_dispatch_standalone import harvest_for_urls, normalize_linkedin_url
-from json_2_sql import update_items_in_db, DB, SCHEMA
+config.load_env()
+
+import extraction_state as es
+import metrics
+import profiling
+from harvestapi_dispatch_standalone import harvest_run, normalize_linkedin_url
+from json_2_sql import update_items_in_db
+from known_profiles import build_known_filter, load_exclusions
+from linkedin_urls import get_salesnav_map
+from prioritize import refresh_priorities
+from work_queue import WorkQueue
 
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "5"))
 MAX_URLS_PER_RUN = int(os.getenv("MAX_URLS_PER_RUN", "5"))  # 0 = sin límite
 MIN_CONNECTIONS = int(os.getenv("MIN_CONNECTIONS", "0"))
 REFRESH_CHILDREN = os.getenv("REFRESH_CHILDREN", "true").lower() == "true"
+ORCHESTRATOR_MODE = os.getenv("ORCHESTRATOR_MODE", "pending")      # pending | refresh
+REFRESH_DAILY_BUDGET = int(os.getenv("REFRESH_DAILY_BUDGET", "200"))
+REFRESH_MIN_PRIORITY = float(os.environ["REFRESH_MIN_PRIORITY"]) if os.getenv("REFRESH_MIN_PRIORITY") else None
 
-def get_pending_urls(limit: int) -> List[Tuple[int, str]]:
-    q = f"""
-    SELECT profile_id, rtrim(lower(linkedin_url), '/') AS url_norm
-    FROM {SCHEMA}.profiles
-    WHERE public_identifier IS NULL
-      AND linkedin_url IS NOT NULL
-      AND connections >= {MIN_CONNECTIONS}
-    ORDER BY profile_id
-    LIMIT %s;
-    """
-    conn = psycopg2.connect(**DB)
-    try:
-        with conn.cursor() as cur:
-            cur.execute(q, (limit,))
-            return cur.fetchall()
-    finally:
-        conn.close()
+STAGE_SECONDS = metrics.histogram("latam_orchestrator_stage_seconds", "Duración por etapa de cada lote", ["stage"])
+BATCHES = metrics.counter("latam_orchestrator_batches_total", "Lotes procesados por estado del run", ["status"])
+QUEUE_SIZE = metrics.gauge("latam_orchestrator_queue_urls", "URLs del lote en vuelo")
 
 
 def chunked(lst, n):
     for i in range(0, len(lst), n):
         yield lst[i:i+n]
 
-def main():
-    total_limit = MAX_URLS_PER_RUN if MAX_URLS_PER_RUN > 0 else 10**9
-    pending = get_pending_urls(total_limit)
-    if not pending:
-        print("✅ No hay perfiles pendientes (public_identifier IS NULL).")
+
+def process_batch(urls: List[str]) -> Tuple[dict, int]:
+    """Un run de Apify + ingesta. Devuelve (resultado reconciliado del run, perfiles ingeridos)."""
+    with metrics.timer(STAGE_SECONDS, stage="apify"), profiling.stage("apify"):
+        res = harvest_run(urls)  # 1) actor (con recuperación del dataset parcial)
+    items = res["items"]
+    snmap = get_salesnav_map()
+    if snmap.learn_items(items):
+        snmap.save()
+
+    dead: List[str] = []
+    with metrics.timer(STAGE_SECONDS, stage="ingest"), profiling.stage("ingest"):
+        # 2) update por linkedin_url (+ refresh hijos); un item que falla va al dead-letter y no tumba el lote
+        n = update_items_in_db(items, REFRESH_CHILDREN, dead=dead) if items else 0
+    res["poisoned"] = dead
+    BATCHES.inc(status=res["status"])
+    return res, n
+
+
+def refresh_new_priorities() -> None:
+    # Los pendientes nuevos aún no tienen prioridad: se puntúan antes de elegir
+    n_new = refresh_priorities(only_missing=True)
+    if n_new:
+        print(f"🎯 Prioridad calculada para {n_new} pendientes nuevos.")
+
+
+def reconcile(wq: WorkQueue, by_key: Dict[str, int], res: dict, refresh: bool = False) -> None:
+    """Lleva cada perfil enviado a su estado según el resultado del run."""
+    # Solo un 403 es inaccessible (y se reintenta pasado el plazo); lo demás sin item va a retry_after
+    poisoned = set(res.get("poisoned") or ())
+    wq.complete(by_key[u] for u in res["covered"] if u in by_key and u not in poisoned)
+    bad = [by_key[u] for u in poisoned if u in by_key]
+    if bad:
+        # El item ya está pagado: nada de reenviarlo a Apify, se reingesta con --replay-dead-letter
+        print(f"☠️ {len(bad)} perfiles con item no ingerible: parked (INGEST_ERROR).")
+        wq.park(bad, "INGEST_ERROR", "ver dead-letter de la ingesta")
+    forbidden = [by_key[u] for u in res["inaccessible"] if u in by_key]
+    if forbidden:
+        print(f"⚠️ {len(forbidden)} perfiles inaccesibles (403).")
+        wq.forbid(forbidden)
+    missing = [by_key[u] for u in res["missing"] if u in by_key]
+    if not missing:
         return
-    print(f"Encontrados {len(pending)} pendientes. CHUNK_SIZE={CHUNK_SIZE}")
+    if refresh:
+        # Ya hay datos: un refresh sin item no penaliza, el perfil sigue siendo candidato
+        print(f"🔁 {len(missing)} perfiles sin item en el refresh: siguen como done.")
+        wq.restore(missing)
+    else:
+        parked = wq.fail(missing, res["status"], f"sin item en el run {res['run_id']}")
+        print(f"🔁 {len(missing)} perfiles a retry_after con backoff ({parked} aparcados tras "
+              f"{wq.max_attempts} intentos).")
+
 
+def run(total_limit: int) -> int:
     processed = 0
-    for batch in chunked(pending, CHUNK_SIZE):
-        urls = [normalize_linkedin_url(u) for _, u in batch if u]
-        if not urls:
-            continue
-        items = harvest_for_urls(urls)  # 1) actor
-
-        # --- Marcar como INACCESSIBLE los que devolvieron error ---
-        failed_urls = []
-        for r in items:
-            # Algunos actores devuelven estructura con 'status' o 'error'
-            status = r.get("status")
-            if status == 403 or r.get("error"):
-                query = r.get("query") or {}
-                failed_urls.append(query.get("url"))
-
-        if failed_urls:
-            print(f"⚠️ {len(failed_urls)} perfiles marcados como INACCESIBLE.")
+    sent = 0                 # URLs enviadas a Apify: es lo que cuesta, haya items o no
+    with WorkQueue() as wq:
+        print(f"👷 Worker {wq.worker_id} (lease {wq.lease_seconds}s). CHUNK_SIZE={CHUNK_SIZE}")
+        # Solo un worker recalcula prioridades y da de alta perfiles nuevos a la vez
+        if wq.try_lock("prioritize"):
             try:
-                conn = psycopg2.connect(**DB)
-                with conn.cursor() as cur:
-                    cur.execute(f"SET search_path TO {SCHEMA}")
-                    for u in failed_urls:
-                        if u:
-                            cur.execute("""
-                                UPDATE profiles
-                                SET public_identifier = 'INACCESIBLE'
-                                WHERE LOWER(rtrim(linkedin_url,'/')) = LOWER(rtrim(%s,'/'));
-                            """, (u,))
-                conn.commit()
-                conn.close()
-            except Exception as e:
-                print(f"Error al marcar INACCESIBLE: {e}")
-        # ------------------------------------------------------------
-
-        n = update_items_in_db(items, REFRESH_CHILDREN)  # 2) update por linkedin_url (+ refresh hijos)
-        processed += n
-        print(f"🧾 Lote listo: {n} perfiles. Acumulado: {processed}")
-        if processed >= total_limit:
+                with profiling.stage("select"):
+                    refresh_new_priorities()
+                    counts = wq.prepare()
+                    if counts["migrated"]:
+                        print(f"🧭 {counts['migrated']} perfiles migrados (centinela INACCESIBLE / claims antiguos).")
+                    if counts["new"]:
+                        print(f"🧭 {counts['new']} perfiles nuevos en extraction_state.")
+            finally:
+                wq.unlock("prioritize")
+        with profiling.stage("known_filter"):
+            known = build_known_filter()
+            excluded = load_exclusions()
+        while sent < total_limit:
+            with profiling.stage("select"):
+                claimed = wq.claim(min(CHUNK_SIZE, total_limit - sent), MIN_CONNECTIONS)
+            if not claimed:
+                print("✅ No hay perfiles pendientes (state='pending').")
+                break
+
+            # URL canónica → profile_id, para reconciliar el run con lo enviado
+            by_key: Dict[str, int] = {}
+            bad, dup, excl, done_known = [], [], [], []
+            for pid, u in claimed:
+                k = normalize_linkedin_url(u)
+                if not k:
+                    bad.append(pid)
+                elif k in excluded:
+                    excl.append(pid)
+                elif k in by_key:
+                    dup.append(pid)
+                elif k in known:
+                    done_known.append(pid)
+                else:
+                    by_key[k] = pid
+            # Salen de pending para no reclamarlos otra vez en cada ejecución
+            if bad or dup or excl or done_known:
+                print(f"🧹 Sin enviar: {len(done_known)} ya extraídos → done · {len(excl)} excluidos y "
+                      f"{len(dup)} URLs repetidas → excluded · {len(bad)} URLs no válidas → parked.")
+            wq.skip_known(done_known)
+            wq.exclude(excl, "EXCLUDED")
+            wq.exclude(dup, "DUPLICATE_URL")
+            wq.park(bad, "BAD_URL", "URL de LinkedIn no válida")
+            if not by_key:
+                continue
+            QUEUE_SIZE.set(len(by_key))
+
+            res, n = process_batch(list(by_key))
+            reconcile(wq, by_key, res)
+            sent += len(by_key)
+            processed += n
+            print(f"🧾 Lote listo ({res['status']}): {n} perfiles. Acumulado: {processed}")
+        else:
+            print(f"⏹️ Alcanzado MAX_URLS_PER_RUN={MAX_URLS_PER_RUN}.")
+    QUEUE_SIZE.set(0)
+    return processed
+
+
+def run_refresh(total_limit: int) -> int:
+    """Re-extrae los done más antiguos dentro del presupuesto diario compartido."""
+    processed = 0
+    sent = 0
+    skipped: set = set()     # sin URL válida: no volver a reclamarlos en esta ejecución
+    with WorkQueue() as wq:
+        print(f"👷 Worker {wq.worker_id} en modo refresh: done > {es.REFRESH_MIN_AGE_DAYS:g} días, "
+              f"presupuesto {REFRESH_DAILY_BUDGET}/día"
+              + (f", prioridad >= {REFRESH_MIN_PRIORITY:g}" if REFRESH_MIN_PRIORITY is not None else ""))
+        while sent < total_limit:
+            granted = wq.reserve("refresh", min(CHUNK_SIZE, total_limit - sent), REFRESH_DAILY_BUDGET)
+            if not granted:
+                print(f"⏹️ Presupuesto de refresh agotado por hoy (REFRESH_DAILY_BUDGET={REFRESH_DAILY_BUDGET}).")
+                break
+            with profiling.stage("select"):
+                claimed = wq.claim_stale(granted, es.REFRESH_MIN_AGE_DAYS, REFRESH_MIN_PRIORITY, exclude=list(skipped))
+            by_key: Dict[str, int] = {}
+            for pid, u in claimed:
+                k = normalize_linkedin_url(u)
+                if k and k not in by_key:
+                    by_key[k] = pid
+                else:
+                    skipped.add(pid)
+            wq.restore(skipped.intersection(pid for pid, _ in claimed))
+            wq.refund("refresh", granted - len(by_key))
+            if not claimed:
+                print("✅ No hay perfiles que refrescar.")
+                break
+            if not by_key:
+                continue
+            QUEUE_SIZE.set(len(by_key))
+
+            res, n = process_batch(list(by_key))
+            reconcile(wq, by_key, res, refresh=True)
+            sent += len(by_key)
+            processed += n
+            print(f"🧾 Refresh listo ({res['status']}): {n} perfiles. Acumulado: {processed}")
+        else:
             print(f"⏹️ Alcanzado MAX_URLS_PER_RUN={MAX_URLS_PER_RUN}.")
-            break
+    QUEUE_SIZE.set(0)
+    return processed
+
+
+@profiling.profiled("orchestrator")
+def main(mode: str = ORCHESTRATOR_MODE):
+    metrics.init_from_env("orchestrator")
+    total_limit = MAX_URLS_PER_RUN if MAX_URLS_PER_RUN > 0 else 10**9
+    processed = run_refresh(total_limit) if mode == "refresh" else run(total_limit)
     print(f"🎉 Terminado. Perfiles actualizados: {processed}")
+    if processed:
+        from similar_profiles import update_if_present
+        update_if_present()
+
+
+def refresh_main():
+    main("refresh")
 
 if __name__ == "__main__":
     main()
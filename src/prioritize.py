@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+prioritize.py — Prioridad de extracción de los perfiles pendientes.
+
+Cada 1.000 perfiles cuestan $4, así que el presupuesto de MAX_URLS_PER_RUN
+debe ir a los perfiles más útiles, no a los primeros que se insertaron.
+Aquí se calcula `profiles.extraction_priority` con una función de valor
+configurable y el orquestador pide los K mejores por un índice parcial:
+
+  valor = W_CONNECTIONS · log(conexiones)      (máx. de BD y Slack, normalizado a 500)
+        + W_FOLLOWERS   · log(seguidores)      (máx. de BD y Slack, normalizado a 10k)
+        + W_HEADLINE    · score_headline/10    (filter_headlines_inplace, acotado a ±1)
+        + peso del país                        (PRIORITY_COUNTRY_WEIGHTS)
+
+Uso:
+  python prioritize.py                          # recalcula todos los pendientes
+  python prioritize.py --only-missing           # solo los que aún no tienen prioridad
+  python prioritize.py --slack-csv data/prueba/linkedin_unificado_with_slack_counts_llm.csv
+"""
+
+import argparse
+import math
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from config import db_params, db_schema, env
+from linkedin_urls import canonical_key
+
+W_CONNECTIONS = float(env("PRIORITY_W_CONNECTIONS", "1.0"))
+W_FOLLOWERS = float(env("PRIORITY_W_FOLLOWERS", "0.5"))
+W_HEADLINE = float(env("PRIORITY_W_HEADLINE", "1.0"))
+# "Argentina:0.3,España:0.5" — países no listados suman 0
+PRIORITY_COUNTRY_WEIGHTS = env("PRIORITY_COUNTRY_WEIGHTS", "")
+# CSV/Parquet de enriquecimiento Slack separados por comas (followersSlack, connectionsSlack, raw_headline, country)
+PRIORITY_SLACK_CSVS = env("PRIORITY_SLACK_CSVS", "")
+
+_LOG_CONN = math.log1p(500)
+_LOG_FOLL = math.log1p(10_000)
+
+
+def parse_country_weights(spec: str) -> Dict[str, float]:
+    out = {}
+    for part in spec.split(","):
+        if ":" in part:
+            k, v = part.rsplit(":", 1)
+            out[k.strip().lower()] = float(v)
+    return out
+
+
+COUNTRY_WEIGHTS = parse_country_weights(PRIORITY_COUNTRY_WEIGHTS)
+
+
+def ensure_priority_schema(cur) -> None:
+    """Columna + índice parcial de pendientes (solo DDL si faltan)."""
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema=%s AND table_name='profiles' AND column_name='extraction_priority'
+    """, (db_schema(),))
+    if not cur.fetchone():
+        cur.execute(f"ALTER TABLE {db_schema()}.profiles ADD COLUMN IF NOT EXISTS extraction_priority double precision")
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS profiles_pending_priority_idx
+        ON {db_schema()}.profiles (extraction_priority DESC NULLS LAST, profile_id)
+        WHERE public_identifier IS NULL AND linkedin_url IS NOT NULL
+    """)
+
+
+def value(connections: Optional[int], followers: Optional[int], headline: Optional[str],
+          country: Optional[str]) -> float:
+    from filter_headlines_inplace import score_headline
+
+    v = 0.0
+    if connections:
+        v += W_CONNECTIONS * math.log1p(max(0, connections)) / _LOG_CONN
+    if followers:
+        v += W_FOLLOWERS * math.log1p(max(0, followers)) / _LOG_FOLL
+    if headline and W_HEADLINE:
+        s = score_headline(headline)[0]
+        v += W_HEADLINE * max(-1.0, min(1.0, s / 10.0))
+    if country:
+        v += COUNTRY_WEIGHTS.get(str(country).strip().lower(), 0.0)
+    return round(v, 6)
+
+
+def load_slack_signals(paths: Iterable[str]) -> Dict[str, dict]:
+    """url canónica → {followers, connections, headline, country} desde los CSV de Slack."""
+    import pandas as pd
+    from working_store import load_frame
+
+    wanted = ["linkedinUrl", "salesNavigatorId", "followersSlack", "connectionsSlack", "raw_headline", "country"]
+    out: Dict[str, dict] = {}
+    for p in paths:
+        path = Path(p)
+        if not path.exists():
+            print(f"⚠️ No existe {path}, se ignora.")
+            continue
+        df = load_frame(path)
+        df = df[[c for c in wanted if c in df.columns]]
+        for r in df.to_dict("records"):
+            sig = {
+                "followers": r.get("followersSlack"),
+                "connections": r.get("connectionsSlack"),
+                "headline": r.get("raw_headline"),
+                "country": r.get("country"),
+            }
+            sig = {k: (None if pd.isna(v) else v) for k, v in sig.items()}
+            for u in (r.get("linkedinUrl"), r.get("salesNavigatorId")):
+                k = canonical_key(u) if isinstance(u, str) else None
+                if k:
+                    out[k] = sig
+    return out
+
+
+def _max(a, b):
+    vals = [int(x) for x in (a, b) if x is not None]
+    return max(vals) if vals else None
+
+
+def refresh_priorities(only_missing: bool = False, slack_paths: Optional[List[str]] = None,
+                       batch_size: int = 5000) -> int:
+    """Recalcula la prioridad de los pendientes y la escribe con un UPDATE ... FROM por lotes."""
+    if slack_paths is None:
+        slack_paths = [p for p in PRIORITY_SLACK_CSVS.split(",") if p.strip()]
+    slack = load_slack_signals(slack_paths) if slack_paths else {}
+
+    conn = psycopg2.connect(**db_params())
+    total = 0
+    try:
+        with conn.cursor() as cur:
+            ensure_priority_schema(cur)
+            cur.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema=%s AND table_name='profiles' AND column_name='pais_origen'
+            """, (db_schema(),))
+            country_col = "pais_origen" if cur.fetchone() else "NULL::text"
+        conn.commit()
+
+        where = "AND extraction_priority IS NULL" if only_missing else ""
+        with conn.cursor(name="prioritize") as rd, conn.cursor() as wr:
+            rd.itersize = batch_size
+            rd.execute(f"""
+                SELECT profile_id, linkedin_url, connections, followers, headline, {country_col}
+                FROM {db_schema()}.profiles
+                WHERE public_identifier IS NULL AND linkedin_url IS NOT NULL {where}
+            """)
+            buf: List[Tuple[int, float]] = []
+            for pid, url, conns, foll, headline, country in rd:
+                sig = slack.get(canonical_key(url), {})
+                buf.append((pid, value(
+                    _max(conns, sig.get("connections")),
+                    _max(foll, sig.get("followers")),
+                    headline or sig.get("headline"),
+                    country or sig.get("country"),
+                )))
+                if len(buf) >= batch_size:
+                    total += _write(wr, buf)
+                    buf = []
+            if buf:
+                total += _write(wr, buf)
+        conn.commit()
+    finally:
+        conn.close()
+    return total
+
+
+def _write(cur, rows: List[Tuple[int, float]]) -> int:
+    execute_values(cur, f"""
+        UPDATE {db_schema()}.profiles AS p SET extraction_priority = v.prio
+        FROM (VALUES %s) AS v(profile_id, prio)
+        WHERE p.profile_id = v.profile_id
+    """, rows, template="(%s::int, %s::float8)", page_size=len(rows))
+    return len(rows)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Calcula profiles.extraction_priority para los pendientes.")
+    ap.add_argument("--only-missing", action="store_true", help="Solo pendientes sin prioridad")
+    ap.add_argument("--slack-csv", nargs="*", help="CSV/Parquet con followersSlack/connectionsSlack/raw_headline")
+    args = ap.parse_args()
+    n = refresh_priorities(only_missing=args.only_missing, slack_paths=args.slack_csv)
+    print(f"🎯 Prioridad recalculada para {n} perfiles pendientes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+profile_history.py — Histórico append-only de followers / connections / headline.
+
+El upsert de json_2_sql.py pisa connections, followers y headline, y los
+scripts de Slack dejan followersSlack / connectionsSlack solo en los CSV. Aquí
+cada observación queda como una fila de profile_snapshots:
+- tabla particionada por mes (captured_at), creada por la migración 5
+  (`python migrate.py`); la ingesta crea la del mes actual y la del siguiente
+  en su propia transacción antes de empezar (prepare_partitions), y purgar
+  meses viejos es un DROP de la partición
+- solo se añade una fila si algo cambió respecto a la última de esa fuente,
+  así un refresh sin cambios no engorda el histórico
+- índice (profile_id, captured_at DESC) en cada partición para las series
+- profile_snapshot_latest guarda la última observación por (perfil, fuente):
+  leer "lo último" no depende del tamaño del histórico
+- fuentes: 'apify' (ingesta), 'slack_counts' (followers / connections del
+  enriquecimiento por unfurls) y 'slack_headline' (headline del unfurl); los
+  dos scripts de Slack rellenan campos distintos y cada uno tiene su fuente
+  para no pisarse en profile_snapshot_latest
+
+Uso:
+  python profile_history.py                                  # particiones y filas
+  python profile_history.py --profile https://www.linkedin.com/in/xxx
+  python profile_history.py --import-slack ../data/prueba/linkedin_enriquecido.csv
+"""
+
+import argparse
+import os
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from config import db_params, db_schema
+from migrate import PROFILE_HISTORY, require
+
+SOURCES = ("apify", "slack_counts", "slack_headline")
+# (profile_id, captured_at, source, followers, connections, headline)
+Snapshot = Tuple[int, datetime, str, Optional[int], Optional[int], Optional[str]]
+
+_partitions: Set[date] = set()
+
+
+def _month(d: datetime) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _next_month(m: date) -> date:
+    return date(m.year + (m.month == 12), m.month % 12 + 1, 1)
+
+
+def ensure_history_schema(cur) -> None:
+    """DDL de la migración 5 (migrate.py); la ingesta solo comprueba que esté aplicada."""
+    s = db_schema()
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {s}.profile_snapshots (
+            profile_id  integer NOT NULL,
+            captured_at timestamptz NOT NULL,
+            source      text NOT NULL,
+            followers   integer,
+            connections integer,
+            headline    text
+        ) PARTITION BY RANGE (captured_at)
+    """)
+    # en la tabla padre: Postgres lo replica en cada partición
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS profile_snapshots_series_idx
+        ON {s}.profile_snapshots (profile_id, captured_at DESC)
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {s}.profile_snapshot_latest (
+            profile_id  integer NOT NULL REFERENCES {s}.profiles(profile_id) ON DELETE CASCADE,
+            source      text NOT NULL,
+            captured_at timestamptz NOT NULL,
+            followers   integer,
+            connections integer,
+            headline    text,
+            PRIMARY KEY (profile_id, source)
+        )
+    """)
+
+
+def partition_name(month: date) -> str:
+    return f"profile_snapshots_y{month.year}m{month.month:02d}"
+
+
+def _create_partitions(cur, months: Iterable[date]) -> int:
+    s = db_schema()
+    n = 0
+    for m in sorted(set(months)):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {s}.{partition_name(m)}
+            PARTITION OF {s}.profile_snapshots FOR VALUES FROM (%s) TO (%s)
+        """, (m.isoformat(), _next_month(m).isoformat()))
+        n += 1
+    return n
+
+
+def prepare_partitions(conn, at: Optional[datetime] = None) -> int:
+    """
+    Mes actual y siguiente en su propia transacción, antes de la ingesta. Solo después del commit
+    cuentan como creados: un rollback posterior del lote no puede dejar `_partitions` mintiendo.
+    """
+    m = _month(at or datetime.now(timezone.utc))
+    months = {m, _next_month(m)} - _partitions
+    if not months:
+        return 0
+    with conn.cursor() as cur:
+        n = _create_partitions(cur, months)
+    conn.commit()
+    _partitions.update(months)
+    return n
+
+
+def ensure_partitions(cur, months: Iterable[date]) -> int:
+    """Meses que prepare_partitions no cubrió (p.ej. un CSV viejo): se crean en la transacción en curso, sin cachear."""
+    return _create_partitions(cur, set(months) - _partitions)
+
+
+def write_snapshots(cur, rows: Sequence[Snapshot]) -> int:
+    """Añade al histórico lo que cambió respecto a la última observación y actualiza latest. Devuelve filas añadidas."""
+    if not rows:
+        return 0
+    s = db_schema()
+    # una fila por (perfil, fuente) y lote: la más reciente
+    last: Dict[Tuple[int, str], Snapshot] = {}
+    for r in sorted(rows, key=lambda r: r[1]):
+        last[(r[0], r[2])] = r
+    rows = list(last.values())
+    ensure_partitions(cur, (_month(r[1]) for r in rows))
+
+    tpl = "(%s::int, %s::timestamptz, %s::text, %s::int, %s::int, %s::text)"
+    execute_values(cur, f"""
+        INSERT INTO {s}.profile_snapshots (profile_id, captured_at, source, followers, connections, headline)
+        SELECT v.* FROM (VALUES %s) AS v(profile_id, captured_at, source, followers, connections, headline)
+        LEFT JOIN {s}.profile_snapshot_latest l ON l.profile_id = v.profile_id AND l.source = v.source
+        WHERE l.profile_id IS NULL
+           OR (v.captured_at > l.captured_at
+               AND (l.followers, l.connections, l.headline) IS DISTINCT FROM (v.followers, v.connections, v.headline))
+           -- observaciones antiguas (p.ej. importar un CSV viejo): se añaden si no están ya
+           OR (v.captured_at < l.captured_at
+               AND NOT EXISTS (SELECT 1 FROM {s}.profile_snapshots x
+                               WHERE x.profile_id = v.profile_id AND x.captured_at = v.captured_at
+                                 AND x.source = v.source))
+    """, rows, template=tpl, page_size=len(rows))
+    added = cur.rowcount
+    execute_values(cur, f"""
+        INSERT INTO {s}.profile_snapshot_latest AS l
+            (profile_id, captured_at, source, followers, connections, headline)
+        VALUES %s
+        ON CONFLICT (profile_id, source) DO UPDATE
+          SET captured_at = EXCLUDED.captured_at, followers = EXCLUDED.followers,
+              connections = EXCLUDED.connections, headline = EXCLUDED.headline
+          WHERE EXCLUDED.captured_at > l.captured_at
+    """, rows, template=tpl, page_size=len(rows))
+    return added
+
+
+def profile_ids_for(cur, urls: Iterable[str]) -> Dict[str, int]:
+    cur.execute(f"SELECT linkedin_url, profile_id FROM {db_schema()}.profiles WHERE linkedin_url = ANY(%s)",
+                (list(set(urls)),))
+    return dict(cur.fetchall())
+
+
+def _int(v: Any) -> Optional[int]:
+    try:
+        return None if v is None or v != v else int(v)    # v != v: NaN / pd.NA de pandas
+    except (TypeError, ValueError):
+        return None
+
+
+def record_slack(results: Dict[str, dict], captured_at: Optional[datetime] = None) -> int:
+    """
+    Resultados de unfurl {url canónica: {"followers", "connections", ["headline"]}} → histórico.
+    Pensado para llamarse desde los scripts de Slack: abre y cierra su conexión. Los contadores van
+    a 'slack_counts' y el headline a 'slack_headline', así un script no anula los campos del otro.
+    """
+    captured_at = captured_at or datetime.now(timezone.utc)
+    vals = {u: r for u, r in results.items()
+            if r and (r.get("followers") is not None or r.get("connections") is not None or r.get("headline"))}
+    if not vals:
+        return 0
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor() as cur:
+            require(cur, PROFILE_HISTORY)
+            ids = profile_ids_for(cur, vals)
+            rows = []
+            for u, r in vals.items():
+                if u not in ids:
+                    continue
+                f, c = _int(r.get("followers")), _int(r.get("connections"))
+                if f is not None or c is not None:
+                    rows.append((ids[u], captured_at, "slack_counts", f, c, None))
+                if r.get("headline"):
+                    rows.append((ids[u], captured_at, "slack_headline", None, None, r["headline"]))
+            n = write_snapshots(cur, rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return n
+
+
+SLACK_HISTORY_TO_DB = os.getenv("SLACK_HISTORY_TO_DB", "true").lower() == "true"
+_slack_history_off = False
+
+
+def record_slack_batch(results: Dict[str, dict]) -> None:
+    """record_slack para los bucles de Slack: si la BD no está disponible avisa una vez y sigue sin histórico."""
+    global _slack_history_off
+    if not SLACK_HISTORY_TO_DB or _slack_history_off:
+        return
+    try:
+        record_slack(results)
+    except Exception as e:
+        _slack_history_off = True
+        print(f"⚠️ Histórico de Slack desactivado en esta ejecución: {e}")
+
+
+def import_slack_files(paths: Iterable[str]) -> Tuple[int, int]:
+    """CSV/Parquet de Slack ya generados → histórico (captured_at = mtime del fichero). Devuelve (filas, añadidas)."""
+    from linkedin_urls import canonical_key
+    from working_store import load_frame
+
+    seen = added = 0
+    for p in paths:
+        df = load_frame(p)
+        at = datetime.fromtimestamp(os.path.getmtime(p), timezone.utc)
+        results: Dict[str, dict] = {}
+        for r in df.to_dict("records"):
+            k = None
+            for u in (r.get("linkedinUrl"), r.get("salesNavigatorId")):
+                k = canonical_key(u) if isinstance(u, str) else None
+                if k:
+                    break
+            if not k:
+                continue
+            h = r.get("raw_headline")
+            results[k] = {"followers": r.get("followersSlack"), "connections": r.get("connectionsSlack"),
+                          "headline": h if isinstance(h, str) else None}
+        seen += len(results)
+        added += record_slack(results, at)
+        print(f"📈 {p}: {len(results)} perfiles")
+    return seen, added
+
+
+def series(cur, profile_id: int, source: Optional[str] = None) -> List[tuple]:
+    sql = f"""
+        SELECT captured_at, source, followers, connections, headline
+        FROM {db_schema()}.profile_snapshots WHERE profile_id = %s
+    """
+    params: list = [profile_id]
+    if source:
+        sql += " AND source = %s"
+        params.append(source)
+    cur.execute(sql + " ORDER BY captured_at", params)
+    return cur.fetchall()
+
+
+def history_summary(cur) -> List[tuple]:
+    s = db_schema()
+    cur.execute("""
+        SELECT c.relname, c.reltuples::bigint
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = %s AND p.relname = 'profile_snapshots'
+        ORDER BY c.relname
+    """, (s,))
+    return cur.fetchall()
+
+
+def main():
+    from linkedin_urls import canonical_key
+
+    ap = argparse.ArgumentParser(description="Histórico de followers/connections/headline por perfil.")
+    ap.add_argument("--profile", metavar="URL", help="Serie temporal de un perfil")
+    ap.add_argument("--source", choices=SOURCES, help="Filtra la serie por fuente")
+    ap.add_argument("--import-slack", nargs="+", metavar="CSV", help="Carga CSV/Parquet de Slack en el histórico")
+    args = ap.parse_args()
+
+    if args.import_slack:
+        seen, added = import_slack_files(args.import_slack)
+        print(f"📈 Slack: {seen} perfiles leídos, {added} observaciones nuevas")
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor() as cur:
+            require(cur, PROFILE_HISTORY)
+            if args.profile:
+                key = canonical_key(args.profile)
+                pid = profile_ids_for(cur, [key]).get(key) if key else None
+                if pid is None:
+                    print(f"❌ Perfil no encontrado: {args.profile}")
+                    return 1
+                for at, src, f, c, h in series(cur, pid, args.source):
+                    print(f"  {at:%Y-%m-%d %H:%M}  {src:<14}  followers={f}  connections={c}  {h or ''}")
+            else:
+                for name, est in history_summary(cur):
+                    print(f"  {name:<32} ~{max(est, 0)} filas")
+        conn.commit()
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
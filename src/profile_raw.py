@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+profile_raw.py — Item bruto de Apify por perfil (JSONB) y extracción bajo demanda.
+
+update_from_items solo normaliza unas pocas secciones; el resto
+(certifications, projects, topSkills, currentPosition, volunteering,
+honorsAndAwards, publications, courses...) se guarda tal cual en
+profile_raw.payload para no tener que volver a pagar el scrape:
+- se escribe por lotes (execute_values) en cada commit de la ingesta
+- se quitan las claves de transporte del actor (`element` duplica el perfil
+  entero, `query`, `requestId`...), el resto lo comprime el TOAST de Postgres
+  (lz4 si el servidor lo soporta)
+- GIN jsonb_path_ops sobre el payload para `payload @> '{...}'` e índices de
+  expresión para los campos que se consultan (RAW_INDEXES)
+- las columnas nuevas de profiles (EXTRA_COLUMNS) se rellenan con un UPDATE
+  por rangos de profile_id sobre profile_raw, sin volver a leer JSON en Python
+
+Uso:
+  python profile_raw.py                            # tamaño y cobertura
+  python profile_raw.py --import-archive ../data/apify_actor/raw/*.json
+  python profile_raw.py --indexes                  # GIN + expresión (CONCURRENTLY)
+  python profile_raw.py --backfill                 # todas las EXTRA_COLUMNS
+  python profile_raw.py --backfill current_company certifications_count
+"""
+
+import argparse
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from config import db_params, db_schema
+
+# Claves del item que son del transporte del actor, no del perfil
+RAW_DROP_KEYS = ("element", "query", "originalQuery", "requestId", "retries", "status", "entityId")
+
+
+def _count(key: str) -> str:
+    return (f"CASE WHEN jsonb_typeof(r.payload->'{key}') = 'array' "
+            f"THEN jsonb_array_length(r.payload->'{key}') END")
+
+
+# columna de profiles → (tipo, expresión sobre r.payload)
+EXTRA_COLUMNS: Dict[str, Tuple[str, str]] = {
+    "current_company":      ("text",    "r.payload->'currentPosition'->0->>'companyName'"),
+    "top_skills":           ("text",    "r.payload->>'topSkills'"),
+    "open_to_work":         ("boolean", "(r.payload->>'openToWork')::boolean"),
+    "premium":              ("boolean", "(r.payload->>'premium')::boolean"),
+    "registered_at":        ("timestamptz", "(r.payload->>'registeredAt')::timestamptz"),
+    "certifications_count": ("integer", _count("certifications")),
+    "projects_count":       ("integer", _count("projects")),
+    "volunteering_count":   ("integer", _count("volunteering")),
+    "honors_count":         ("integer", _count("honorsAndAwards")),
+    "publications_count":   ("integer", _count("publications")),
+    "courses_count":        ("integer", _count("courses")),
+}
+
+# nombre → definición (sin CREATE INDEX); el GIN sirve para cualquier `payload @> ...`
+RAW_INDEXES: Dict[str, str] = {
+    "profile_raw_payload_gin":    "USING gin (payload jsonb_path_ops)",
+    "profile_raw_company_idx":    "((lower(payload->'currentPosition'->0->>'companyName')))",
+    "profile_raw_country_idx":    "((payload->'location'->>'countryCode'))",
+    "profile_raw_open_to_work_idx": "(((payload->>'openToWork')::boolean)) WHERE (payload->>'openToWork')::boolean",
+}
+
+_raw_ready = False
+
+
+def ensure_raw_table(cur) -> None:
+    global _raw_ready
+    if _raw_ready:
+        return
+    s = db_schema()
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {s}.profile_raw (
+            profile_id integer PRIMARY KEY REFERENCES {s}.profiles(profile_id) ON DELETE CASCADE,
+            payload    jsonb NOT NULL,
+            fetched_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    cur.execute("SHOW server_version_num")
+    if int(cur.fetchone()[0]) >= 140000:
+        # lz4 comprime y descomprime bastante más rápido que pglz; si el servidor no lo trae, se queda pglz
+        cur.execute("SAVEPOINT raw_lz4")
+        try:
+            cur.execute(f"ALTER TABLE {s}.profile_raw ALTER COLUMN payload SET COMPRESSION lz4")
+            cur.execute("RELEASE SAVEPOINT raw_lz4")
+        except psycopg2.Error:
+            cur.execute("ROLLBACK TO SAVEPOINT raw_lz4")
+    _raw_ready = True
+
+
+def slim_payload(item: Dict[str, Any]) -> str:
+    return json.dumps({k: v for k, v in item.items() if k not in RAW_DROP_KEYS}, ensure_ascii=False)
+
+
+def write_raw(cur, rows: Sequence[Tuple[int, str]]) -> int:
+    """Upsert por lotes de (profile_id, payload JSON). Si un perfil sale dos veces gana el último."""
+    if not rows:
+        return 0
+    dedup = list({pid: (pid, payload) for pid, payload in rows}.values())
+    execute_values(cur, f"""
+        INSERT INTO {db_schema()}.profile_raw (profile_id, payload, fetched_at)
+        VALUES %s
+        ON CONFLICT (profile_id) DO UPDATE
+          SET payload = EXCLUDED.payload, fetched_at = EXCLUDED.fetched_at
+    """, dedup, template="(%s, %s::jsonb, now())", page_size=len(dedup))
+    return len(dedup)
+
+
+def ensure_raw_indexes(conn, names: Optional[Iterable[str]] = None) -> List[str]:
+    """CREATE INDEX CONCURRENTLY (necesita autocommit): no bloquea la ingesta mientras se construyen."""
+    s = db_schema()
+    created = []
+    with conn.cursor() as cur:
+        ensure_raw_table(cur)
+    conn.commit()
+    old = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name in names or RAW_INDEXES:
+                cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {s}.profile_raw {RAW_INDEXES[name]}")
+                created.append(name)
+    finally:
+        conn.autocommit = old
+    return created
+
+
+def backfill(conn, columns: Optional[Sequence[str]] = None, batch: int = 20000) -> Dict[str, int]:
+    """Añade las columnas que falten y las rellena desde profile_raw por rangos de profile_id."""
+    s = db_schema()
+    columns = list(columns or EXTRA_COLUMNS)
+    unknown = [c for c in columns if c not in EXTRA_COLUMNS]
+    if unknown:
+        raise ValueError(f"Columnas desconocidas: {', '.join(unknown)}")
+    with conn.cursor() as cur:
+        ensure_raw_table(cur)
+        for c in columns:
+            cur.execute(f"ALTER TABLE {s}.profiles ADD COLUMN IF NOT EXISTS {c} {EXTRA_COLUMNS[c][0]}")
+        conn.commit()
+        cur.execute(f"SELECT COALESCE(MIN(profile_id), 0), COALESCE(MAX(profile_id), -1) FROM {s}.profile_raw")
+        lo, hi = cur.fetchone()
+
+    sets = ", ".join(f"{c} = {EXTRA_COLUMNS[c][1]}" for c in columns)
+    olds = ", ".join(f"p.{c}" for c in columns)
+    news = ", ".join(EXTRA_COLUMNS[c][1] for c in columns)
+    # ROW(...) para que una sola columna también sea una fila comparable
+    sql = f"""
+        UPDATE {s}.profiles p SET {sets}
+        FROM {s}.profile_raw r
+        WHERE r.profile_id = p.profile_id AND r.profile_id BETWEEN %s AND %s
+          AND ROW({olds}) IS DISTINCT FROM ROW({news})
+    """
+    updated = 0
+    with conn.cursor() as cur:
+        for start in range(lo, hi + 1, batch):
+            cur.execute(sql, (start, start + batch - 1))
+            updated += cur.rowcount
+            conn.commit()     # un commit por rango: locks cortos y progreso que sobrevive a un corte
+    return {"columns": len(columns), "updated": updated}
+
+
+def import_archive(cur, paths: Iterable[str]) -> Tuple[int, int]:
+    """Carga items de JSON ya descargados para perfiles existentes. Devuelve (items, guardados)."""
+    from json_2_sql import load_items_file, normalize_linkedin_url
+
+    ensure_raw_table(cur)
+    by_url: Dict[str, str] = {}
+    n_items = 0
+    for path in paths:
+        for it in load_items_file(path):
+            n_items += 1
+            url = normalize_linkedin_url(it.get("linkedinUrl"))
+            if url:
+                by_url[url] = slim_payload(it)     # ficheros en orden: el más reciente pisa
+    if not by_url:
+        return n_items, 0
+    cur.execute(f"SELECT linkedin_url, profile_id FROM {db_schema()}.profiles WHERE linkedin_url = ANY(%s)",
+                (list(by_url),))
+    rows = [(pid, by_url[url]) for url, pid in cur.fetchall()]
+    return n_items, write_raw(cur, rows)
+
+
+def raw_summary(cur) -> Dict[str, Any]:
+    s = db_schema()
+    ensure_raw_table(cur)
+    cur.execute(f"""
+        SELECT (SELECT COUNT(*) FROM {s}.profile_raw),
+               (SELECT COUNT(*) FROM {s}.profiles WHERE public_identifier IS NOT NULL),
+               pg_total_relation_size(%s::regclass)
+    """, (f"{s}.profile_raw",))
+    n_raw, n_prof, size = cur.fetchone()
+    return {"raw": n_raw, "extraidos": n_prof, "bytes": size}
+
+
+def main():
+    import glob
+
+    ap = argparse.ArgumentParser(description="Payload bruto de Apify por perfil (JSONB).")
+    ap.add_argument("--import-archive", nargs="+", metavar="JSON",
+                    help="Guarda los items de estos ficheros para los perfiles que ya están en la BD")
+    ap.add_argument("--indexes", action="store_true", help="Crea los índices GIN y de expresión")
+    ap.add_argument("--backfill", nargs="*", metavar="COLUMNA",
+                    help=f"Rellena columnas de profiles desde el payload ({', '.join(EXTRA_COLUMNS)})")
+    ap.add_argument("--batch", type=int, default=20000, help="profile_ids por UPDATE en --backfill")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        if args.import_archive:
+            paths = sorted(p for pat in args.import_archive for p in (glob.glob(pat) or [pat]))
+            with conn.cursor() as cur:
+                n_items, n_saved = import_archive(cur, paths)
+            conn.commit()
+            print(f"📦 {n_items} items en {len(paths)} ficheros → {n_saved} payloads guardados")
+        if args.indexes:
+            print(f"🗂️ Índices: {', '.join(ensure_raw_indexes(conn))}")
+        if args.backfill is not None:
+            out = backfill(conn, args.backfill, args.batch)
+            print(f"🧱 Backfill de {out['columns']} columnas: {out['updated']} perfiles actualizados")
+        with conn.cursor() as cur:
+            st = raw_summary(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"📦 profile_raw: {st['raw']} payloads de {st['extraidos']} perfiles extraídos · "
+          f"{st['bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+profiling.py — Perfilado opcional de los puntos de entrada, activado por entorno.
+
+  PROFILE=cprofile   perfilador determinista (cProfile) del hilo principal
+  PROFILE=sample     muestreo de pilas de todos los hilos cada PROFILE_SAMPLE_MS ms
+  (sin PROFILE o PROFILE=off: `profiled` devuelve la función tal cual → coste cero)
+
+Salida en PROFILE_DIR (por defecto logs/profiles/<job>_<ts>/):
+  cprofile → <etapa>.prof (pstats / snakeviz) + <etapa>.txt (top por tiempo acumulado)
+  sample   → <etapa>.collapsed + all.collapsed (formato "pila;plegada N" para
+             flamegraph.pl, speedscope o inferno)
+
+Las etapas se marcan con `with profiling.stage("apify"):`. En modo cprofile cada
+etapa tiene su propio Profile (solo en el hilo que arrancó el perfilado); en modo
+sample las muestras de cada hilo se atribuyen a la etapa activa en ese hilo.
+
+Uso:
+  @profiling.profiled("orchestrator")
+  def main(): ...
+  PROFILE=sample PROFILE_SAMPLE_MS=5 python orchestrate_from_db.py
+"""
+
+import cProfile
+import functools
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from config import PROJECT_ROOT, env
+
+PROFILE = env("PROFILE", "off").lower()          # off | cprofile | sample
+PROFILE_DIR = Path(env("PROFILE_DIR", PROJECT_ROOT / "logs" / "profiles"))
+PROFILE_SAMPLE_MS = float(env("PROFILE_SAMPLE_MS", "10"))
+PROFILE_TOP = int(env("PROFILE_TOP", "40"))
+
+MAIN_STAGE = "main"
+_NULL = nullcontext()
+_session: Optional["_Session"] = None
+
+
+def enabled() -> bool:
+    return PROFILE in ("cprofile", "sample")
+
+
+class _Session:
+    def __init__(self, job: str, mode: str, out_dir: Path):
+        self.job = job
+        self.mode = mode
+        self.out_dir = out_dir
+        self.owner = threading.get_ident()
+        self._stages: Dict[int, List[str]] = defaultdict(lambda: [MAIN_STAGE])   # hilo → pila de etapas
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._samples: Dict[str, Counter] = defaultdict(Counter)
+        self._wall: Dict[str, float] = defaultdict(float)
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    # ------------------ ciclo de vida ------------------
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            self._profile(MAIN_STAGE).enable()
+        else:
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True, name="profiling-sampler")
+            self._sampler.start()
+
+    def stop(self) -> None:
+        if self.mode == "cprofile":
+            self._profile(self.current(self.owner)).disable()
+        else:
+            self._stop.set()
+            self._sampler.join()
+        self._write()
+
+    # ------------------ etapas ------------------
+    def current(self, tid: int) -> str:
+        return self._stages[tid][-1]
+
+    def _profile(self, name: str) -> cProfile.Profile:
+        if name not in self._profiles:
+            self._profiles[name] = cProfile.Profile()
+        return self._profiles[name]
+
+    @contextmanager
+    def stage(self, name: str):
+        tid = threading.get_ident()
+        stack = self._stages[tid]
+        switch = self.mode == "cprofile" and tid == self.owner
+        if switch:
+            self._profile(stack[-1]).disable()
+            self._profile(name).enable()
+        stack.append(name)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._wall[name] += time.perf_counter() - t0
+            stack.pop()
+            if switch:
+                self._profile(name).disable()
+                self._profile(stack[-1]).enable()
+
+    # ------------------ muestreo ------------------
+    def _sample_loop(self) -> None:
+        me = threading.get_ident()
+        interval = PROFILE_SAMPLE_MS / 1000.0
+        names = {}
+        while not self._stop.wait(interval):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self._samples[self.current(tid)][";".join(reversed(stack))] += 1
+
+    # ------------------ salida ------------------
+    def _write(self) -> None:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        if self.mode == "cprofile":
+            for name, prof in self._profiles.items():
+                prof.dump_stats(str(self.out_dir / f"{name}.prof"))
+                buf = io.StringIO()
+                try:
+                    pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(PROFILE_TOP)
+                except TypeError:   # etapa sin llamadas registradas
+                    continue
+                (self.out_dir / f"{name}.txt").write_text(buf.getvalue(), encoding="utf-8")
+        else:
+            total = Counter()
+            for name, counts in self._samples.items():
+                total.update(counts)
+                _write_collapsed(self.out_dir / f"{name}.collapsed", counts)
+            _write_collapsed(self.out_dir / "all.collapsed", total)
+        lines = [f"{name}\t{secs:.3f}s" for name, secs in sorted(self._wall.items(), key=lambda kv: -kv[1])]
+        (self.out_dir / "stages.tsv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        print(f"🔬 Perfil ({self.mode}) guardado en {self.out_dir}")
+
+
+def _write_collapsed(path: Path, counts: Counter) -> None:
+    with open(path, "w", encoding="utf-8") as fh:
+        for stack, n in counts.most_common():
+            fh.write(f"{stack} {n}\n")
+
+
+def stage(name: str):
+    """Marca una etapa. Sin perfilado activo devuelve un contexto nulo compartido."""
+    if _session is None:
+        return _NULL
+    return _session.stage(name)
+
+
+def profiled(job: str) -> Callable:
+    """Decorador para los main(). Con PROFILE desactivado no envuelve nada."""
+    def deco(fn: Callable) -> Callable:
+        if not enabled():
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            global _session
+            if _session is not None:        # main() anidado (p.ej. desde el CLI): ya hay sesión
+                return fn(*args, **kwargs)
+            out_dir = PROFILE_DIR / f"{job}_{time.strftime('%Y%m%d-%H%M%S')}"
+            _session = _Session(job, PROFILE, out_dir)
+            _session.start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _session.stop()
+                _session = None
+        return wrapper
+    return deco
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+similar_profiles.py — "Candidatos parecidos a este perfil" con un índice local TF-IDF.
+
+Lee profiles, profile_skills y experiences en bloque (tres consultas con
+cursor de servidor) y construye, por perfil, un vector disperso:
+- skills completas ("s:apache spark") y tokens de títulos de experiencia y
+  headline ("t:engineer"), sin acentos y en minúsculas
+- peso (1 + log tf) · idf · peso del campo, normalizado L2 → coseno = producto
+Cada segmento se guarda en data/similarity/ como arrays .npy que se abren con
+mmap (np.load(mmap_mode="r")): filas CSR (pids, indptr, indices, data) para
+leer el vector de un perfil y el índice invertido por término (t_indptr,
+t_rows, t_data) para puntuar solo las filas que comparten algún término.
+
+Actualización incremental: --update añade un segmento con los perfiles
+ingestados (last_scraped_at) desde la última construcción; si un perfil ya
+estaba, cuenta su fila del segmento más nuevo. Los segmentos viejos conservan
+el idf con el que se construyeron; cuando hay SIMILARITY_MAX_SEGMENTS se
+reconstruye entero (compactación). El orquestador llama a update_if_present()
+al terminar si el índice existe.
+
+Uso:
+  python similar_profiles.py --build
+  python similar_profiles.py --update
+  python similar_profiles.py --similar https://www.linkedin.com/in/xxx -k 20
+  python similar_profiles.py --similar 1234
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import psycopg2
+
+from config import PROJECT_ROOT, db_params, db_schema
+
+INDEX_DIR = Path(os.getenv("SIMILARITY_DIR", str(PROJECT_ROOT / "data" / "similarity")))
+SKILL_WEIGHT = float(os.getenv("SIMILARITY_SKILL_WEIGHT", "1.0"))
+TITLE_WEIGHT = float(os.getenv("SIMILARITY_TITLE_WEIGHT", "0.7"))
+MAX_SEGMENTS = int(os.getenv("SIMILARITY_MAX_SEGMENTS", "8"))
+# términos de la consulta presentes en más de esta fracción de perfiles no se puntúan:
+# aportan poco al coseno y son las listas de postings más largas
+MAX_DF_FRACTION = float(os.getenv("SIMILARITY_MAX_DF_FRACTION", "0.25"))
+FETCH_SIZE = 20000
+SIMILARITY_AUTO_UPDATE = os.getenv("SIMILARITY_AUTO_UPDATE", "true").lower() == "true"
+
+MANIFEST = "manifest.json"
+LOCK_FILE = ".lock"
+SEGMENT_ARRAYS = ("pids", "indptr", "indices", "data", "t_indptr", "t_rows", "t_data")
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9]+)*")
+STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "en", "y", "e", "o", "a", "al", "para", "por", "con", "un", "una",
+    "the", "of", "and", "at", "in", "for", "to", "on", "with", "an", "or", "as", "from",
+}
+
+
+# ------------------ Términos ------------------
+def _norm(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(c for c in s if not unicodedata.combining(c)).lower().strip()
+
+
+def title_tokens(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(_norm(text)) if len(t) > 1 and t not in STOPWORDS]
+
+
+def profile_terms(headline: Optional[str], titles: Iterable[str], skills: Iterable[str]) -> Counter:
+    """Frecuencias de términos de un perfil: 's:<skill>' y 't:<token>' (títulos + headline)."""
+    tf: Counter = Counter()
+    for sk in skills:
+        sk = _norm(sk or "")
+        if sk:
+            tf["s:" + sk] = 1
+    for text in (headline, *titles):
+        tf.update("t:" + t for t in title_tokens(text))
+    return tf
+
+
+def _field_weight(term: str) -> float:
+    return SKILL_WEIGHT if term.startswith("s:") else TITLE_WEIGHT
+
+
+# ------------------ Lectura en bloque ------------------
+def _stream(conn, name: str, sql: str, params: Sequence = ()) -> Iterable[tuple]:
+    with conn.cursor(name=name) as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(sql, params)
+        yield from cur
+
+
+def read_documents(conn, profile_ids: Optional[Sequence[int]] = None) -> Dict[int, Counter]:
+    """profile_id → frecuencias de términos, para todos los perfiles extraídos o solo para `profile_ids`."""
+    s = db_schema()
+    where, params = "", ()
+    if profile_ids is not None:
+        where, params = "AND x.profile_id = ANY(%s)", (list(profile_ids),)
+    headlines: Dict[int, Optional[str]] = {}
+    for pid, h in _stream(conn, "sim_profiles", f"""
+        SELECT x.profile_id, x.headline FROM {s}.profiles x
+        WHERE x.public_identifier IS NOT NULL {where}
+    """, params):
+        headlines[pid] = h
+    skills: Dict[int, List[str]] = defaultdict(list)
+    for pid, name in _stream(conn, "sim_skills", f"""
+        SELECT x.profile_id, k.skill_name FROM {s}.profile_skills x
+        JOIN {s}.skills k ON k.skill_id = x.skill_id
+        WHERE true {where}
+    """, params):
+        skills[pid].append(name)
+    titles: Dict[int, List[str]] = defaultdict(list)
+    for pid, t in _stream(conn, "sim_titles", f"""
+        SELECT x.profile_id, x.title FROM {s}.experiences x
+        WHERE x.title IS NOT NULL {where}
+    """, params):
+        titles[pid].append(t)
+    conn.commit()
+    docs = {pid: profile_terms(h, titles.get(pid, ()), skills.get(pid, ())) for pid, h in headlines.items()}
+    return {pid: tf for pid, tf in docs.items() if tf}
+
+
+# ------------------ Segmentos ------------------
+def _idf(df: int, n_docs: int) -> float:
+    return math.log((1 + n_docs) / (1 + df)) + 1.0
+
+
+def build_segment(docs: Dict[int, Counter], vocab: Dict[str, int], df: List[int], n_docs: int) -> Dict[str, np.ndarray]:
+    """Arrays CSR + invertidos de un segmento. `vocab`/`df` ya incluyen los términos de `docs`."""
+    pids = np.array(sorted(docs), dtype=np.int64)
+    indptr = np.zeros(len(pids) + 1, dtype=np.int64)
+    indices: List[int] = []
+    data: List[float] = []
+    for row, pid in enumerate(pids):
+        items = sorted((vocab[t], (1.0 + math.log(c)) * _idf(df[vocab[t]], n_docs) * _field_weight(t))
+                       for t, c in docs[int(pid)].items())
+        norm = math.sqrt(sum(w * w for _, w in items)) or 1.0
+        indices.extend(i for i, _ in items)
+        data.extend(w / norm for _, w in items)
+        indptr[row + 1] = len(indices)
+    indices_a = np.array(indices, dtype=np.int32)
+    data_a = np.array(data, dtype=np.float32)
+    rows = np.repeat(np.arange(len(pids), dtype=np.int32), np.diff(indptr))
+    order = np.argsort(indices_a, kind="stable")
+    t_indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices_a, minlength=len(vocab)), out=t_indptr[1:])
+    return {"pids": pids, "indptr": indptr, "indices": indices_a, "data": data_a,
+            "t_indptr": t_indptr, "t_rows": rows[order], "t_data": data_a[order]}
+
+
+def _write_segment(root: Path, name: str, arrays: Dict[str, np.ndarray]) -> None:
+    tmp = root / (name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for k in SEGMENT_ARRAYS:
+        np.save(tmp / f"{k}.npy", arrays[k])
+    tmp.replace(root / name)
+
+
+def _write_manifest(root: Path, manifest: dict) -> None:
+    tmp = root / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(root / MANIFEST)
+
+
+def load_manifest(root: Path = INDEX_DIR) -> Optional[dict]:
+    p = root / MANIFEST
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else None
+
+
+def _db_now(conn) -> str:
+    with conn.cursor() as cur:
+        cur.execute("SELECT now()")
+        at = cur.fetchone()[0]
+    conn.commit()
+    return at.isoformat()
+
+
+def build(conn, root: Path = INDEX_DIR) -> int:
+    """Índice completo en un único segmento (sustituye a los anteriores). Devuelve perfiles indexados."""
+    built_at = _db_now(conn)
+    docs = read_documents(conn)
+    vocab: Dict[str, int] = {}
+    df: List[int] = []
+    for tf in docs.values():
+        for t in tf:
+            i = vocab.setdefault(t, len(df))
+            if i == len(df):
+                df.append(0)
+            df[i] += 1
+    root.mkdir(parents=True, exist_ok=True)
+    old = load_manifest(root)
+    name = f"seg_{int(time.time() * 1000)}"
+    _write_segment(root, name, build_segment(docs, vocab, df, len(docs)))
+    _write_manifest(root, {"built_at": built_at, "updated_at": built_at, "n_docs": len(docs),
+                           "segments": [name], "vocab": vocab, "df": df})
+    for seg in (old or {}).get("segments", []):
+        if seg != name:
+            shutil.rmtree(root / seg, ignore_errors=True)
+    return len(docs)
+
+
+def changed_since(conn, since: str) -> List[int]:
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT profile_id FROM {db_schema()}.profiles WHERE last_scraped_at > %s", (since,))
+        ids = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    return ids
+
+
+def update(conn, profile_ids: Optional[Sequence[int]] = None, root: Path = INDEX_DIR) -> int:
+    """
+    Añade un segmento con `profile_ids` (por defecto, los ingestados desde la última actualización).
+    Sin índice, o con MAX_SEGMENTS segmentos, reconstruye entero. Devuelve perfiles indexados.
+    """
+    manifest = load_manifest(root)
+    if manifest is None or len(manifest["segments"]) >= MAX_SEGMENTS:
+        return build(conn, root)
+    updated_at = _db_now(conn)
+    if profile_ids is None:
+        profile_ids = changed_since(conn, manifest["updated_at"])
+    docs = read_documents(conn, profile_ids) if profile_ids else {}
+    if not docs:
+        manifest["updated_at"] = updated_at
+        _write_manifest(root, manifest)
+        return 0
+
+    vocab: Dict[str, int] = manifest["vocab"]
+    df: List[int] = manifest["df"]
+    # df/n_docs solo crecen con perfiles nuevos; los re-ingestados no se descuentan (la compactación lo corrige)
+    indexed = SimilarityIndex(root, manifest)
+    new = [pid for pid in docs if indexed.locate(pid) is None]
+    for tf in docs.values():
+        for t in tf:
+            i = vocab.setdefault(t, len(df))
+            if i == len(df):
+                df.append(0)
+    for pid in new:
+        for t in docs[pid]:
+            df[vocab[t]] += 1
+    manifest["n_docs"] += len(new)
+    name = f"seg_{int(time.time() * 1000)}"
+    _write_segment(root, name, build_segment(docs, vocab, df, manifest["n_docs"]))
+    manifest["segments"].append(name)
+    manifest["updated_at"] = updated_at
+    _write_manifest(root, manifest)
+    return len(docs)
+
+
+def update_if_present(root: Path = INDEX_DIR) -> None:
+    """Para el final del orquestador: actualiza el índice si existe; si otro proceso lo está tocando, no espera."""
+    if not SIMILARITY_AUTO_UPDATE or load_manifest(root) is None:
+        return
+    lock = root / LOCK_FILE
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        print(f"⚠️ Índice de similitud ocupado ({lock}); se actualizará en la próxima ejecución.")
+        return
+    try:
+        os.close(fd)
+        conn = psycopg2.connect(**db_params())
+        try:
+            n = update(conn, root=root)
+        finally:
+            conn.close()
+        print(f"🧲 Índice de similitud: {n} perfiles actualizados")
+    except Exception as e:
+        print(f"⚠️ No se pudo actualizar el índice de similitud: {e}")
+    finally:
+        lock.unlink(missing_ok=True)
+
+
+# ------------------ Consulta ------------------
+class SimilarityIndex:
+    """Segmentos abiertos con mmap; cada perfil cuenta solo en el segmento más nuevo que lo contiene."""
+
+    def __init__(self, root: Path = INDEX_DIR, manifest: Optional[dict] = None):
+        self.manifest = manifest or load_manifest(root)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No hay índice de similitud en {root}: ejecuta `python similar_profiles.py --build`")
+        self.segments = [{k: np.load(root / seg / f"{k}.npy", mmap_mode="r") for k in SEGMENT_ARRAYS}
+                         for seg in self.manifest["segments"]]
+        sizes = [len(g["pids"]) for g in self.segments]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        all_pids = np.concatenate([np.asarray(g["pids"]) for g in self.segments]) if sizes else np.zeros(0, np.int64)
+        # última aparición de cada pid (segmentos en orden de antigüedad)
+        uniq, first_rev = np.unique(all_pids[::-1], return_index=True)
+        self._pids = uniq
+        self._where = len(all_pids) - 1 - first_rev
+        alive = np.zeros(len(all_pids), dtype=bool)
+        alive[self._where] = True
+        self.alive = [alive[self.offsets[i]:self.offsets[i + 1]] for i in range(len(self.segments))]
+        self.max_df = MAX_DF_FRACTION * max(self.manifest["n_docs"], 1)
+        self.df = np.asarray(self.manifest["df"], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._pids)
+
+    def locate(self, pid: int) -> Optional[Tuple[int, int]]:
+        i = int(np.searchsorted(self._pids, pid))
+        if i >= len(self._pids) or self._pids[i] != pid:
+            return None
+        g = int(self._where[i])
+        seg = int(np.searchsorted(self.offsets, g, side="right")) - 1
+        return seg, g - int(self.offsets[seg])
+
+    def vector(self, pid: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        loc = self.locate(pid)
+        if loc is None:
+            return None
+        g = self.segments[loc[0]]
+        a, b = g["indptr"][loc[1]], g["indptr"][loc[1] + 1]
+        return np.asarray(g["indices"][a:b]), np.asarray(g["data"][a:b])
+
+    def query(self, q_idx: np.ndarray, q_val: np.ndarray, k: int = 20,
+              exclude: Sequence[int] = ()) -> List[Tuple[int, float]]:
+        """Top-k (profile_id, coseno) para un vector normalizado (índices de término, pesos)."""
+        keep = self.df[q_idx] <= self.max_df
+        q_idx, q_val = q_idx[keep], q_val[keep]
+        best: List[Tuple[float, int]] = []
+        for g, alive in zip(self.segments, self.alive):
+            n_terms = len(g["t_indptr"]) - 1
+            rows, weights = [], []
+            for t, w in zip(q_idx, q_val):
+                if t >= n_terms:
+                    continue
+                a, b = g["t_indptr"][t], g["t_indptr"][t + 1]
+                rows.append(g["t_rows"][a:b])
+                weights.append(g["t_data"][a:b] * w)
+            if not rows:
+                continue
+            scores = np.bincount(np.concatenate(rows), weights=np.concatenate(weights), minlength=len(alive))
+            scores[~alive] = 0.0
+            if exclude:
+                scores[np.isin(g["pids"], exclude)] = 0.0
+            top = min(k, len(scores))
+            cand = np.argpartition(-scores, top - 1)[:top]
+            best += [(float(scores[r]), int(g["pids"][r])) for r in cand if scores[r] > 0]
+        best.sort(reverse=True)
+        return [(pid, score) for score, pid in best[:k]]
+
+    def similar(self, pid: int, k: int = 20) -> List[Tuple[int, float]]:
+        v = self.vector(pid)
+        return self.query(v[0], v[1], k, exclude=[pid]) if v is not None else []
+
+
+def describe(cur, pids: Sequence[int]) -> Dict[int, tuple]:
+    cur.execute(f"""
+        SELECT profile_id, linkedin_url, first_name, last_name, headline
+        FROM {db_schema()}.profiles WHERE profile_id = ANY(%s)
+    """, (list(pids),))
+    return {r[0]: r[1:] for r in cur.fetchall()}
+
+
+def main():
+    from linkedin_urls import canonical_key
+    from profile_history import profile_ids_for
+
+    ap = argparse.ArgumentParser(description="Índice local de similitud entre perfiles (TF-IDF, coseno).")
+    ap.add_argument("--build", action="store_true", help="Construye el índice completo (compacta los segmentos)")
+    ap.add_argument("--update", action="store_true", help="Añade los perfiles ingestados desde la última actualización")
+    ap.add_argument("--similar", metavar="URL|ID", help="Perfiles más parecidos a este")
+    ap.add_argument("-k", type=int, default=20)
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        if args.build or args.update:
+            t0 = time.perf_counter()
+            n = build(conn) if args.build else update(conn)
+            m = load_manifest()
+            print(f"🧲 {n} perfiles indexados en {time.perf_counter() - t0:.1f}s "
+                  f"({len(m['segments'])} segmentos, {len(m['vocab'])} términos) → {INDEX_DIR}")
+        if args.similar:
+            with conn.cursor() as cur:
+                if args.similar.isdigit():
+                    pid = int(args.similar)
+                else:
+                    key = canonical_key(args.similar)
+                    pid = profile_ids_for(cur, [key]).get(key) if key else None
+                if pid is None:
+                    print(f"❌ Perfil no encontrado: {args.similar}")
+                    return 1
+                idx = SimilarityIndex()
+                t0 = time.perf_counter()
+                hits = idx.similar(pid, args.k)
+                ms = (time.perf_counter() - t0) * 1000
+                info = describe(cur, [pid] + [h for h, _ in hits])
+            conn.commit()
+            if idx.locate(pid) is None:
+                print(f"⚠️ El perfil #{pid} no está en el índice (¿falta --update?)")
+            me = info.get(pid)
+            if me:
+                print(f"🎯 #{pid} {' '.join(x for x in me[1:3] if x)} — {me[3] or ''}")
+            for h, score in hits:
+                url, first, last, headline = info.get(h, (None, None, None, None))
+                name = " ".join(x for x in (first, last) if x)
+                print(f"  {score:.3f}  #{h:<7} {name[:28]:<28} {(headline or '')[:60]:<60} {url or ''}")
+            print(f"🧲 {len(hits)} parecidos de {len(idx)} perfiles en {ms:.1f} ms")
+        elif not (args.build or args.update):
+            m = load_manifest()
+            if m is None:
+                print(f"ℹ️ Sin índice en {INDEX_DIR}: ejecuta --build")
+            else:
+                print(f"🧲 {m['n_docs']} perfiles, {len(m['segments'])} segmentos, {len(m['vocab'])} términos; "
+                      f"construido {m['built_at']}, actualizado {m['updated_at']}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -7,15 +7,16 @@ versión con:
 - recorte de texto largo
 - dtypes de pandas arreglados
 - salto de LLM cuando no hay info
+- caché del LLM y re-extracción offline desde el almacén de unfurls:
+    python "slack+ollama_enrichment_profiles.py" --reextract [--no-llm]
 """
 
+import argparse
 import os
 import time
 import re
 import sys
 import signal
-import tempfile
-import shutil
 import json
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
@@ -23,8 +24,17 @@ from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
 
 import pandas as pd
 import requests
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
+
+import metrics
+import profiling
+from delta_backup import DeltaBackup
+from known_profiles import KnownProfiles, build_known_filter
+from linkedin_urls import canonical_key, get_salesnav_map
+from profile_history import record_slack_batch
+from unfurl_engine import UnfurlShard, fetch_unfurls, run_sharded, shards_from_env
+from unfurl_metrics import RE_CONNECTIONS, RE_FOLLOWERS, extract_metrics, extract_metrics_column  # noqa: F401
+from unfurl_store import LLMCache, llm_key, load_unfurls, unfurl_texts
+from working_store import export_csv, is_parquet, load_frame, save_frame, working_path
 
 
 # ============================================================
@@ -34,12 +44,15 @@ from slack_sdk.errors import SlackApiError
 # CSV de entrada
 CSV_PATH = Path(r"data\prueba\linkedin_unificado.csv")  # ← cámbialo a tu CSV de origen
 
-# CSV de salida
-OUT_PATH = CSV_PATH.with_name(CSV_PATH.stem + "_with_slack_counts_llm.csv")
+# CSV de salida (con WORKING_FORMAT=parquet se trabaja sobre un .parquet y el CSV se exporta al final)
+OUT_CSV = CSV_PATH.with_name(CSV_PATH.stem + "_with_slack_counts_llm.csv")
+OUT_PATH = working_path(OUT_CSV)
 
 # Slack
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_CHANNEL_ID = "C09NNL40TB2"
+# Para repartir los lotes entre varios canales/tokens (separados por comas):
+#   SLACK_CHANNEL_IDS=C1,C2,C3   SLACK_BOT_TOKENS=xoxb-a,xoxb-b
 
 # Lotes y tiempos
 BATCH_SIZE = 5
@@ -52,7 +65,7 @@ SAVE_PER_URL = True
 BACKUP_EVERY_N_BATCHES = 50
 DELETE_MESSAGES = True
 
-# Debug
+# Debug (los attachments se guardan siempre en data/unfurls/, ver unfurl_store.py)
 DUMP_JSON = False
 LOG_DIR = Path("logs_unfurl")
 
@@ -91,14 +104,7 @@ NO expliques nada. NO añadas texto fuera del JSON. Responde solo con JSON váli
 
 # ------------------ Normalización y utilidades ------------------
 def normalize_url(u: Optional[str]) -> Optional[str]:
-    if u is None or (isinstance(u, float) and pd.isna(u)):
-        return None
-    s = str(u).strip()
-    if not s:
-        return None
-    if not s.startswith("http"):
-        s = "https://www.linkedin.com/in/" + s.lstrip("/")
-    return s.split("?", 1)[0].rstrip("/")
+    return canonical_key(u)
 
 
 def add_probe_param(u: str) -> str:
@@ -115,73 +121,36 @@ def chunked(seq: List[str], size: int):
         yield seq[i:i+size]
 
 
-# ------------------ Regex contactos/conexiones ------------------
-RE_FOLLOWERS = [
-    r"(\d[\d\.\, ]*\+?)\s*(followers|seguidores)\b",
-    r"(followers|seguidores)\s*[:\-]?\s*(\d[\d\.\, ]*\+?)\b",
-]
-RE_CONNECTIONS = [
-    r"(\d[\d\.\, ]*\+?)\s*(connections|conexiones|contactos)\b",
-    r"(connections|conexiones|contactos)\s*[:\-]?\s*(\d[\d\.\, ]*\+?)\b",
-]
-
-
-def _parse_number(tok: str) -> Optional[int]:
-    s = tok.strip().lower().replace(" ", "")
-    mult = 1
-    if s.endswith("k"):
-        mult, s = 1000, s[:-1]
-    elif s.endswith("m"):
-        mult, s = 1_000_000, s[:-1]
-    if s.endswith("+"):
-        s = s[:-1]
-    s = s.replace(".", "").replace(",", "")
-    if not s.isdigit():
-        return None
-    return int(s) * mult
-
-
-def extract_metrics(text: str) -> Tuple[Optional[int], Optional[int]]:
-    if not text:
-        return (None, None)
-    t = text.lower()
-
-    followers = None
-    for pat in RE_FOLLOWERS:
-        m = re.search(pat, t, re.I)
-        if m:
-            for g in m.groups():
-                if g and re.search(r"\d", g):
-                    n = _parse_number(g)
-                    if n is not None:
-                        followers = n
-                        break
-        if followers is not None:
-            break
-
-    connections = None
-    for pat in RE_CONNECTIONS:
-        m = re.search(pat, t, re.I)
-        if m:
-            for g in m.groups():
-                if g and re.search(r"\d", g):
-                    n = _parse_number(g)
-                    if n is not None:
-                        # normaliza 500+ a 500
-                        if n >= 500:
-                            n = 500
-                        connections = n
-                        break
-        if connections is not None:
-            break
-
-    return (followers, connections)
+# ------------------ LLM (Ollama) ------------------
+LLM_SECONDS = metrics.histogram("latam_llm_request_seconds", "Latencia de las llamadas a Ollama", ["caller", "outcome"])
+
+
+LLM_CACHE = LLMCache()
+
+
+def llm_for_text(text: str) -> Optional[dict]:
+    """call_ollama_on_text con caché: mismo modelo, prompt y texto recortado → misma respuesta sin llamar."""
+    key = llm_key(OLLAMA_MODEL, LLM_PROMPT, text[:MAX_CHARS_FOR_LLM])
+    hit = LLM_CACHE.get(key)
+    if hit is not None:
+        return hit
+    res = call_ollama_on_text(text)
+    if res:
+        LLM_CACHE.put(key, res)
+    return res
 
 
-# ------------------ LLM (Ollama) ------------------
 def call_ollama_on_text(text: str) -> Optional[dict]:
     if not OLLAMA_ENABLED:
         return None
+    t0 = time.perf_counter()
+    with profiling.stage("llm"):
+        res = _call_ollama_on_text(text)
+    LLM_SECONDS.observe(time.perf_counter() - t0, caller="enrichment", outcome="ok" if res else "empty")
+    return res
+
+
+def _call_ollama_on_text(text: str) -> Optional[dict]:
 
     # recortamos texto largo
     if len(text) > MAX_CHARS_FOR_LLM:
@@ -225,124 +194,56 @@ def call_ollama_on_text(text: str) -> Optional[dict]:
     return None
 
 
-def get_replies_with_retry(client: WebClient, channel: str, ts: str, tries: int = 3, pause: int = 4):
-    last_exc = None
-    for _ in range(tries):
-        try:
-            return client.conversations_replies(channel=channel, ts=ts, inclusive=True, limit=1)
-        except SlackApiError as e:
-            last_exc = e
-            time.sleep(pause)
-        except Exception as e:
-            last_exc = e
-            time.sleep(pause)
-    raise last_exc
+# ------------------ Slack ------------------
+def _empty_result() -> dict:
+    return {"followers": None, "connections": None, "raw_text": None, "llm": None}
 
 
-# ------------------ Slack ------------------
-def post_batch_and_get_unfurls(client: WebClient, urls: List[str]) -> Dict[str, dict]:
-    posted = [add_probe_param(u) for u in urls]
-    text = "\n".join(posted)
+TEXT_KEYS = ("text", "fallback", "title", "pretext")
 
-    try:
-        resp = client.chat_postMessage(channel=SLACK_CHANNEL_ID, text=text, unfurl_links=True)
-    except SlackApiError as e:
-        print(f"⚠️ Error al enviar lote: {e.response.get('error')}")
-        return {u: {"followers": None, "connections": None, "raw_text": None, "llm": None} for u in urls}
 
-    ts = resp["ts"]
-    time.sleep(UNFURL_WAIT_SECONDS)
+def post_batch_and_get_unfurls(shard: UnfurlShard, urls: List[str]) -> Dict[str, dict]:
+    texts, msg = fetch_unfurls(
+        shard, urls,
+        probe=add_probe_param,
+        key_fn=normalize_url,
+        wait_seconds=UNFURL_WAIT_SECONDS,
+        delete=DELETE_MESSAGES,
+        text_keys=TEXT_KEYS,
+    )
 
-    try:
-        reply = get_replies_with_retry(client, SLACK_CHANNEL_ID, ts)
-    except SlackApiError as e:
-        print(f"⚠️ Error al leer unfurls: {e.response.get('error')}")
-        return {u: {"followers": None, "connections": None, "raw_text": None, "llm": None} for u in urls}
-
-    msg = (reply.get("messages") or [{}])[0]
-    results = {u: {"followers": None, "connections": None, "raw_text": None, "llm": None} for u in urls}
-
-    atts = msg.get("attachments", [])
-    for att in atts:
-        original_url = att.get("original_url") or att.get("title_link") or att.get("from_url") or ""
-        text_fields = " \n ".join(str(att.get(k, "")) for k in ("text", "fallback", "title", "pretext"))
+    results = {u: _empty_result() for u in urls}
+    for u, text_fields in texts.items():
+        if text_fields is None:
+            continue
         f, c = extract_metrics(text_fields)
+        results[u]["followers"] = f
+        results[u]["connections"] = c
+        results[u]["raw_text"] = text_fields
 
-        key = normalize_url(original_url)
-        if key:
-            for u in urls:
-                if normalize_url(u) == key:
-                    results[u]["followers"] = results[u]["followers"] or f
-                    results[u]["connections"] = results[u]["connections"] or c
-                    results[u]["raw_text"] = text_fields
-
-                    # solo llamamos al LLM si hay material
-                    if text_fields and len(text_fields) >= MIN_CHARS_FOR_LLM:
-                        llm_res = call_ollama_on_text(text_fields)
-                    else:
-                        llm_res = None
-                    results[u]["llm"] = llm_res
-
-    # fallback por posición
-    if any(v["raw_text"] is None for v in results.values()) and atts:
-        for idx, att in enumerate(atts):
-            if idx >= len(urls):
-                break
-            u_guess = urls[idx]
-            if results[u_guess]["raw_text"] is None:
-                text_fields = " \n ".join(str(att.get(k, "")) for k in ("text", "fallback", "title", "pretext"))
-                f2, c2 = extract_metrics(text_fields)
-                results[u_guess]["followers"] = results[u_guess]["followers"] or f2
-                results[u_guess]["connections"] = results[u_guess]["connections"] or c2
-                results[u_guess]["raw_text"] = text_fields
-
-                if text_fields and len(text_fields) >= MIN_CHARS_FOR_LLM:
-                    llm_res = call_ollama_on_text(text_fields)
-                else:
-                    llm_res = None
-                results[u_guess]["llm"] = llm_res
-
-    if DUMP_JSON:
+        # solo llamamos al LLM si hay material
+        if len(text_fields) >= MIN_CHARS_FOR_LLM:
+            results[u]["llm"] = llm_for_text(text_fields)
+
+    if DUMP_JSON and msg:
         LOG_DIR.mkdir(parents=True, exist_ok=True)
-        dump_path = LOG_DIR / f"unfurl_{int(time.time())}.json"
+        dump_path = LOG_DIR / f"unfurl_{shard.channel}_{int(time.time())}.json"
         with open(dump_path, "w", encoding="utf-8") as fh:
             json.dump(msg, fh, ensure_ascii=False, indent=2)
 
-    if DELETE_MESSAGES:
-        try:
-            client.chat_delete(channel=SLACK_CHANNEL_ID, ts=ts)
-        except SlackApiError as e:
-            print(f"⚠️ No se pudo borrar el mensaje: {e.response.get('error')}")
-
     filled = sum(1 for v in results.values() if (v["followers"] is not None or v["connections"] is not None))
-    print(f"📦 Unfurls: attachments={len(atts)} → URLs con datos={filled}/{len(urls)}")
+    print(f"📦 [{shard.channel}] Unfurls: attachments={len(msg.get('attachments', []))} → URLs con datos={filled}/{len(urls)}")
 
     return results
 
 
 # ------------------ IO seguro ------------------
-def atomic_write_csv(df: pd.DataFrame, path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with tempfile.NamedTemporaryFile("w", delete=False, dir=str(path.parent), suffix=".tmp", encoding="utf-8-sig") as tmp:
-        tmp_path = Path(tmp.name)
-        df.to_csv(tmp_path, index=False, encoding="utf-8-sig")
-    for _ in range(3):
-        try:
-            tmp_path.replace(path)
-            return
-        except PermissionError:
-            time.sleep(0.5)
-    tmp_path.replace(path)
-
-
-def backup_copy(src: Path) -> None:
-    if not src.exists():
-        return
-    ts = time.strftime("%Y%m%d-%H%M%S")
-    bak = src.with_suffix(f".{ts}.bak.csv")
+def backup_delta(df: pd.DataFrame) -> None:
+    """Backup incremental: solo las filas que cambiaron desde el último (ver delta_backup.py)."""
     try:
-        shutil.copy2(src, bak)
-        print(f"🧰 Backup: {bak.name}")
+        store = DeltaBackup(OUT_PATH)
+        store.backup(df)
+        store.prune()
     except Exception as e:
         print(f"⚠️ No se pudo crear backup: {e}")
 
@@ -373,11 +274,12 @@ def ensure_new_columns(df: pd.DataFrame) -> None:
             df["esTechLLM"] = df["esTechLLM"].astype("boolean")
 
 
-def build_worklist(df: pd.DataFrame, limit: int) -> List[str]:
+def build_worklist(df: pd.DataFrame, limit: int, known: Optional[KnownProfiles] = None) -> List[str]:
     ensure_new_columns(df)
 
     urls = []
     seen = set()
+    n_known = 0
     for _, row in df.iterrows():
         url = pick_url(row)
         if not url:
@@ -390,8 +292,15 @@ def build_worklist(df: pd.DataFrame, limit: int) -> List[str]:
         if pd.notna(row.get("followersSlack")) or pd.notna(row.get("connectionsSlack")):
             continue
 
+        # ya extraído por Apify, en el archivo raw o excluido: no gastamos rate limit
+        if known is not None and url in known:
+            n_known += 1
+            continue
+
         urls.append(url)
 
+    if n_known:
+        print(f"🧹 {n_known} URLs ya conocidas/excluidas, se saltan.")
     if limit and limit > 0:
         urls = urls[:limit]
     return urls
@@ -433,8 +342,83 @@ def apply_results_to_df(df: pd.DataFrame, results: Dict[str, dict]) -> Tuple[int
     return upd_f, upd_c, upd_llm
 
 
+def reextract(df: pd.DataFrame, use_llm: bool = True) -> Tuple[int, int, int]:
+    """
+    Recalcula followersSlack / connectionsSlack (y los campos del LLM) desde el almacén de
+    unfurls, sin Slack. Las métricas se sobrescriben con lo que den las expresiones actuales;
+    el LLM solo se llama para textos que no estén en la caché con este modelo y prompt.
+    Devuelve (followers cambiados, connections cambiados, llamadas al LLM).
+    """
+    ensure_new_columns(df)
+    store = load_unfurls()
+    if store.empty:
+        print("ℹ️ El almacén de unfurls está vacío (data/unfurls/).")
+        return 0, 0, 0
+    texts = unfurl_texts(store, TEXT_KEYS)
+    with profiling.stage("extract"):
+        found = extract_metrics_column(texts)
+    found.index = store["url"]
+    print(f"🗃️ {len(store)} unfurls en el almacén")
+
+    keys = df.apply(pick_url, axis=1)
+    hit = keys.isin(found.index)
+    changed = []
+    for col, src in (("followersSlack", "followers"), ("connectionsSlack", "connections")):
+        before = df[col].astype("Int64")
+        df.loc[hit, col] = keys[hit].map(found[src]).astype("Int64")
+        changed.append(int((df[col].astype("Int64").fillna(-1) != before.fillna(-1)).sum()))
+
+    calls = 0
+    if use_llm and OLLAMA_ENABLED:
+        wanted = set(keys[hit])
+        todo = [(u, t) for u, t in zip(store["url"], texts) if u in wanted and len(t) >= MIN_CHARS_FOR_LLM]
+        llm: Dict[str, dict] = {}
+        for n, (u, t) in enumerate(todo, 1):
+            if llm_key(OLLAMA_MODEL, LLM_PROMPT, t[:MAX_CHARS_FOR_LLM]) not in LLM_CACHE:
+                calls += 1
+            res = llm_for_text(t)
+            if res:
+                llm[u] = res
+            if n % 100 == 0:
+                print(f"🤖 LLM {n}/{len(todo)} ({calls} llamadas, el resto en caché)")
+        for i in keys[keys.isin(llm)].index:
+            res = llm[keys[i]]
+            if res.get("profesion"):
+                df.at[i, "profesionLLM"] = res["profesion"]
+            if res.get("sector"):
+                df.at[i, "sectorLLM"] = res["sector"]
+            if res.get("es_tech") is not None:
+                df.at[i, "esTechLLM"] = bool(res["es_tech"])
+    return changed[0], changed[1], calls
+
+
+def reextract_main(use_llm: bool) -> None:
+    path = OUT_PATH if OUT_PATH.exists() else OUT_CSV
+    if not path.exists():
+        print(f"❌ No existe {OUT_PATH.name}: no hay nada que re-extraer.")
+        sys.exit(1)
+    df = load_frame(path)
+    uf, uc, calls = reextract(df, use_llm)
+    save_frame(df, OUT_PATH)
+    if is_parquet(OUT_PATH):
+        export_csv(OUT_PATH, OUT_CSV)
+    print(f"✅ Re-extracción: followers cambiados={uf}, connections cambiados={uc}, llamadas al LLM={calls}")
+    backup_delta(df)
+
+
+@profiling.profiled("slack_enrichment")
 def main():
+    ap = argparse.ArgumentParser(description="Slack unfurl → followers/connections + enriquecimiento con Ollama.")
+    ap.add_argument("--reextract", action="store_true",
+                    help="Recalcula métricas y campos del LLM desde data/unfurls/ sin llamar a Slack")
+    ap.add_argument("--no-llm", action="store_true", help="Con --reextract, solo las métricas")
+    args = ap.parse_args()
+    if args.reextract:
+        metrics.init_from_env("slack_reextract")
+        return reextract_main(not args.no_llm)
+
     print("🚀 Slack unfurl → followers/connections + Ollama enrichment\n")
+    metrics.init_from_env("slack_enrichment")
 
     if not SLACK_BOT_TOKEN or SLACK_BOT_TOKEN.startswith("xoxb-PEGAR"):
         print("⚠️ Debes setear SLACK_BOT_TOKEN.")
@@ -442,17 +426,30 @@ def main():
 
     if OUT_PATH.exists():
         print(f"📂 Reanudando desde {OUT_PATH.name}")
-        df = pd.read_csv(OUT_PATH)
+        df = load_frame(OUT_PATH)
+    elif OUT_CSV.exists() and OUT_PATH != OUT_CSV:
+        print(f"📂 Reanudando desde {OUT_CSV.name} (importando a {OUT_PATH.suffix})")
+        df = load_frame(OUT_CSV)
+        ensure_new_columns(df)
+        save_frame(df, OUT_PATH)
     else:
         print(f"📄 Cargando base desde {CSV_PATH.name}")
-        df = pd.read_csv(CSV_PATH)
+        df = load_frame(CSV_PATH)
         ensure_new_columns(df)
-        atomic_write_csv(df, OUT_PATH)
+        save_frame(df, OUT_PATH)
 
-    work = build_worklist(df, LIMIT_URLS)
+    # linkedinUrl ↔ salesNavigatorId: ambas formas colapsan a la misma clave
+    if "salesNavigatorId" in df.columns and "linkedinUrl" in df.columns:
+        snmap = get_salesnav_map()
+        snmap.learn_rows(df[["linkedinUrl", "salesNavigatorId"]].to_dict("records"))
+        snmap.save()
+
+    with profiling.stage("worklist"):
+        work = build_worklist(df, LIMIT_URLS, known=build_known_filter())
     print(f"📝 URLs pendientes: {len(work)}")
 
-    client = WebClient(token=SLACK_BOT_TOKEN)
+    shards = shards_from_env(SLACK_BOT_TOKEN, SLACK_CHANNEL_ID)
+    print(f"📡 Canales: {', '.join(s.channel for s in shards)}")
 
     interrupted = {"flag": False}
 
@@ -467,40 +464,42 @@ def main():
         pass
 
     batch_idx = 0
-    for batch in chunked(work, BATCH_SIZE):
+
+    def _on_result(batch: List[str], res) -> None:
+        nonlocal batch_idx
         batch_idx += 1
         print(f"\n▶ Lote {batch_idx} — {len(batch)} enlaces")
 
-        try:
-            res = post_batch_and_get_unfurls(client, batch)
-        except Exception as e:
-            print(f"⚠️ Fallo en post_batch_and_get_unfurls: {e}")
-            res = {u: {"followers": None, "connections": None, "raw_text": None, "llm": None} for u in batch}
-
-        if SAVE_PER_URL:
-            for u in batch:
-                one = {u: res.get(u)}
-                uf, uc, ul = apply_results_to_df(df, one)
-                atomic_write_csv(df, OUT_PATH)
-        else:
-            uf, uc, ul = apply_results_to_df(df, res)
-            atomic_write_csv(df, OUT_PATH)
+        if isinstance(res, Exception):
+            print(f"⚠️ Fallo en post_batch_and_get_unfurls: {res}")
+            res = {u: _empty_result() for u in batch}
+
+        with profiling.stage("save"):
+            if SAVE_PER_URL:
+                for u in batch:
+                    one = {u: res.get(u)}
+                    uf, uc, ul = apply_results_to_df(df, one)
+                    save_frame(df, OUT_PATH)
+            else:
+                uf, uc, ul = apply_results_to_df(df, res)
+                save_frame(df, OUT_PATH)
+        record_slack_batch(res)   # followers/connections al histórico (profile_history.py)
 
         total_f = int(df["followersSlack"].notna().sum())
         total_c = int(df["connectionsSlack"].notna().sum())
         print(f"💾 Guardado → F+:{total_f} C+:{total_c} [{OUT_PATH.name}]")
 
         if BACKUP_EVERY_N_BATCHES and batch_idx % BACKUP_EVERY_N_BATCHES == 0:
-            backup_copy(OUT_PATH)
-
-        if interrupted["flag"]:
-            break
+            backup_delta(df)
 
-        time.sleep(SLEEP_BETWEEN_BATCHES)
+    run_sharded(list(chunked(work, BATCH_SIZE)), shards, post_batch_and_get_unfurls, _on_result,
+                sleep_between=SLEEP_BETWEEN_BATCHES, should_stop=lambda: interrupted["flag"])
 
-    atomic_write_csv(df, OUT_PATH)
-    print(f"✅ Terminado. CSV actualizado: {OUT_PATH}")
-    backup_copy(OUT_PATH)
+    save_frame(df, OUT_PATH)
+    if is_parquet(OUT_PATH):
+        export_csv(OUT_PATH, OUT_CSV)
+    print(f"✅ Terminado. CSV actualizado: {OUT_CSV}")
+    backup_delta(df)
 
 
 if __name__ == "__main__":
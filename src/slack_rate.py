@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+slack_rate.py — Límites de la Web API de Slack por método.
+
+Slack agrupa los métodos en "tiers" (peticiones/minuto por workspace y app).
+Aquí cada método tiene un token bucket con ese ritmo y `call_slack` reintenta
+los 429 respetando la cabecera Retry-After (pausando el bucket entero, para
+que el resto de hilos tampoco sigan golpeando).
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from slack_sdk.errors import SlackApiError
+
+import metrics
+
+# peticiones/minuto por tier (https://api.slack.com/apis/rate-limits)
+TIER_PER_MINUTE: Dict[int, float] = {1: 1, 2: 20, 3: 50, 4: 100}
+
+METHOD_TIERS: Dict[str, int] = {
+    "chat.delete": 3,
+    "conversations.history": 3,
+    "conversations.replies": 3,
+    "auth.test": 4,
+}
+
+# chat.postMessage tiene límite "especial": ~1 mensaje/segundo por canal
+POST_MESSAGE_PER_SECOND = 1.0
+
+SLACK_CALLS = metrics.counter("latam_slack_calls_total", "Llamadas a la Web API de Slack", ["method", "outcome"])
+SLACK_THROTTLE = metrics.histogram("latam_slack_throttle_seconds", "Espera en el token bucket antes de cada llamada",
+                                   ["method"])
+
+
+class TokenBucket:
+    """Token bucket thread-safe. `acquire` bloquea hasta que hay token."""
+
+    def __init__(self, rate_per_sec: float, capacity: Optional[float] = None):
+        self.rate = float(rate_per_sec)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate_per_sec))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n: float = 1.0) -> float:
+        """Consume n tokens; devuelve los segundos esperados."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= n:
+                    self.tokens -= n
+                    return waited
+                wait = max(self.blocked_until - now, (n - self.tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """Bloquea el bucket (p.ej. tras un 429) y vacía los tokens acumulados."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+def bucket_for(method: str, scale: float = 1.0) -> TokenBucket:
+    """Bucket con el ritmo del tier del método (scale < 1 deja margen)."""
+    if method == "chat.postMessage":
+        return TokenBucket(POST_MESSAGE_PER_SECOND * scale, capacity=1)
+    per_min = TIER_PER_MINUTE[METHOD_TIERS.get(method, 2)] * scale
+    return TokenBucket(per_min / 60.0, capacity=max(1.0, per_min / 10.0))
+
+
+def retry_after_seconds(err: SlackApiError, default: float = 1.0) -> Optional[float]:
+    """Segundos de Retry-After si el error es un 429, si no None."""
+    resp = getattr(err, "response", None)
+    if resp is None or getattr(resp, "status_code", None) != 429:
+        return None
+    headers = {k.lower(): v for k, v in (getattr(resp, "headers", None) or {}).items()}
+    raw = headers.get("retry-after")
+    if isinstance(raw, (list, tuple)):
+        raw = raw[0] if raw else None
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return default
+
+
+def call_slack(bucket: TokenBucket, fn: Callable, *args, max_retries: int = 5, **kwargs):
+    """Llama a un método de WebClient respetando el bucket y los 429."""
+    method = getattr(fn, "__name__", "unknown").replace("_", ".", 1)
+    attempt = 0
+    while True:
+        SLACK_THROTTLE.observe(bucket.acquire(), method=method)
+        try:
+            resp = fn(*args, **kwargs)
+            SLACK_CALLS.inc(method=method, outcome="ok")
+            return resp
+        except SlackApiError as e:
+            wait = retry_after_seconds(e)
+            SLACK_CALLS.inc(method=method, outcome="ratelimited" if wait is not None else "error")
+            if wait is None or attempt >= max_retries:
+                raise
+            attempt += 1
+            print(f"⏳ Slack 429 — esperando {wait:.0f}s (reintento {attempt}/{max_retries})")
+            bucket.pause(wait)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+talent_search.py — Búsqueda de talento: texto completo + skills + ubicación.
+
+En vez de ILIKE sobre profiles/experiences/skills, cada perfil tiene una fila
+en profile_search que la ingesta mantiene al día (refresh_search en cada
+commit de json_2_sql.py):
+- document: tsvector 'simple' sin acentos; headline y skills pesan A, títulos
+  de experiencia B, about y descripciones D → GIN, rank con ts_rank_cd
+- skill_ids: int[] con GIN → `skill_ids && ARRAY[...]` por cada skill pedida
+- location_id del perfil (btree)
+- headline_norm con trigramas (pg_trgm) para el fallback difuso
+Los nombres de skills y ubicaciones se resuelven a ids con índices de
+trigramas sobre lower(f_unaccent(...)), así "valencia" encuentra
+"Valencia, Valencian Community, Spain" sin recorrer la tabla.
+
+El esquema lo crea la migración 3 de migrate.py.
+
+Uso:
+  python talent_search.py "data engineer" --skill spark --location valencia
+  python talent_search.py "ingeniero de datos" --skill python --skill sql --limit 50
+  python talent_search.py --rebuild              # recalcula profile_search entero
+"""
+
+import argparse
+import time
+from typing import Dict, List, Optional, Sequence
+
+import psycopg2
+
+from config import db_params, db_schema
+
+SEARCH_DESC_CHARS = 2000    # por experiencia: el tsvector no necesita la descripción entera
+
+
+def ensure_search_schema(cur) -> None:
+    """Extensiones, f_unaccent inmutable, profile_search y sus índices (migración 3)."""
+    s = db_schema()
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cur.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    cur.execute("""
+        SELECT n.nspname FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+        WHERE e.extname = 'unaccent'
+    """)
+    ext = cur.fetchone()[0]
+    # unaccent() no es IMMUTABLE: el envoltorio con diccionario fijo sí puede ir en índices
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION {s}.f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT {ext}.unaccent('{ext}.unaccent'::regdictionary, $1) $$
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {s}.profile_search (
+            profile_id    integer PRIMARY KEY REFERENCES {s}.profiles(profile_id) ON DELETE CASCADE,
+            document      tsvector NOT NULL,
+            skill_ids     integer[] NOT NULL DEFAULT '{{}}',
+            location_id   integer,
+            headline_norm text,
+            updated_at    timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS profile_search_document_idx ON {s}.profile_search USING gin (document)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS profile_search_skills_idx ON {s}.profile_search USING gin (skill_ids)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS profile_search_location_idx ON {s}.profile_search (location_id)")
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS profile_search_headline_trgm_idx
+        ON {s}.profile_search USING gin (headline_norm gin_trgm_ops)
+    """)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS skills_name_trgm_idx
+        ON {s}.skills USING gin ((lower({s}.f_unaccent(skill_name))) gin_trgm_ops)
+    """)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS locations_name_trgm_idx
+        ON {s}.locations USING gin ((lower({s}.f_unaccent(location_name))) gin_trgm_ops)
+    """)
+
+
+def refresh_search(cur, profile_ids: Sequence[int]) -> int:
+    """Recalcula profile_search para estos perfiles en una sola sentencia."""
+    if not profile_ids:
+        return 0
+    s = db_schema()
+    cur.execute(f"""
+        INSERT INTO {s}.profile_search AS ps (profile_id, document, skill_ids, location_id, headline_norm, updated_at)
+        SELECT p.profile_id,
+               setweight(to_tsvector('simple', {s}.f_unaccent(coalesce(p.headline, ''))), 'A') ||
+               setweight(to_tsvector('simple', {s}.f_unaccent(coalesce(sk.names, ''))), 'A') ||
+               setweight(to_tsvector('simple', {s}.f_unaccent(coalesce(ex.titles, ''))), 'B') ||
+               setweight(to_tsvector('simple', {s}.f_unaccent(coalesce(p.about, '') || ' ' || coalesce(ex.descs, ''))), 'D'),
+               coalesce(sk.ids, '{{}}'), p.location_id, lower({s}.f_unaccent(p.headline)), now()
+        FROM {s}.profiles p
+        LEFT JOIN LATERAL (
+            SELECT string_agg(k.skill_name, ' ') AS names, array_agg(k.skill_id ORDER BY k.skill_id) AS ids
+            FROM {s}.profile_skills x JOIN {s}.skills k ON k.skill_id = x.skill_id
+            WHERE x.profile_id = p.profile_id
+        ) sk ON true
+        LEFT JOIN LATERAL (
+            SELECT string_agg(e.title, ' ') AS titles, string_agg(left(e.description, %s), ' ') AS descs
+            FROM {s}.experiences e WHERE e.profile_id = p.profile_id
+        ) ex ON true
+        WHERE p.profile_id = ANY(%s)
+        ON CONFLICT (profile_id) DO UPDATE
+          SET document = EXCLUDED.document, skill_ids = EXCLUDED.skill_ids, location_id = EXCLUDED.location_id,
+              headline_norm = EXCLUDED.headline_norm, updated_at = now()
+    """, (SEARCH_DESC_CHARS, list(profile_ids)))
+    return cur.rowcount
+
+
+def rebuild(conn, batch: int = 5000) -> int:
+    """profile_search completo, por rangos de profile_id (un commit por rango)."""
+    s = db_schema()
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COALESCE(MIN(profile_id), 0), COALESCE(MAX(profile_id), -1) FROM {s}.profiles")
+        lo, hi = cur.fetchone()
+    total = 0
+    with conn.cursor() as cur:
+        for start in range(lo, hi + 1, batch):
+            cur.execute(f"SELECT profile_id FROM {s}.profiles WHERE profile_id BETWEEN %s AND %s",
+                        (start, start + batch - 1))
+            total += refresh_search(cur, [r[0] for r in cur.fetchall()])
+            conn.commit()
+    return total
+
+
+def _resolve(cur, table: str, id_col: str, name_col: str, term: str) -> List[int]:
+    """ids cuyo nombre contiene `term` (sin acentos ni mayúsculas; índice de trigramas). % y _ van literales."""
+    s = db_schema()
+    cur.execute(rf"""
+        SELECT {id_col} FROM {s}.{table}
+        WHERE lower({s}.f_unaccent({name_col}))
+              LIKE '%%' || replace(replace(replace(lower({s}.f_unaccent(%s)), '\', '\\'), '%%', '\%%'), '_', '\_') || '%%'
+              ESCAPE '\'
+    """, (term,))
+    return [r[0] for r in cur.fetchall()]
+
+
+def search(cur, text: str = "", skills: Sequence[str] = (), location: Optional[str] = None,
+           limit: int = 20, fuzzy: bool = True) -> List[Dict]:
+    """
+    Perfiles ordenados por relevancia. `text` admite sintaxis web ("data engineer" -junior OR spark);
+    cada skill debe estar (cualquiera de las que contengan ese nombre); `location` filtra por la
+    ubicación del perfil. Si el texto no da nada y fuzzy=True, se reintenta por similitud del headline.
+    """
+    s = db_schema()
+    where, params = [], {"text": text or "", "limit": limit}
+    for i, sk in enumerate(skills):
+        ids = _resolve(cur, "skills", "skill_id", "skill_name", sk)
+        if not ids:
+            return []
+        where.append(f"ps.skill_ids && %(sk{i})s")
+        params[f"sk{i}"] = ids
+    if location:
+        ids = _resolve(cur, "locations", "location_id", "location_name", location)
+        if not ids:
+            return []
+        where.append("ps.location_id = ANY(%(loc)s)")
+        params["loc"] = ids
+
+    def run(match: str, rank: str) -> List[Dict]:
+        cond = " AND ".join(where + ([match] if match else [])) or "true"
+        cur.execute(f"""
+            SELECT ps.profile_id, {rank} AS rank, p.linkedin_url, p.first_name, p.last_name, p.headline,
+                   l.location_name
+            FROM {s}.profile_search ps
+            JOIN {s}.profiles p ON p.profile_id = ps.profile_id
+            LEFT JOIN {s}.locations l ON l.location_id = ps.location_id
+            WHERE {cond}
+            ORDER BY rank DESC, ps.profile_id
+            LIMIT %(limit)s
+        """, params)
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    if not text.strip():
+        return run("", "0::real")
+    tsq = f"websearch_to_tsquery('simple', {s}.f_unaccent(%(text)s))"
+    rows = run(f"ps.document @@ {tsq}", f"ts_rank_cd(ps.document, {tsq}, 32)")
+    if not rows and fuzzy:
+        norm = f"lower({s}.f_unaccent(%(text)s))"
+        rows = run(f"ps.headline_norm %% {norm}", f"similarity(ps.headline_norm, {norm})")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Búsqueda de talento (texto + skills + ubicación).")
+    ap.add_argument("text", nargs="?", default="", help='Texto libre, p.ej. "data engineer" -junior')
+    ap.add_argument("--skill", action="append", default=[], help="Skill obligatoria (repetible)")
+    ap.add_argument("--location", help="Ubicación del perfil (contiene, sin acentos)")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--no-fuzzy", action="store_true", help="Sin fallback por similitud del headline")
+    ap.add_argument("--rebuild", action="store_true", help="Recalcula profile_search para todos los perfiles")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor() as cur:
+            from migrate import SEARCH_INDEX, require
+            require(cur, SEARCH_INDEX)
+        if args.rebuild:
+            print(f"🔎 profile_search: {rebuild(conn)} perfiles indexados")
+            return 0
+        t0 = time.perf_counter()
+        with conn.cursor() as cur:
+            rows = search(cur, args.text, args.skill, args.location, args.limit, fuzzy=not args.no_fuzzy)
+        conn.commit()
+    finally:
+        conn.close()
+    ms = (time.perf_counter() - t0) * 1000
+    for r in rows:
+        name = " ".join(x for x in (r["first_name"], r["last_name"]) if x)
+        print(f"  {r['rank']:.3f}  #{r['profile_id']:<7} {name[:28]:<28} {(r['headline'] or '')[:60]:<60} "
+              f"{r['location_name'] or ''}")
+    print(f"🔎 {len(rows)} perfiles en {ms:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
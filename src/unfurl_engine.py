@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+unfurl_engine.py — Motor común de unfurls de Slack.
+
+Lo usan slack_unfurl_to_raw_headline.py y slack+ollama_enrichment_profiles.py:
+- `UnfurlShard`: un canal + un token, con su propio limitador de chat.postMessage.
+  Los límites de lectura/borrado (tier 3) son por token, así que se comparten
+  entre los shards que usan el mismo token.
+- `fetch_unfurls`: publica un lote, espera el unfurl, lee los attachments,
+  los asigna a cada URL y borra el mensaje. Cada attachment se guarda en
+  unfurl_store.py para poder re-extraer sin Slack.
+- `run_sharded`: reparte los lotes entre los shards (un hilo por shard) y
+  entrega los resultados en el hilo principal, que es el único que escribe.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+import metrics
+import profiling
+from slack_rate import TokenBucket, bucket_for, call_slack
+from unfurl_store import record_batch
+
+DEFAULT_TEXT_KEYS = ("title", "text", "fallback", "pretext")
+# p.ej. http://127.0.0.1:8766/api/ para trabajar contra fake_slack.py
+SLACK_API_BASE = os.getenv("SLACK_API_BASE") or WebClient.BASE_URL
+
+UNFURL_URLS = metrics.counter("latam_unfurl_urls_total", "URLs enviadas a Slack y URLs con unfurl", ["outcome"])
+UNFURL_BATCH = metrics.histogram("latam_unfurl_batch_seconds", "Duración de un lote (post → replies → delete)")
+UNFURL_PENDING = metrics.gauge("latam_unfurl_pending_batches", "Lotes pendientes en run_sharded")
+
+_token_buckets: Dict[str, Dict[str, TokenBucket]] = {}
+_token_lock = threading.Lock()
+
+
+def _buckets_for_token(token: str, scale: float) -> Dict[str, TokenBucket]:
+    with _token_lock:
+        if token not in _token_buckets:
+            _token_buckets[token] = {
+                "conversations.replies": bucket_for("conversations.replies", scale),
+                "chat.delete": bucket_for("chat.delete", scale),
+            }
+        return _token_buckets[token]
+
+
+class UnfurlShard:
+    """Un canal de Slack con su cliente y sus limitadores."""
+
+    def __init__(self, token: str, channel: str, rate_scale: float = 1.0, client: Optional[WebClient] = None):
+        self.token = token
+        self.channel = channel
+        self.client = client or WebClient(token=token, base_url=SLACK_API_BASE)
+        self.post_bucket = bucket_for("chat.postMessage", rate_scale)
+        shared = _buckets_for_token(token, rate_scale)
+        self.replies_bucket = shared["conversations.replies"]
+        self.delete_bucket = shared["chat.delete"]
+
+    def __repr__(self) -> str:
+        return f"UnfurlShard({self.channel})"
+
+
+def _split_env_list(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def shards_from_env(default_token: Optional[str], default_channel: Optional[str],
+                    rate_scale: float = 1.0) -> List[UnfurlShard]:
+    """
+    SLACK_CHANNEL_IDS=C1,C2,C3  → un shard por canal (si no, el canal por defecto)
+    SLACK_BOT_TOKENS=xoxb-a,xoxb-b → tokens asignados a los canales en round-robin
+    """
+    channels = _split_env_list(os.getenv("SLACK_CHANNEL_IDS")) or ([default_channel] if default_channel else [])
+    tokens = _split_env_list(os.getenv("SLACK_BOT_TOKENS")) or ([default_token] if default_token else [])
+    if not channels or not tokens:
+        return []
+    return [UnfurlShard(tokens[i % len(tokens)], ch, rate_scale) for i, ch in enumerate(channels)]
+
+
+def attachment_text(att: Dict[str, Any], keys: Iterable[str] = DEFAULT_TEXT_KEYS) -> str:
+    return " \n ".join(str(att.get(k, "")) for k in keys).strip()
+
+
+def get_replies_with_retry(shard: UnfurlShard, ts: str, tries: int = 3, pause: float = 2.0) -> Dict[str, Any]:
+    last_exc = None
+    for _ in range(tries):
+        try:
+            return call_slack(shard.replies_bucket, shard.client.conversations_replies,
+                              channel=shard.channel, ts=ts, inclusive=True, limit=1)
+        except SlackApiError as e:
+            last_exc = e
+            print(f"⚠️ Slack se quejó leyendo replies, reintento... {e.response.get('error')}")
+            time.sleep(pause)
+        except Exception as e:
+            last_exc = e
+            print(f"⚠️ Error de red leyendo replies, reintento... {e}")
+            time.sleep(pause)
+    raise last_exc
+
+
+def fetch_unfurls(shard: UnfurlShard, urls: List[str], *,
+                  probe: Callable[[str], str],
+                  key_fn: Callable[[Optional[str]], Optional[str]],
+                  wait_seconds: float,
+                  delete: bool = True,
+                  text_keys: Iterable[str] = DEFAULT_TEXT_KEYS) -> Tuple[Dict[str, Optional[str]], Dict[str, Any]]:
+    """
+    Publica `urls` en el canal del shard y devuelve ({url: texto_unfurl|None}, mensaje).
+    Nunca lanza por errores de Slack: las URLs sin unfurl quedan a None.
+    """
+    with metrics.timer(UNFURL_BATCH), profiling.stage("slack"):
+        results, msg, atts = _fetch_unfurls(shard, urls, probe, key_fn, wait_seconds, delete, text_keys)
+    record_batch(atts, shard.channel)
+    UNFURL_URLS.inc(len(urls), outcome="posted")
+    UNFURL_URLS.inc(sum(1 for v in results.values() if v), outcome="unfurled")
+    return results, msg
+
+
+def _fetch_unfurls(shard, urls, probe, key_fn, wait_seconds, delete, text_keys):
+    results: Dict[str, Optional[str]] = {u: None for u in urls}
+    matched: Dict[str, Dict[str, Any]] = {}
+    text = "\n".join(probe(u) for u in urls)
+
+    # 1) mandamos el mensaje
+    try:
+        resp = call_slack(shard.post_bucket, shard.client.chat_postMessage,
+                          channel=shard.channel, text=text, unfurl_links=True)
+    except SlackApiError as e:
+        print(f"⚠️ [{shard.channel}] Error al enviar lote: {e.response.get('error')}")
+        return results, {}, matched
+    except Exception as e:
+        print(f"⚠️ [{shard.channel}] Error inesperado al enviar lote: {e}")
+        return results, {}, matched
+
+    ts = resp["ts"]
+
+    # 2) esperamos a que slack haga el unfurl
+    time.sleep(wait_seconds)
+
+    # 3) leemos las respuestas
+    try:
+        reply = get_replies_with_retry(shard, ts)
+    except Exception as e:
+        print(f"⚠️ [{shard.channel}] Error al leer unfurls: {e}")
+        reply = {}
+
+    msg = (reply.get("messages") or [{}])[0] if reply else {}
+    atts = msg.get("attachments", []) if msg else []
+
+    # 4) mapeo por url normalizada
+    by_key = {key_fn(u): u for u in urls}
+    for att in atts:
+        original_url = att.get("original_url") or att.get("title_link") or att.get("from_url") or ""
+        u = by_key.get(key_fn(original_url)) if original_url else None
+        if u and results[u] is None:
+            results[u] = attachment_text(att, text_keys)
+            matched[u] = att
+
+    # 5) fallback por posición
+    if atts and any(v is None for v in results.values()):
+        for idx, att in enumerate(atts[:len(urls)]):
+            if results[urls[idx]] is None:
+                results[urls[idx]] = attachment_text(att, text_keys)
+                matched[urls[idx]] = att
+
+    # 6) borramos el mensaje, pero blindado
+    if delete:
+        try:
+            call_slack(shard.delete_bucket, shard.client.chat_delete, channel=shard.channel, ts=ts)
+        except SlackApiError as e:
+            print(f"⚠️ [{shard.channel}] No se pudo borrar el mensaje: {e.response.get('error')}")
+        except Exception as e:
+            print(f"⚠️ [{shard.channel}] No se pudo borrar el mensaje (red/timeout): {e}")
+
+    return results, msg, matched
+
+
+def run_sharded(batches: List[List[str]], shards: List[UnfurlShard],
+                process_batch: Callable[[UnfurlShard, List[str]], Any],
+                on_result: Callable[[List[str], Any], None],
+                sleep_between: float = 0.0,
+                should_stop: Callable[[], bool] = lambda: False) -> int:
+    """
+    Reparte `batches` entre `shards` (un hilo por shard). `process_batch` corre en
+    el hilo del shard; `on_result(batch, result)` corre siempre en el hilo que
+    llama, así que puede escribir el DataFrame/CSV sin locks.
+    Devuelve el número de lotes entregados.
+    """
+    if not shards:
+        raise ValueError("run_sharded necesita al menos un shard")
+
+    todo: "queue.Queue[List[str]]" = queue.Queue()
+    for b in batches:
+        todo.put(b)
+    done: "queue.Queue[Tuple[List[str], Any]]" = queue.Queue()
+    _FINISHED = object()
+
+    def _worker(shard: UnfurlShard):
+        try:
+            while not should_stop():
+                try:
+                    batch = todo.get_nowait()
+                except queue.Empty:
+                    break
+                UNFURL_PENDING.set(todo.qsize())
+                try:
+                    res = process_batch(shard, batch)
+                except Exception as e:
+                    print(f"⚠️ [{shard.channel}] Fallo procesando lote: {e}")
+                    res = e
+                done.put((batch, res))
+                if sleep_between and not todo.empty():
+                    time.sleep(sleep_between)
+        finally:
+            done.put((None, _FINISHED))
+
+    threads = [threading.Thread(target=_worker, args=(s,), daemon=True, name=f"unfurl-{s.channel}") for s in shards]
+    for t in threads:
+        t.start()
+
+    delivered = 0
+    alive = len(threads)
+    while alive:
+        batch, res = done.get()
+        if res is _FINISHED:
+            alive -= 1
+            continue
+        on_result(batch, res)
+        delivered += 1
+    return delivered
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+unfurl_metrics.py — followers / connections a partir del texto de un unfurl.
+
+Las expresiones están precompiladas y se usan de dos formas:
+- `extract_metrics(text)`: un texto, en el momento del unfurl
+  (slack+ollama_enrichment_profiles.py)
+- `extract_metrics_column(series)`: toda una columna de golpe con
+  `Series.str.extract`, para re-extraer offline desde unfurl_store.py sin
+  volver a pasar por Slack cuando cambian estas expresiones
+
+Ambas dan el mismo resultado: la primera expresión que casa gana, y las
+conexiones se cortan en 500 ("500+").
+"""
+
+import re
+from typing import Optional, Tuple
+
+import pandas as pd
+
+# el número va siempre en el grupo `n`
+RE_FOLLOWERS = [
+    re.compile(r"(?P<n>\d[\d\.\, ]*\+?)\s*(?:followers|seguidores)\b", re.I),
+    re.compile(r"(?:followers|seguidores)\s*[:\-]?\s*(?P<n>\d[\d\.\, ]*\+?)\b", re.I),
+]
+RE_CONNECTIONS = [
+    re.compile(r"(?P<n>\d[\d\.\, ]*\+?)\s*(?:connections|conexiones|contactos)\b", re.I),
+    re.compile(r"(?:connections|conexiones|contactos)\s*[:\-]?\s*(?P<n>\d[\d\.\, ]*\+?)\b", re.I),
+]
+CONNECTIONS_CAP = 500
+
+
+def _parse_number(tok: str) -> Optional[int]:
+    s = tok.strip().lower().replace(" ", "")
+    mult = 1
+    if s.endswith("k"):
+        mult, s = 1000, s[:-1]
+    elif s.endswith("m"):
+        mult, s = 1_000_000, s[:-1]
+    if s.endswith("+"):
+        s = s[:-1]
+    s = s.replace(".", "").replace(",", "")
+    if not s.isdigit():
+        return None
+    return int(s) * mult
+
+
+def _first(patterns, text: str) -> Optional[int]:
+    for rx in patterns:
+        m = rx.search(text)
+        if m:
+            n = _parse_number(m.group("n"))
+            if n is not None:
+                return n
+    return None
+
+
+def extract_metrics(text: str) -> Tuple[Optional[int], Optional[int]]:
+    if not text:
+        return (None, None)
+    followers = _first(RE_FOLLOWERS, text)
+    connections = _first(RE_CONNECTIONS, text)
+    if connections is not None:
+        connections = min(connections, CONNECTIONS_CAP)   # normaliza 500+ a 500
+    return (followers, connections)
+
+
+def _parse_column(tokens: pd.Series) -> pd.Series:
+    s = tokens.str.strip().str.lower().str.replace(" ", "", regex=False)
+    mult = s.str[-1].map({"k": 1000, "m": 1_000_000}).fillna(1)
+    s = s.str.replace(r"[km]$", "", regex=True).str.replace(r"\+$", "", regex=True)
+    s = s.str.replace(r"[.,]", "", regex=True)
+    return (pd.to_numeric(s.where(s.str.fullmatch(r"\d+", na=False)), errors="coerce") * mult).astype("Int64")
+
+
+def _first_column(patterns, texts: pd.Series) -> pd.Series:
+    out = pd.Series(pd.NA, index=texts.index, dtype="Int64")
+    for rx in patterns:
+        todo = out.isna()
+        if not todo.any():
+            break
+        out[todo] = _parse_column(texts[todo].str.extract(rx)["n"])
+    return out
+
+
+def extract_metrics_column(texts: pd.Series) -> pd.DataFrame:
+    """Versión vectorizada de extract_metrics: columnas `followers` y `connections` (Int64)."""
+    texts = texts.astype("string").fillna("")
+    connections = _first_column(RE_CONNECTIONS, texts)
+    return pd.DataFrame({
+        "followers": _first_column(RE_FOLLOWERS, texts),
+        "connections": connections.where(connections.isna() | (connections < CONNECTIONS_CAP), CONNECTIONS_CAP),
+    }, index=texts.index)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+unfurl_store.py — Almacén de los unfurls en bruto y caché del LLM.
+
+Cada attachment que Slack devuelve para una URL (el mismo JSON que DUMP_JSON
+vuelca en logs_unfurl/) se guarda aquí, para poder recalcular métricas y
+campos del LLM sin volver a pasar por Slack (5 URLs cada ~35 s):
+- unfurl_engine.fetch_unfurls escribe cada lote en un segmento JSONL
+  comprimido con gzip: data/unfurls/unfurls_<día>_<pid>.jsonl.gz
+  (UNFURL_STORE=false para desactivarlo)
+- --compact junta los segmentos de días anteriores en unfurls.parquet
+  (zstd; sin pyarrow, unfurls.jsonl.gz) quedándose con el último unfurl de
+  cada URL
+- `load_unfurls()` devuelve el último unfurl por URL con title / text /
+  fallback / pretext como columnas, listo para extract_metrics_column
+- `LLMCache`: respuestas del LLM por sha1(modelo, prompt, texto recortado);
+  al re-extraer solo se llama a Ollama si cambió alguna de las tres cosas
+
+La re-extracción está en slack+ollama_enrichment_profiles.py --reextract.
+
+Uso:
+  python unfurl_store.py                              # segmentos y URLs guardadas
+  python unfurl_store.py --compact
+  python unfurl_store.py --import-dumps ../logs_unfurl/*.json
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from config import PROJECT_ROOT
+from linkedin_urls import canonical_key
+
+STORE_DIR = Path(os.getenv("UNFURL_STORE_DIR", str(PROJECT_ROOT / "data" / "unfurls")))
+UNFURL_STORE = os.getenv("UNFURL_STORE", "true").lower() == "true"
+TEXT_FIELDS = ("title", "text", "fallback", "pretext")
+COLUMNS = ["url", "captured_at", "channel", *TEXT_FIELDS, "attachment"]
+LLM_CACHE_FILE = "llm_cache.jsonl"
+
+_lock = threading.Lock()
+_store_off = False
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# ------------------ Escritura ------------------
+def segment_path(day: date, root: Path = STORE_DIR) -> Path:
+    return root / f"unfurls_{day:%Y%m%d}_{os.getpid()}.jsonl.gz"
+
+
+def record(attachments: Dict[str, Optional[dict]], channel: Optional[str] = None,
+           captured_at: Optional[datetime] = None, root: Path = STORE_DIR) -> int:
+    """{url canónica: attachment} → segmento del día. Devuelve filas escritas."""
+    captured_at = captured_at or datetime.now(timezone.utc)
+    lines = [json.dumps({"url": u, "captured_at": captured_at.isoformat(), "channel": channel, "attachment": att},
+                        ensure_ascii=False, separators=(",", ":"))
+             for u, att in attachments.items() if att]
+    if not lines:
+        return 0
+    with _lock:
+        root.mkdir(parents=True, exist_ok=True)
+        # cada llamada añade un miembro gzip: el fichero sigue siendo un .gz válido
+        with gzip.open(segment_path(captured_at.date(), root), "at", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+    return len(lines)
+
+
+def record_batch(attachments: Dict[str, Optional[dict]], channel: Optional[str] = None) -> None:
+    """record para el motor de unfurls: si el disco falla avisa una vez y sigue sin guardar."""
+    global _store_off
+    if not UNFURL_STORE or _store_off:
+        return
+    try:
+        record(attachments, channel)
+    except Exception as e:
+        _store_off = True
+        print(f"⚠️ Almacén de unfurls desactivado en esta ejecución: {e}")
+
+
+def import_dumps(paths: Iterable[str], root: Path = STORE_DIR) -> int:
+    """Mensajes volcados con DUMP_JSON → almacén (captured_at = mtime del fichero)."""
+    n = 0
+    for p in paths:
+        with open(p, encoding="utf-8") as fh:
+            msg = json.load(fh)
+        by_url: Dict[str, dict] = {}
+        for att in msg.get("attachments", []):
+            k = canonical_key(att.get("original_url") or att.get("title_link") or att.get("from_url"))
+            if k and k not in by_url:
+                by_url[k] = att
+        at = datetime.fromtimestamp(os.path.getmtime(p), timezone.utc)
+        n += record(by_url, msg.get("channel"), at, root)
+    return n
+
+
+# ------------------ Lectura ------------------
+def segment_paths(root: Path = STORE_DIR) -> List[Path]:
+    return sorted(root.glob("unfurls_*.jsonl.gz"))
+
+
+def compacted_path(root: Path = STORE_DIR) -> Path:
+    return root / ("unfurls.parquet" if _has_pyarrow() else "unfurls.jsonl.gz")
+
+
+def _read_segment(path: Path) -> pd.DataFrame:
+    rows = []
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                rows.append(json.loads(line))
+    df = pd.DataFrame(rows, columns=["url", "captured_at", "channel", "attachment"])
+    atts = df["attachment"].map(lambda a: a if isinstance(a, dict) else {})
+    for k in TEXT_FIELDS:
+        df[k] = atts.map(lambda a: a.get(k))
+    df["attachment"] = df["attachment"].map(lambda a: json.dumps(a, ensure_ascii=False))
+    return df[COLUMNS]
+
+
+def _read_compacted(root: Path) -> pd.DataFrame:
+    for p in (root / "unfurls.parquet", root / "unfurls.jsonl.gz"):
+        if p.exists():
+            df = pd.read_parquet(p) if p.suffix == ".parquet" else pd.read_json(p, lines=True, dtype=False)
+            return df[COLUMNS]
+    return pd.DataFrame(columns=COLUMNS)
+
+
+def _latest(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.assign(captured_at=pd.to_datetime(df["captured_at"], utc=True, format="ISO8601"))
+    return df.sort_values("captured_at").drop_duplicates("url", keep="last").reset_index(drop=True)
+
+
+def load_unfurls(root: Path = STORE_DIR) -> pd.DataFrame:
+    """Último unfurl por URL (compactado + segmentos), con los campos de texto como columnas."""
+    parts = [_read_compacted(root)] + [_read_segment(p) for p in segment_paths(root)]
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return pd.DataFrame(columns=COLUMNS)
+    return _latest(pd.concat(parts, ignore_index=True))
+
+
+def unfurl_texts(df: pd.DataFrame, keys: Iterable[str] = TEXT_FIELDS) -> pd.Series:
+    """Mismo texto que unfurl_engine.attachment_text, para toda la columna."""
+    cols = [df[k].astype("string").fillna("") for k in keys]
+    out = cols[0]
+    for c in cols[1:]:
+        out = out + " \n " + c
+    return out.str.strip()
+
+
+def compact(root: Path = STORE_DIR) -> Tuple[int, int]:
+    """Segmentos de días anteriores → fichero compactado (último por URL). Devuelve (segmentos, URLs)."""
+    today = f"unfurls_{datetime.now(timezone.utc):%Y%m%d}_"
+    olds = [p for p in segment_paths(root) if not p.name.startswith(today)]
+    if not olds:
+        return 0, 0
+    df = _latest(pd.concat([_read_compacted(root)] + [_read_segment(p) for p in olds], ignore_index=True))
+    df["captured_at"] = df["captured_at"].map(lambda t: t.isoformat())
+    out = compacted_path(root)
+    tmp = out.with_name(out.name + ".tmp")
+    if out.suffix == ".parquet":
+        df.to_parquet(tmp, index=False, compression="zstd")
+    else:
+        df.to_json(tmp, orient="records", lines=True, force_ascii=False, compression="gzip")
+    tmp.replace(out)
+    for p in olds + [p for p in (root / "unfurls.parquet", root / "unfurls.jsonl.gz") if p != out and p.exists()]:
+        p.unlink()
+    return len(olds), len(df)
+
+
+# ------------------ Caché del LLM ------------------
+def llm_key(model: str, prompt: str, text: str) -> str:
+    return hashlib.sha1("\0".join((model, prompt, text)).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Respuestas del LLM por llm_key; append-only en data/unfurls/llm_cache.jsonl."""
+
+    def __init__(self, root: Path = STORE_DIR):
+        self.path = root / LLM_CACHE_FILE
+        self._lock = threading.Lock()
+        self._data: Optional[Dict[str, Any]] = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = {}
+            if self.path.exists():
+                with open(self.path, encoding="utf-8") as fh:
+                    for line in fh:
+                        if line.strip():
+                            r = json.loads(line)
+                            self._data[r["key"]] = r["llm"]
+        return self._data
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._load()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key: str, llm: dict) -> None:
+        with self._lock:
+            self._load()[key] = llm
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps({"key": key, "llm": llm}, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Almacén de unfurls en bruto (para re-extraer sin Slack).")
+    ap.add_argument("--compact", action="store_true", help="Junta los segmentos de días anteriores")
+    ap.add_argument("--import-dumps", nargs="+", metavar="JSON", help="Carga mensajes volcados con DUMP_JSON")
+    args = ap.parse_args()
+
+    if args.import_dumps:
+        print(f"🗃️ {import_dumps(args.import_dumps)} unfurls importados de {len(args.import_dumps)} ficheros")
+    if args.compact:
+        n, urls = compact()
+        print(f"🗃️ {n} segmentos compactados → {compacted_path().name} ({urls} URLs)")
+    df = load_unfurls()
+    print(f"🗃️ {STORE_DIR}: {len(segment_paths())} segmentos, {len(df)} URLs, "
+          f"{len(LLMCache())} respuestas del LLM en caché")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
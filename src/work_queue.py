@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+work_queue.py — Reparto de pendientes entre varios orquestadores (claims con lease).
+
+Cada worker reclama lotes de perfiles `pending` de extraction_state
+(extraction_state.py) con `FOR UPDATE SKIP LOCKED` y los pasa a `claimed`
+con su worker_id y un lease:
+- dos workers nunca reciben el mismo perfil mientras el lease esté vigente,
+  aunque corran en máquinas distintas
+- un hilo de heartbeat alarga el lease de lo que el worker tiene en vuelo
+  (un run de Apify puede durar más que WORK_LEASE_SECONDS)
+- si el worker muere, sus perfiles vuelven a `pending` al vencer el lease
+- `fail` es el reencolado con backoff (antes requeue.json) pero compartido:
+  suma un intento y pasa a `retry_after` hasta el siguiente; tras
+  APIFY_RETRY_MAX_ATTEMPTS queda `parked`
+- `release` lo devuelve a `pending` ya; `complete` lo marca `done`;
+  `forbid` (403) lo deja `inaccessible` hasta EXTRACTION_403_RETRY_DAYS
+- `claim_stale` reclama `done` antiguos para re-extraer (modo refresh) y
+  `restore` los devuelve a `done` si el refresh no trae item
+
+Uso:
+  python orchestrate_from_db.py                      # en N procesos / máquinas
+  python work_queue.py                               # claims vigentes por worker
+  python work_queue.py --expire                      # leases vencidos → pending
+"""
+
+import argparse
+import os
+import socket
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import psycopg2
+
+import extraction_state as es
+import metrics
+from config import db_params, db_schema, env
+
+WORK_LEASE_SECONDS = int(env("WORK_LEASE_SECONDS", "1800"))
+WORK_HEARTBEAT_SECONDS = float(env("WORK_HEARTBEAT_SECONDS", str(WORK_LEASE_SECONDS / 3)))
+WORKER_ID = env("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+CLAIMS = metrics.counter("latam_work_claims_total", "Transiciones de los perfiles reclamados por el worker",
+                         ["outcome"])
+
+
+class WorkQueue:
+    def __init__(self, worker_id: str = WORKER_ID, lease_seconds: int = WORK_LEASE_SECONDS,
+                 heartbeat_seconds: float = WORK_HEARTBEAT_SECONDS, max_attempts: int = es.RETRY_MAX_ATTEMPTS):
+        self.worker_id = worker_id
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.conn = psycopg2.connect(**db_params())
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            es.ensure_state_schema(cur)
+        self._held: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    # ------------------ ciclo de vida ------------------
+    def __enter__(self) -> "WorkQueue":
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True, name="work-heartbeat")
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+        # lo que quede en vuelo (p.ej. tras una excepción) vuelve a la cola ya
+        with self._lock:
+            held = list(self._held)
+        if held:
+            self.release(held)
+        self.conn.close()
+
+    def _heartbeat_loop(self) -> None:
+        conn = None
+        while not self._stop.wait(self.heartbeat_seconds):
+            with self._lock:
+                held = list(self._held)
+            if not held:
+                continue
+            try:
+                if conn is None or conn.closed:
+                    conn = psycopg2.connect(**db_params())
+                    conn.autocommit = True
+                with conn.cursor() as cur:
+                    es.extend_lease(cur, self.worker_id, held, self.lease_seconds)
+            except psycopg2.Error as e:
+                print(f"⚠️ Heartbeat de claims falló: {e}")
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    # ------------------ operaciones ------------------
+    def prepare(self) -> Dict[str, int]:
+        """Migración pendiente + altas de perfiles nuevos + prioridades (un solo worker, bajo lock)."""
+        with self.conn.cursor() as cur:
+            migrated = es.migrate_sentinel(cur) + es.migrate_claims(cur)
+            counts = es.sync_state(cur)
+        counts["migrated"] = migrated
+        return counts
+
+    def claim(self, n: int, min_connections: int = 0, exclude: Sequence[int] = ()) -> List[Tuple[int, str]]:
+        """Reclama hasta n pendientes por prioridad. Devuelve [(profile_id, linkedin_url)]."""
+        with self.conn.cursor() as cur:
+            es.promote_due(cur)
+            rows = es.claim(cur, self.worker_id, n, self.lease_seconds, min_connections, exclude)
+        with self._lock:
+            self._held.update(pid for pid, _ in rows)
+        CLAIMS.inc(len(rows), outcome="claimed")
+        return rows
+
+    def claim_stale(self, n: int, min_age_days: float = es.REFRESH_MIN_AGE_DAYS,
+                    min_priority: Optional[float] = None, exclude: Sequence[int] = ()) -> List[Tuple[int, str]]:
+        """Reclama hasta n perfiles done más antiguos que min_age_days. Devuelve [(profile_id, linkedin_url)]."""
+        with self.conn.cursor() as cur:
+            rows = es.claim_stale(cur, self.worker_id, n, self.lease_seconds, min_age_days, min_priority, exclude)
+        with self._lock:
+            self._held.update(pid for pid, _ in rows)
+        CLAIMS.inc(len(rows), outcome="claimed_stale")
+        return rows
+
+    def reserve(self, kind: str, n: int, limit: int) -> int:
+        """Reserva hasta n unidades del presupuesto diario compartido. Devuelve las concedidas."""
+        with self.conn.cursor() as cur:
+            return es.reserve_budget(cur, kind, n, limit)
+
+    def refund(self, kind: str, n: int) -> None:
+        with self.conn.cursor() as cur:
+            es.refund_budget(cur, kind, n)
+
+    def _transition(self, outcome: str, pids: Iterable[int], fn, *args):
+        pids = list(pids)
+        if not pids:
+            return None
+        with self.conn.cursor() as cur:
+            out = fn(cur, self.worker_id, pids, *args)
+        with self._lock:
+            self._held.difference_update(pids)
+        CLAIMS.inc(len(pids), outcome=outcome)
+        return out
+
+    def complete(self, pids: Iterable[int]) -> None:
+        """Perfiles ingeridos → done."""
+        self._transition("done", pids, es.mark_done)
+
+    def forbid(self, pids: Iterable[int]) -> None:
+        """403 → inaccessible (se reintenta pasado EXTRACTION_403_RETRY_DAYS)."""
+        self._transition("inaccessible", pids, es.mark_inaccessible)
+
+    def release(self, pids: Iterable[int]) -> None:
+        """Devuelve perfiles a pending sin penalizar (p.ej. al cerrar el worker)."""
+        self._transition("released", pids, es.release)
+
+    def skip_known(self, pids: Iterable[int]) -> None:
+        """URL ya extraída por otra vía → done sin enviarla a Apify."""
+        self._transition("known", pids, es.mark_known)
+
+    def exclude(self, pids: Iterable[int], status: str) -> None:
+        """Lista de exclusión o URL repetida → excluded (solo vuelve a pending a mano)."""
+        self._transition("excluded", pids, es.mark_excluded, status)
+
+    def restore(self, pids: Iterable[int]) -> None:
+        """Refresh sin item → done otra vez, con su done_at antiguo."""
+        self._transition("restored", pids, es.restore_done)
+
+    def park(self, pids: Iterable[int], status: str, error: Optional[str] = None) -> None:
+        """Sin reintento automático: el item ya se pagó (p.ej. quedó en el dead-letter de la ingesta)."""
+        self._transition("parked", pids, es.mark_parked, status, error)
+
+    def fail(self, pids: Iterable[int], status: Optional[str], error: Optional[str] = None) -> int:
+        """Fallo transitorio: +1 intento y retry_after con backoff. Devuelve cuántos quedan aparcados."""
+        parked = self._transition("retry", pids, es.mark_retry, status, error,
+                                  self.max_attempts, es.RETRY_BACKOFF_BASE, es.RETRY_BACKOFF_MAX)
+        return parked or 0
+
+    def try_lock(self, name: str) -> bool:
+        """Lock consultivo de sesión (p.ej. para que solo un worker recalcule prioridades)."""
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f"{db_schema()}:{name}",))
+            return cur.fetchone()[0]
+
+    def unlock(self, name: str) -> None:
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (f"{db_schema()}:{name}",))
+
+
+def claims_summary(cur) -> Dict[str, Dict[str, int]]:
+    cur.execute(f"""
+        SELECT worker_id,
+               COUNT(*) FILTER (WHERE lease_until > now()),
+               COUNT(*) FILTER (WHERE lease_until <= now())
+        FROM {db_schema()}.extraction_state
+        WHERE state = 'claimed'
+        GROUP BY 1 ORDER BY 1
+    """)
+    return {w: {"vigentes": a, "vencidos": b} for w, a, b in cur.fetchall()}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Claims de extracción por worker.")
+    ap.add_argument("--expire", action="store_true", help="Devuelve a pending los claims con lease vencido")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        with conn.cursor() as cur:
+            es.ensure_state_schema(cur)
+            if args.expire:
+                print(f"🧹 {es.promote_due(cur)} perfiles vencidos vuelven a pending.")
+            summary = claims_summary(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    if not summary:
+        print("✅ Sin claims.")
+    for worker, c in summary.items():
+        print(f"👷 {worker}: vigentes={c['vigentes']} vencidos={c['vencidos']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+working_store.py — Almacén de trabajo tipado (Parquet) para los pipelines CSV.
+
+Los scripts de Slack/LLM/filtro leen y reescriben el CSV completo una y otra
+vez, y todo vuelve como object/float (`connectionsSlack` = 500.0). Aquí:
+- `DTYPES` fija los tipos de las columnas conocidas (Int64, boolean, category...)
+- `load_frame` / `save_frame` leen/escriben CSV o Parquet según la extensión,
+  con proyección de columnas al cargar y escritura atómica
+- `working_path` decide el formato del fichero de trabajo (WORKING_FORMAT=parquet|csv)
+- CSV solo en los bordes: `import_csv` / `export_csv`
+
+pyarrow es opcional: sin él todo sigue funcionando en CSV.
+
+Uso:
+  python working_store.py import data/prueba/linkedin_unificado_with_slack_counts_llm.csv
+  python working_store.py export data/prueba/linkedin_unificado_with_slack_counts_llm.parquet
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pandas as pd
+
+WORKING_FORMAT = os.getenv("WORKING_FORMAT", "csv").lower()   # csv | parquet
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+DTYPES = {
+    # linkedin_unificado*
+    "firstName": "string",
+    "lastName": "string",
+    "gender": "category",
+    "linkedinUrl": "string",
+    "salesNavigatorId": "string",
+    "country": "category",
+    # enriquecimiento Slack / LLM
+    "followersSlack": "Int64",
+    "connectionsSlack": "Int64",
+    "profesionLLM": "string",
+    "sectorLLM": "string",
+    "esTechLLM": "boolean",
+    "raw_headline": "string",
+    # filtros
+    "keep": "boolean",
+    "score": "Float64",
+    "incl_hits": "string",
+    "excl_hits": "string",
+    "notes": "string",
+    "descartado_regex": "boolean",
+    "llm_relevante": "boolean",
+    "relevante_final": "boolean",
+}
+
+_BOOL_STRINGS = {"true": True, "false": False, "1": True, "0": False}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Para usar Parquet instala pyarrow (pip install pyarrow) o usa WORKING_FORMAT=csv") from e
+
+
+def is_parquet(path: Path) -> bool:
+    return Path(path).suffix.lower() in (".parquet", ".pq")
+
+
+def working_path(csv_path: Path) -> Path:
+    """Ruta del fichero de trabajo para un CSV dado, según WORKING_FORMAT."""
+    csv_path = Path(csv_path)
+    return csv_path.with_suffix(".parquet") if WORKING_FORMAT == "parquet" else csv_path
+
+
+def apply_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    for col, dtype in DTYPES.items():
+        if col not in df.columns or str(df[col].dtype) == dtype:
+            continue
+        s = df[col]
+        if dtype == "Int64":
+            df[col] = pd.to_numeric(s, errors="coerce").round().astype("Int64")
+        elif dtype == "Float64":
+            df[col] = pd.to_numeric(s, errors="coerce").astype("Float64")
+        elif dtype == "boolean":
+            if s.dtype == object:
+                s = s.map(lambda v: _BOOL_STRINGS.get(str(v).strip().lower(), v) if isinstance(v, str) else v)
+            df[col] = s.astype("boolean")
+        else:
+            df[col] = s.astype(dtype)
+    return df
+
+
+def load_frame(path: Path, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Carga CSV o Parquet con tipos explícitos; `columns` limita lo que se lee."""
+    path = Path(path)
+    cols = list(columns) if columns is not None else None
+    if is_parquet(path):
+        _require_pyarrow()
+        df = pd.read_parquet(path, columns=cols, engine="pyarrow")
+    else:
+        # strings de entrada como string desde el parser (evita object + reconversión)
+        str_cols = {c: "string" for c, t in DTYPES.items() if t == "string"}
+        df = pd.read_csv(path, usecols=cols, dtype=str_cols, encoding="utf-8-sig")
+    return apply_dtypes(df)
+
+
+def save_frame(df: pd.DataFrame, path: Path) -> None:
+    """Escritura atómica (tmp + replace) en CSV o Parquet según la extensión."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", delete=False, dir=str(path.parent), suffix=".tmp") as tmp:
+        tmp_path = Path(tmp.name)
+    if is_parquet(path):
+        _require_pyarrow()
+        df.to_parquet(tmp_path, index=False, engine="pyarrow", compression=PARQUET_COMPRESSION)
+    else:
+        df.to_csv(tmp_path, index=False, encoding="utf-8-sig")
+    for _ in range(3):
+        try:
+            tmp_path.replace(path)
+            return
+        except PermissionError:
+            time.sleep(0.5)
+    tmp_path.replace(path)
+
+
+def import_csv(csv_path: Path, out_path: Optional[Path] = None) -> Path:
+    out_path = Path(out_path) if out_path else Path(csv_path).with_suffix(".parquet")
+    save_frame(load_frame(csv_path), out_path)
+    return out_path
+
+
+def export_csv(path: Path, csv_path: Optional[Path] = None) -> Path:
+    csv_path = Path(csv_path) if csv_path else Path(path).with_suffix(".csv")
+    save_frame(load_frame(path), csv_path)
+    return csv_path
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convierte ficheros de trabajo CSV ↔ Parquet.")
+    ap.add_argument("action", choices=["import", "export"])
+    ap.add_argument("src")
+    ap.add_argument("--out", help="Ruta de salida (por defecto, misma ruta con otra extensión)")
+    args = ap.parse_args()
+
+    if args.action == "import":
+        out = import_csv(Path(args.src), args.out)
+    else:
+        out = export_csv(Path(args.src), args.out)
+    print(f"✅ {args.src} → {out}")
+
+
+if __name__ == "__main__":
+    main()